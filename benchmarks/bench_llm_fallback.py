@@ -0,0 +1,90 @@
+"""Cost of the LLM extraction fallback: gated + batched vs. one call per invoice.
+
+Parses a synthetic batch where ``--poor`` of the documents have no usable
+labels, then refines it through ``LLMFallback`` backed by ``StubModel`` (a
+local stand-in with ``--latency`` seconds per prompt):
+
+- ``every invoice``: no confidence gate, one document per prompt
+- ``gated``: only low-confidence documents, one per prompt
+- ``gated+batched``: low-confidence documents, ``--batch-size`` per prompt,
+  ``--concurrency`` prompts at a time
+- ``re-run``: the same batch again (answered from the cache)
+
+Usage:
+    python benchmarks/bench_llm_fallback.py [--invoices 200] [--poor 0.2] [--latency 0.2]
+"""
+from __future__ import annotations
+
+import argparse
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from invoice_qc.extractor import RawInvoiceText, parse_raw_invoice_scored  # noqa: E402
+from invoice_qc.llm_extract import LLMFallback, StubModel  # noqa: E402
+
+
+def _texts(n_invoices: int, poor: float):
+    n_poor = int(n_invoices * poor)
+    texts = []
+    for i in range(n_invoices):
+        if i < n_poor:
+            # Scanned-looking document: no labels the regexes recognise
+            texts.append(f"ACME {i}\n{i:05d}\n12.03.2024\nwidgets 3 x 10\n119.00\n")
+        else:
+            texts.append(
+                f"Invoice Number: INV-{i}\nInvoice Date: 2024-03-12\n"
+                f"Seller: Seller {i % 50}\nBuyer: Buyer Co\nCurrency: EUR\n"
+                f"Subtotal: 100.00\nTax: 19.00\nGrand Total: 119.00\n"
+            )
+    return texts
+
+
+def _run(label: str, fallback: LLMFallback, model: StubModel, items) -> None:
+    calls, docs = model.calls, model.documents
+    start = time.perf_counter()
+    records = fallback.refine(items)
+    elapsed = time.perf_counter() - start
+    fixed = sum(1 for r in records if r.seller_name != "UNKNOWN_SELLER")
+    print(
+        f"{label:<16}{model.calls - calls:>9}{model.documents - docs:>11}"
+        f"{elapsed:>10.2f}{fixed:>9}/{len(records)}"
+    )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--invoices", type=int, default=200)
+    parser.add_argument("--poor", type=float, default=0.2, help="Share of unlabelled documents")
+    parser.add_argument("--latency", type=float, default=0.2, help="Stub seconds per prompt")
+    parser.add_argument("--batch-size", type=int, default=8)
+    parser.add_argument("--concurrency", type=int, default=2)
+    args = parser.parse_args()
+
+    items = []
+    for i, text in enumerate(_texts(args.invoices, args.poor)):
+        record, confidence = parse_raw_invoice_scored(RawInvoiceText(Path(f"{i}.pdf"), text))
+        items.append((text, record, confidence))
+
+    print(
+        f"{args.invoices} invoices, {args.poor:.0%} unlabelled, "
+        f"stub latency {args.latency}s per prompt"
+    )
+    print(f"{'':<16}{'prompts':>9}{'documents':>11}{'seconds':>10}{'fields ok':>13}")
+
+    model = StubModel(latency=args.latency)
+    _run("every invoice", LLMFallback(model, threshold=1.01, batch_size=1, max_concurrency=1), model, items)
+
+    model = StubModel(latency=args.latency)
+    _run("gated", LLMFallback(model, batch_size=1, max_concurrency=1), model, items)
+
+    model = StubModel(latency=args.latency)
+    batched = LLMFallback(model, batch_size=args.batch_size, max_concurrency=args.concurrency)
+    _run("gated+batched", batched, model, items)
+    _run("re-run", batched, model, items)
+
+
+if __name__ == "__main__":
+    main()
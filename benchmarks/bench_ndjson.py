@@ -0,0 +1,104 @@
+"""Memory and time of buffered vs. streaming bulk validation.
+
+- ``buffered``: what ``/validate-json`` does -- the whole body is parsed with
+  ``records_from_json``, validated with ``validate_invoices`` and serialized
+  as one response
+- ``streaming``: what ``/validate-ndjson`` does -- the NDJSON body is fed to
+  ``validate_ndjson_stream`` in 64 KiB pieces and the output is consumed as
+  it is produced
+
+Peak memory is measured with tracemalloc and excludes the request body
+itself (which a streaming client never holds in full either).
+
+Usage:
+    python benchmarks/bench_ndjson.py [--invoices 20000 100000]
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import sys
+import time
+import tracemalloc
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from pydantic_core import to_json  # noqa: E402
+
+from invoice_qc.bulk import validate_ndjson_stream  # noqa: E402
+from invoice_qc.records import records_from_json  # noqa: E402
+from invoice_qc.validator import validate_invoices  # noqa: E402
+
+PIECE = 1 << 16
+
+
+def _lines(n: int):
+    for i in range(n):
+        yield json.dumps(
+            {
+                "invoice_number": f"INV-{i:08d}",
+                "invoice_date": f"2024-{1 + i % 12:02d}-{1 + i % 28:02d}",
+                "seller_name": f"Seller {i % 5000}",
+                "buyer_name": f"Buyer {i % 700}",
+                "currency": "EUR",
+                "net_total": 100.0,
+                "tax_amount": 19.0,
+                "gross_total": 119.0 + i % 1000,
+                "line_items": [{"description": f"service {i % 90}", "line_total": 100.0}],
+            }
+        )
+
+
+def _buffered(body: bytes) -> int:
+    invoices = records_from_json(body)
+    results, summary = validate_invoices(invoices)
+    return len(to_json({"summary": summary, "results": results}))
+
+
+def _streaming(body: bytes) -> int:
+    async def pieces():
+        for start in range(0, len(body), PIECE):
+            yield body[start : start + PIECE]
+
+    async def run() -> int:
+        size = 0
+        async for data in validate_ndjson_stream(pieces()):
+            size += len(data)
+        return size
+
+    return asyncio.run(run())
+
+
+def _measure(fn, body: bytes):
+    tracemalloc.start()
+    start = time.perf_counter()
+    size = fn(body)
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return elapsed, peak, size
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--invoices", type=int, nargs="+", default=[20_000, 100_000])
+    args = parser.parse_args()
+
+    print(f"{'invoices':>10}{'mode':>11}{'seconds':>10}{'peak MiB':>10}{'output MiB':>12}")
+    for n in args.invoices:
+        lines = list(_lines(n))
+        array = ("[" + ",".join(lines) + "]").encode()
+        ndjson = ("\n".join(lines) + "\n").encode()
+        del lines
+        for label, fn, body in (("buffered", _buffered, array), ("streaming", _streaming, ndjson)):
+            elapsed, peak, size = _measure(fn, body)
+            print(
+                f"{n:>10,}{label:>11}{elapsed:>10.2f}"
+                f"{peak / 2**20:>10.1f}{size / 2**20:>12.1f}"
+            )
+
+
+if __name__ == "__main__":
+    main()
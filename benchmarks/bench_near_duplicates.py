@@ -0,0 +1,98 @@
+"""Scaling and accuracy of the MinHash/LSH near-duplicate check.
+
+Builds a synthetic batch of distinct invoices, including monthly recurring
+invoices (same seller, buyer, amount and lines; new number and date), and
+injects ``--dup-rate`` resubmissions: copies with OCR noise in the invoice
+number or a seller-name variant. Reports the time of
+``find_near_duplicates``, how many resubmissions were found (recall) and
+how many flagged invoices are not resubmissions or their originals.
+
+Usage:
+    python benchmarks/bench_near_duplicates.py [--invoices 100000 200000 400000]
+"""
+from __future__ import annotations
+
+import argparse
+import random
+import sys
+import time
+from dataclasses import replace
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from invoice_qc.near_duplicates import find_near_duplicates  # noqa: E402
+from invoice_qc.records import InvoiceRecord, LineItemRecord  # noqa: E402
+from invoice_qc.validator import invoice_key  # noqa: E402
+
+_OCR_NOISE = {"0": "O", "1": "l", "5": "S", "8": "B"}
+
+
+def _batch(n: int, dup_rate: float, rng: random.Random):
+    invoices = []
+    for i in range(n):
+        seller = f"Seller {i % 5000} Ltd"
+        if i % 3 == 0:
+            # Recurring: monthly per seller, same amount and lines every time
+            period = i // 5000
+            invoice_date = f"{2000 + period // 12}-{1 + period % 12:02d}-{1 + i % 5000 % 28:02d}"
+            net = 100.0 + i % 5000
+        else:
+            invoice_date = f"2024-{1 + i % 12:02d}-{1 + i % 28:02d}"
+            net = 100.0 + (i * 7919) % 1_000_003 / 100
+        invoices.append(
+            InvoiceRecord(
+                invoice_number=f"INV-{i:08d}",
+                invoice_date=invoice_date,
+                seller_name=seller,
+                buyer_name=f"Buyer {i % 700} GmbH",
+                currency="EUR",
+                net_total=net,
+                tax_amount=19.0,
+                gross_total=net + 19.0,
+                line_items=[LineItemRecord(f"service {i % 90} hours", 1.0, 100.0, 100.0)],
+            )
+        )
+
+    originals = rng.sample(range(n), int(n * dup_rate))
+    for i in originals:
+        inv = invoices[i]
+        if rng.random() < 0.5:
+            number = "".join(
+                _OCR_NOISE.get(ch, ch) if rng.random() < 0.3 else ch for ch in inv.invoice_number
+            )
+            if number == inv.invoice_number:
+                number = number.replace("0", "O", 1)
+            invoices.append(replace(inv, invoice_number=number))
+        else:
+            invoices.append(replace(inv, seller_name=inv.seller_name.upper().replace("LTD", "Limited")))
+    return invoices, set(originals)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--invoices", type=int, nargs="+", default=[100_000, 200_000, 400_000])
+    parser.add_argument("--dup-rate", type=float, default=0.01)
+    args = parser.parse_args()
+
+    rng = random.Random(7)
+    print(f"{'invoices':>10}{'seconds':>10}{'recall':>9}{'false flags':>13}")
+    for n in args.invoices:
+        invoices, originals = _batch(n, args.dup_rate, rng)
+        keys = [invoice_key(inv) for inv in invoices]
+        start = time.perf_counter()
+        matches = find_near_duplicates(invoices, keys)
+        elapsed = time.perf_counter() - start
+
+        injected = range(n, len(invoices))
+        found = sum(1 for i in injected if i in matches)
+        expected = originals | set(injected)
+        false_flags = sum(1 for i in matches if i not in expected)
+        print(
+            f"{len(invoices):>10,}{elapsed:>10.2f}"
+            f"{found / max(len(injected), 1):>9.1%}{false_flags:>13,}"
+        )
+
+
+if __name__ == "__main__":
+    main()
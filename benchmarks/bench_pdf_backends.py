@@ -0,0 +1,77 @@
+"""Parity and speed comparison of the PDF text backends.
+
+Runs every available backend over the sample PDFs and compares it with the
+pdfplumber reference:
+
+- ``text``: difflib similarity of the extracted text
+- ``fields``: share of ``parse_raw_invoice`` fields that come out identical
+
+Usage:
+    python benchmarks/bench_pdf_backends.py [--pdf-dir pdfs] [--repeat 5]
+"""
+from __future__ import annotations
+
+import argparse
+import difflib
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from invoice_qc.extractor import RawInvoiceText, parse_raw_invoice  # noqa: E402
+from invoice_qc.pdf_backends import BACKENDS, extract_pdf_pages  # noqa: E402
+
+
+def _fields(raw: RawInvoiceText) -> dict:
+    return parse_raw_invoice(raw).model_dump()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--pdf-dir", default="pdfs")
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    pdfs = sorted(Path(args.pdf_dir).glob("*.pdf"))
+    if not pdfs:
+        sys.exit(f"No PDFs found in {args.pdf_dir}")
+
+    names = [n for n, b in BACKENDS.items() if b.is_available()] + ["auto"]
+    reference = {}
+    for pdf in pdfs:
+        _, pages = extract_pdf_pages(pdf, "pdfplumber")
+        text = "\n".join(pages)
+        reference[pdf] = (text, _fields(RawInvoiceText(path=pdf, full_text=text)))
+
+    print(f"{len(pdfs)} PDFs, {args.repeat} repeats")
+    print(f"{'backend':<12}{'ms/doc':>10}{'speedup':>10}{'text':>8}{'fields':>8}")
+    baseline_ms = None
+    for name in names:
+        start = time.perf_counter()
+        for _ in range(args.repeat):
+            for pdf in pdfs:
+                extract_pdf_pages(pdf, name)
+        ms = (time.perf_counter() - start) * 1000 / (args.repeat * len(pdfs))
+        if baseline_ms is None:
+            baseline_ms = ms
+
+        text_ratio = 0.0
+        field_ratio = 0.0
+        for pdf in pdfs:
+            _, pages = extract_pdf_pages(pdf, name)
+            text = "\n".join(pages)
+            ref_text, ref_fields = reference[pdf]
+            text_ratio += difflib.SequenceMatcher(None, ref_text, text).ratio()
+            fields = _fields(RawInvoiceText(path=pdf, full_text=text))
+            same = sum(1 for k, v in ref_fields.items() if fields.get(k) == v)
+            field_ratio += same / len(ref_fields)
+
+        print(
+            f"{name:<12}{ms:>10.1f}{baseline_ms / ms:>9.1f}x"
+            f"{text_ratio / len(pdfs):>8.3f}{field_ratio / len(pdfs):>8.3f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,95 @@
+"""Memory and throughput of the compact records vs. pydantic models.
+
+Builds a synthetic batch, then compares for ``Invoice`` models and
+``InvoiceRecord`` dataclasses:
+
+- load: JSON bytes -> objects (``json.loads`` + one model per invoice vs. one
+  ``TypeAdapter.validate_json`` call)
+- memory: bytes allocated by the loaded batch (tracemalloc)
+- validate: ``validate_invoices`` over the loaded batch
+
+Usage:
+    python benchmarks/bench_records.py [--invoices 20000] [--items 10]
+"""
+from __future__ import annotations
+
+import argparse
+import gc
+import json
+import sys
+import time
+import tracemalloc
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from invoice_qc.models import Invoice  # noqa: E402
+from invoice_qc.records import records_from_json  # noqa: E402
+from invoice_qc.validator import validate_invoices  # noqa: E402
+
+
+def _payload(n_invoices: int, n_items: int) -> bytes:
+    invoices = []
+    for i in range(n_invoices):
+        items = [
+            {"description": f"Item {j}", "quantity": 2.0, "unit_price": 5.0, "line_total": 10.0}
+            for j in range(n_items)
+        ]
+        invoices.append(
+            {
+                "invoice_number": f"INV-{i}",
+                "invoice_date": "2024-03-01",
+                "due_date": "2024-04-01",
+                "seller_name": f"Seller {i % 100}",
+                "buyer_name": "Buyer",
+                "currency": "EUR",
+                "net_total": 10.0 * n_items,
+                "tax_amount": 1.9 * n_items,
+                "gross_total": 11.9 * n_items,
+                "line_items": items,
+            }
+        )
+    return json.dumps(invoices).encode()
+
+
+def _load_models(data: bytes):
+    return [Invoice(**obj) for obj in json.loads(data)]
+
+
+def _measure(label: str, loader, data: bytes) -> None:
+    gc.collect()
+    tracemalloc.start()
+    start = time.perf_counter()
+    batch = loader(data)
+    load_s = time.perf_counter() - start
+    current, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    start = time.perf_counter()
+    validate_invoices(batch)
+    validate_s = time.perf_counter() - start
+
+    print(
+        f"{label:<10}{load_s:>10.2f}{current / 2**20:>12.1f}"
+        f"{validate_s:>12.2f}{len(batch) / (load_s + validate_s):>14,.0f}"
+    )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--invoices", type=int, default=20000)
+    parser.add_argument("--items", type=int, default=10)
+    args = parser.parse_args()
+
+    data = _payload(args.invoices, args.items)
+    print(
+        f"{args.invoices} invoices x {args.items} line items "
+        f"({len(data) / 2**20:.1f} MiB JSON)"
+    )
+    print(f"{'':<10}{'load s':>10}{'memory MiB':>12}{'validate s':>12}{'invoices/s':>14}")
+    _measure("models", _load_models, data)
+    _measure("records", records_from_json, data)
+
+
+if __name__ == "__main__":
+    main()
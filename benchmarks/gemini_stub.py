@@ -0,0 +1,111 @@
+"""Local stand-in for the Gemini REST API, for load tests.
+
+Answers ``POST /v1beta/models/{model}:generateContent`` after a configurable
+delay, so the app can be load-tested without a key, quota or network:
+
+- JSON-mode prompts (the extraction fallback) are answered by
+  ``llm_extract.StubModel``, one object per document of the prompt
+- other prompts (chat) get a short fixed answer
+- ``--error-rate`` of the calls fail with 503, like an overloaded backend
+- ``GET /stats`` returns the number of calls and injected errors
+
+The delay is awaited, not slept, so concurrent calls overlap like they
+would against the real service.
+
+Point the app at it with ``GEMINI_API_ENDPOINT=http://127.0.0.1:<port>``
+(any non-empty ``GEMINI_API_KEY``). ``loadtest.py`` does this itself.
+
+Usage:
+    python benchmarks/gemini_stub.py [--port 8765] [--latency 0.8] [--jitter 0.2] [--error-rate 0]
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import random
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import uvicorn  # noqa: E402
+from starlette.applications import Starlette  # noqa: E402
+from starlette.requests import Request  # noqa: E402
+from starlette.responses import JSONResponse  # noqa: E402
+from starlette.routing import Route  # noqa: E402
+
+from invoice_qc.llm_extract import StubModel  # noqa: E402
+
+CHAT_ANSWER = "Stub answer: the invoices look consistent; no further issues found."
+
+
+def create_app(
+    latency: float = 0.8, jitter: float = 0.0, error_rate: float = 0.0, seed: int = 0
+) -> Starlette:
+    rng = random.Random(seed)
+    model = StubModel()
+    stats = {"calls": 0, "errors": 0}
+
+    async def generate_content(request: Request) -> JSONResponse:
+        body = await request.json()
+        stats["calls"] += 1
+        await asyncio.sleep(max(0.0, latency + rng.uniform(-jitter, jitter)))
+        if rng.random() < error_rate:
+            stats["errors"] += 1
+            return JSONResponse(
+                {"error": {"code": 503, "message": "stub overloaded", "status": "UNAVAILABLE"}},
+                status_code=503,
+            )
+
+        prompt = "".join(
+            part.get("text", "")
+            for content in body.get("contents", [])
+            for part in content.get("parts", [])
+        )
+        config = body.get("generationConfig") or body.get("generation_config") or {}
+        mime_type = config.get("responseMimeType") or config.get("response_mime_type")
+        text = model(prompt) if mime_type == "application/json" else CHAT_ANSWER
+        return JSONResponse(
+            {
+                "candidates": [
+                    {
+                        "content": {"parts": [{"text": text}], "role": "model"},
+                        "finishReason": "STOP",
+                        "index": 0,
+                    }
+                ],
+                "usageMetadata": {
+                    "promptTokenCount": len(prompt) // 4,
+                    "candidatesTokenCount": len(text) // 4,
+                    "totalTokenCount": (len(prompt) + len(text)) // 4,
+                },
+            }
+        )
+
+    async def get_stats(request: Request) -> JSONResponse:
+        return JSONResponse(stats)
+
+    return Starlette(
+        routes=[
+            Route("/v1beta/models/{model}:generateContent", generate_content, methods=["POST"]),
+            Route("/stats", get_stats),
+        ]
+    )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency", type=float, default=0.8, help="Seconds per call")
+    parser.add_argument("--jitter", type=float, default=0.0, help="+/- seconds, uniform")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fraction of calls failing with 503")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    app = create_app(args.latency, args.jitter, args.error_rate, args.seed)
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
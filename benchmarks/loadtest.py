@@ -0,0 +1,378 @@
+"""End-to-end load test of the API, for sizing deployments.
+
+Starts the Gemini stub (``gemini_stub.py``) and the app under uvicorn
+(``--workers`` processes) on free local ports, then replays a weighted mix
+of requests against them:
+
+- ``validate-json``: ``POST /validate-json`` with ``--invoices`` synthetic
+  invoices (a few invalid ones and duplicates included)
+- ``extract``: ``POST /extract-and-validate-pdfs`` with one of the sample
+  PDFs in ``pdfs/``
+- ``chat``: ``POST /chat-direct`` over a small invoice set. Some questions
+  are answered by the local query engine; the others go to the stub, which
+  answers after ``--gemini-latency`` seconds.
+
+Load is either closed-loop (``--concurrency`` clients sending back to back)
+or open-loop (``--rate`` requests per second with Poisson arrivals). In
+open-loop mode latency counts from the scheduled send time, so a server
+falling behind shows up in the percentiles instead of lowering the load.
+
+For every endpoint it prints requests, error rate, throughput of
+successful requests and p50/p95/p99/max latency of successful requests,
+plus the status codes of the failures. Extraction requests rejected by
+admission control (429/503) count as errors, and so do chat answers where
+the Gemini call failed (``gemini_failed``; the API still returns 200).
+Requests started during ``--warmup`` are not counted. ``--json`` also
+writes the numbers to a file.
+
+``--url`` tests a running deployment instead (nothing is started, Gemini is
+whatever that deployment uses).
+
+Usage:
+    python benchmarks/loadtest.py [--workers 2] [--concurrency 16] [--duration 30]
+        [--mix validate-json=6,extract=2,chat=2] [--rate 20] [--gemini-latency 0.8]
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import math
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from collections import Counter, defaultdict
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+import httpx
+
+ROOT = Path(__file__).resolve().parent.parent
+STUB = Path(__file__).resolve().parent / "gemini_stub.py"
+
+ENDPOINTS = {
+    "validate-json": "/validate-json",
+    "extract": "/extract-and-validate-pdfs",
+    "chat": "/chat-direct",
+}
+DEFAULT_MIX = "validate-json=6,extract=2,chat=2"
+
+CHAT_QUESTIONS = [
+    # Answered locally by the query engine
+    "How many invoices per seller?",
+    "What is the total amount by currency?",
+    # Sent to Gemini
+    "Which invoices look risky and why?",
+    "Summarize the invalid invoices for the finance team.",
+    "Welche Rechnungen sind auffällig?",
+]
+
+# (endpoint, scheduled start, latency in seconds, status)
+Sample = Tuple[str, float, float, str]
+
+
+# ---------------------------------------------------------
+# payloads
+# ---------------------------------------------------------
+def _invoice(i: int) -> Dict[str, Any]:
+    net = 100.0 + i % 900
+    return {
+        # Every 50th invoice repeats the previous number: a duplicate
+        "invoice_number": f"INV-{i - (i % 50 == 0):07d}",
+        "invoice_date": f"2024-{1 + i % 12:02d}-{1 + i % 28:02d}",
+        "seller_name": f"Seller {i % 40}",
+        "buyer_name": f"Buyer {i % 25}",
+        "currency": "EUR" if i % 7 else "INR",
+        "net_total": net,
+        "tax_amount": round(net * 0.19, 2),
+        # Every 20th invoice does not add up
+        "gross_total": round(net * 1.19, 2) + (5.0 if i % 20 == 0 else 0.0),
+        "line_items": [{"description": f"service {i % 90}", "line_total": net}],
+    }
+
+
+class Payloads:
+    def __init__(self, invoices_per_request: int, pdf_dir: Path, seed: int) -> None:
+        self.rng = random.Random(seed)
+        self.json_bodies = [
+            json.dumps([_invoice(start + i) for i in range(invoices_per_request)]).encode()
+            for start in range(0, 8 * invoices_per_request, invoices_per_request)
+        ]
+        self.pdfs = [(p.name, p.read_bytes()) for p in sorted(pdf_dir.glob("*.pdf"))]
+        if not self.pdfs:
+            raise SystemExit(f"No sample PDFs in {pdf_dir}")
+        invoices = [_invoice(i) for i in range(20)]
+        self.chat_context = {
+            "invoices": invoices,
+            "summary": {
+                "total_invoices": len(invoices),
+                "valid_invoices": 19,
+                "invalid_invoices": 1,
+                "error_counts": {"business_rule: totals_mismatch": 1},
+            },
+        }
+
+    def request(self, endpoint: str) -> Dict[str, Any]:
+        """httpx keyword arguments for one request to ``endpoint``."""
+        if endpoint == "validate-json":
+            return {
+                "content": self.rng.choice(self.json_bodies),
+                "headers": {"content-type": "application/json"},
+            }
+        if endpoint == "extract":
+            name, data = self.rng.choice(self.pdfs)
+            return {"files": [("files", (name, data, "application/pdf"))]}
+        return {"json": {**self.chat_context, "question": self.rng.choice(CHAT_QUESTIONS)}}
+
+
+# ---------------------------------------------------------
+# servers
+# ---------------------------------------------------------
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _start(cmd: List[str], env: Dict[str, str], log: Path) -> subprocess.Popen:
+    with log.open("wb") as fh:
+        return subprocess.Popen(cmd, cwd=ROOT, env=env, stdout=fh, stderr=subprocess.STDOUT)
+
+
+def _wait_ready(url: str, process: subprocess.Popen, log: Path, timeout: float = 120.0) -> None:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise SystemExit(f"{url} exited with {process.returncode}; see {log}:\n{log.read_text()[-2000:]}")
+        try:
+            if httpx.get(url, timeout=2.0).status_code == 200:
+                return
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.5)
+    raise SystemExit(f"{url} not ready after {timeout:.0f}s; see {log}")
+
+
+def _stop(process: subprocess.Popen) -> None:
+    if process.poll() is None:
+        process.terminate()
+        try:
+            process.wait(timeout=15)
+        except subprocess.TimeoutExpired:
+            process.kill()
+            process.wait()
+
+
+# ---------------------------------------------------------
+# load generation
+# ---------------------------------------------------------
+def _parse_mix(mix: str) -> Dict[str, float]:
+    weights: Dict[str, float] = {}
+    for item in mix.split(","):
+        name, _, weight = item.partition("=")
+        name = name.strip()
+        if name not in ENDPOINTS:
+            raise SystemExit(f"Unknown endpoint {name!r} in --mix; expected {', '.join(ENDPOINTS)}")
+        weights[name] = float(weight or 1)
+    return {k: v for k, v in weights.items() if v > 0}
+
+
+async def _send(
+    client: httpx.AsyncClient, endpoint: str, payloads: Payloads, scheduled: float
+) -> Sample:
+    try:
+        response = await client.post(ENDPOINTS[endpoint], **payloads.request(endpoint))
+        status = str(response.status_code)
+        if endpoint == "chat" and response.status_code == 200 and "source" not in response.json():
+            status = "gemini_failed"
+    except httpx.TimeoutException:
+        status = "timeout"
+    except httpx.HTTPError as e:
+        status = type(e).__name__
+    return endpoint, scheduled, time.perf_counter() - scheduled, status
+
+
+async def _run_load(args: argparse.Namespace, base_url: str, payloads: Payloads) -> List[Sample]:
+    weights = _parse_mix(args.mix)
+    names, cum = list(weights), list(weights.values())
+    rng = random.Random(args.seed)
+    limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+    samples: List[Sample] = []
+
+    async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=args.timeout) as client:
+        start = time.perf_counter()
+        end = start + args.warmup + args.duration
+
+        def pick() -> str:
+            return rng.choices(names, cum)[0]
+
+        if args.rate:
+            tasks = []
+            scheduled = start
+            while scheduled < end:
+                await asyncio.sleep(max(0.0, scheduled - time.perf_counter()))
+                tasks.append(asyncio.create_task(_send(client, pick(), payloads, scheduled)))
+                scheduled += rng.expovariate(args.rate)
+            samples = list(await asyncio.gather(*tasks))
+        else:
+
+            async def user() -> None:
+                while time.perf_counter() < end:
+                    samples.append(await _send(client, pick(), payloads, time.perf_counter()))
+
+            await asyncio.gather(*(user() for _ in range(args.concurrency)))
+
+    measured_from = start + args.warmup
+    return [s for s in samples if s[1] >= measured_from]
+
+
+def _percentile(values: List[float], p: float) -> float:
+    # Nearest rank; values are sorted
+    return values[max(0, math.ceil(p / 100 * len(values)) - 1)]
+
+
+def _summarize(samples: List[Sample], window: float) -> Dict[str, Dict[str, Any]]:
+    by_endpoint: Dict[str, List[Sample]] = defaultdict(list)
+    for sample in samples:
+        by_endpoint[sample[0]].append(sample)
+        by_endpoint["all"].append(sample)
+
+    stats: Dict[str, Dict[str, Any]] = {}
+    for endpoint, rows in by_endpoint.items():
+        ok = sorted(lat for _, _, lat, status in rows if status.startswith("2"))
+        statuses = Counter(status for _, _, _, status in rows)
+        entry: Dict[str, Any] = {
+            "requests": len(rows),
+            "errors": len(rows) - len(ok),
+            "error_rate": (len(rows) - len(ok)) / len(rows),
+            "throughput_rps": len(ok) / window if window > 0 else 0.0,
+            "statuses": dict(statuses),
+        }
+        for p in (50, 95, 99):
+            entry[f"p{p}_ms"] = _percentile(ok, p) * 1000 if ok else None
+        entry["max_ms"] = ok[-1] * 1000 if ok else None
+        stats[endpoint] = entry
+    return stats
+
+
+def _print_table(stats: Dict[str, Dict[str, Any]]) -> None:
+    if not stats:
+        print("No requests were started in the measured window (all clients were still waiting)")
+        return
+
+    def ms(value: Optional[float]) -> str:
+        return f"{value:.0f}" if value is not None else "-"
+
+    print(
+        f"{'endpoint':<15}{'requests':>9}{'errors':>8}{'err %':>7}{'req/s':>8}"
+        f"{'p50 ms':>8}{'p95 ms':>8}{'p99 ms':>8}{'max ms':>8}"
+    )
+    order = [e for e in ENDPOINTS if e in stats] + ["all"]
+    for endpoint in order:
+        s = stats.get(endpoint)
+        if s is None:
+            continue
+        print(
+            f"{endpoint:<15}{s['requests']:>9}{s['errors']:>8}{s['error_rate'] * 100:>7.1f}"
+            f"{s['throughput_rps']:>8.1f}{ms(s['p50_ms']):>8}{ms(s['p95_ms']):>8}"
+            f"{ms(s['p99_ms']):>8}{ms(s['max_ms']):>8}"
+        )
+    for endpoint in order:
+        failures = {k: v for k, v in stats.get(endpoint, {}).get("statuses", {}).items() if not k.startswith("2")}
+        if failures and endpoint != "all":
+            print(f"  {endpoint} failures: " + ", ".join(f"{k}: {v}" for k, v in sorted(failures.items())))
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--url", help="Test this running deployment instead of starting one")
+    parser.add_argument("--workers", type=int, default=2, help="uvicorn worker processes")
+    parser.add_argument("--concurrency", type=int, default=16, help="Clients (closed loop) / max connections")
+    parser.add_argument("--rate", type=float, default=None, help="Open loop: requests per second")
+    parser.add_argument("--duration", type=float, default=30.0, help="Measured seconds")
+    parser.add_argument("--warmup", type=float, default=5.0, help="Unmeasured seconds before that")
+    parser.add_argument("--mix", default=DEFAULT_MIX, help=f"Endpoint weights (default: {DEFAULT_MIX})")
+    parser.add_argument("--invoices", type=int, default=100, help="Invoices per /validate-json request")
+    parser.add_argument("--pdf-dir", default=str(ROOT / "pdfs"), help="PDFs uploaded by extract requests")
+    parser.add_argument("--timeout", type=float, default=60.0, help="Per-request timeout (seconds)")
+    parser.add_argument("--gemini-latency", type=float, default=0.8, help="Stub seconds per Gemini call")
+    parser.add_argument("--gemini-jitter", type=float, default=0.2)
+    parser.add_argument("--gemini-error-rate", type=float, default=0.0)
+    parser.add_argument(
+        "--llm-fallback", action="store_true", help="Also run the extraction LLM fallback (against the stub)"
+    )
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", help="Also write the results to this file")
+    args = parser.parse_args()
+
+    payloads = Payloads(args.invoices, Path(args.pdf_dir), args.seed)
+    processes: List[subprocess.Popen] = []
+    stub_url = None
+    logs = Path(tempfile.mkdtemp(prefix="invoice_qc_loadtest_"))
+    try:
+        if args.url:
+            base_url = args.url.rstrip("/")
+        else:
+            stub_port, app_port = _free_port(), _free_port()
+            stub_url = f"http://127.0.0.1:{stub_port}"
+            base_url = f"http://127.0.0.1:{app_port}"
+            env = {
+                **os.environ,
+                "PYTHONPATH": os.pathsep.join(filter(None, [str(ROOT), os.environ.get("PYTHONPATH")])),
+                "GEMINI_API_KEY": "loadtest-stub",
+                "GEMINI_API_ENDPOINT": stub_url,
+            }
+            env.setdefault("INVOICE_QC_RESULT_STORE", str(logs / "results.sqlite3"))
+            if args.llm_fallback:
+                env["INVOICE_QC_LLM_FALLBACK"] = "gemini"
+
+            stub_cmd = [
+                sys.executable, str(STUB), "--port", str(stub_port),
+                "--latency", str(args.gemini_latency), "--jitter", str(args.gemini_jitter),
+                "--error-rate", str(args.gemini_error_rate), "--seed", str(args.seed),
+            ]  # fmt: skip
+            app_cmd = [
+                sys.executable, "-m", "uvicorn", "main:app", "--host", "127.0.0.1",
+                "--port", str(app_port), "--workers", str(args.workers), "--log-level", "warning",
+            ]  # fmt: skip
+            stub_log, app_log = logs / "gemini_stub.log", logs / "app.log"
+            processes.append(_start(stub_cmd, env, stub_log))
+            _wait_ready(f"{stub_url}/stats", processes[0], stub_log)
+            processes.append(_start(app_cmd, env, app_log))
+            _wait_ready(f"{base_url}/health", processes[1], app_log)
+
+        mode = f"open loop, {args.rate:g} req/s" if args.rate else f"closed loop, {args.concurrency} clients"
+        print(
+            f"[LOADTEST] {base_url} ({mode}); mix {args.mix}; "
+            f"{args.warmup:g}s warmup + {args.duration:g}s measured"
+        )
+        samples = asyncio.run(_run_load(args, base_url, payloads))
+        # Throughput over the measured window the requests were started in
+        window = args.duration
+        stats = _summarize(samples, window)
+        _print_table(stats)
+
+        gemini = None
+        if stub_url is not None:
+            gemini = httpx.get(f"{stub_url}/stats", timeout=5.0).json()
+            print(f"[LOADTEST] Gemini stub calls: {gemini['calls']} ({gemini['errors']} injected errors)")
+        if not args.url:
+            print(f"[LOADTEST] server logs: {logs}")
+        if args.json:
+            Path(args.json).write_text(
+                json.dumps(
+                    {"config": vars(args), "window_seconds": window, "endpoints": stats, "gemini_stub": gemini},
+                    indent=2,
+                )
+            )
+    finally:
+        for process in reversed(processes):
+            _stop(process)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,10 +1,26 @@
 # invoice_qc/__init__.py
 __all__ = [
     "models",
+    "records",
     "lang_utils",
     "config_labels",
     "gemini_fallback",
+    "llm_extract",
+    "pdf_backends",
+    "isolation",
     "extractor",
+    "archives",
+    "manifest",
+    "near_duplicates",
     "validator",
+    "store",
+    "bulk",
+    "reports",
+    "sharding",
+    "query",
+    "chat",
+    "admission",
+    "profiling",
+    "watch",
     "cli",
 ]
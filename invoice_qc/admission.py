@@ -0,0 +1,228 @@
+"""Admission control and backpressure for the extraction endpoints.
+
+Extraction is CPU and memory heavy. Without a cap, a burst of large uploads
+is all processed concurrently and every request slows down together. The
+``AdmissionController`` sits in front of the extraction work:
+
+- at most ``max_docs`` documents and ``max_pages`` pages are in flight;
+  a single request larger than the caps is admitted on its own
+- waiting requests are queued per client and served round-robin, so one
+  client uploading hundreds of files cannot starve the others
+- a request is rejected up front, rather than queued, when
+  - the client already has ``max_queued_per_client`` requests waiting
+    (429), or
+  - the estimated queue wait is above ``latency_target`` seconds (503)
+  Both responses carry ``Retry-After``. Neither depends on the request's
+  size, so ``check()`` applies them before the upload is read.
+- clients are keyed by whatever the caller passes; the API uses the remote
+  address, never a client-supplied header, so a client cannot spread its
+  requests over several queues
+- ``snapshot()`` reports queue depth and the wait estimate, for
+  autoscaling
+
+The wait estimate uses an exponentially weighted average of seconds per
+document, measured on released work.
+
+The controller is meant to be used from a single asyncio event loop.
+"""
+from __future__ import annotations
+
+import asyncio
+import math
+import os
+import time
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Deque, Dict, Optional
+
+
+class AdmissionRejected(Exception):
+    def __init__(self, status_code: int, retry_after: int, reason: str) -> None:
+        super().__init__(reason)
+        self.status_code = status_code
+        self.retry_after = retry_after
+        self.reason = reason
+
+
+@dataclass
+class AdmissionTicket:
+    client: str
+    docs: int
+    pages: int
+    enqueued_at: float = field(default_factory=time.monotonic)
+    admitted_at: Optional[float] = None
+    future: Optional[asyncio.Future] = None
+
+
+class AdmissionController:
+    def __init__(
+        self,
+        max_docs: int,
+        max_pages: int,
+        latency_target: float,
+        max_queued_per_client: int,
+        initial_doc_seconds: float = 0.5,
+        smoothing: float = 0.2,
+    ) -> None:
+        self.max_docs = max_docs
+        self.max_pages = max_pages
+        self.latency_target = latency_target
+        self.max_queued_per_client = max_queued_per_client
+        self.doc_seconds = initial_doc_seconds
+        self.smoothing = smoothing
+
+        self.inflight_docs = 0
+        self.inflight_pages = 0
+        self.queued_docs = 0
+        self._queues: Dict[str, Deque[AdmissionTicket]] = {}
+        # Clients with waiting tickets, in round-robin order
+        self._round_robin: Deque[str] = deque()
+        self.rejected = {429: 0, 503: 0}
+
+    @classmethod
+    def from_env(cls) -> "AdmissionController":
+        return cls(
+            max_docs=int(os.getenv("INVOICE_QC_MAX_INFLIGHT_DOCS", str(os.cpu_count() or 2))),
+            max_pages=int(os.getenv("INVOICE_QC_MAX_INFLIGHT_PAGES", "200")),
+            latency_target=float(os.getenv("INVOICE_QC_QUEUE_LATENCY_TARGET", "30")),
+            max_queued_per_client=int(os.getenv("INVOICE_QC_MAX_QUEUED_PER_CLIENT", "4")),
+        )
+
+    # -----------------------------------------------------
+    # estimates
+    # -----------------------------------------------------
+    def estimated_wait(self) -> float:
+        """Seconds until work queued now would start, at the measured rate."""
+        backlog = self.inflight_docs + self.queued_docs
+        if self.inflight_docs < self.max_docs and not self.queued_docs:
+            return 0.0
+        return backlog * self.doc_seconds / self.max_docs
+
+    def snapshot(self) -> Dict:
+        return {
+            "inflight_docs": self.inflight_docs,
+            "inflight_pages": self.inflight_pages,
+            "queued_requests": sum(len(q) for q in self._queues.values()),
+            "queued_docs": self.queued_docs,
+            "clients_waiting": len(self._round_robin),
+            "avg_doc_seconds": round(self.doc_seconds, 3),
+            "estimated_wait_seconds": round(self.estimated_wait(), 3),
+            "rejected": dict(self.rejected),
+            "limits": {
+                "max_docs": self.max_docs,
+                "max_pages": self.max_pages,
+                "latency_target_seconds": self.latency_target,
+                "max_queued_per_client": self.max_queued_per_client,
+            },
+        }
+
+    # -----------------------------------------------------
+    # admission
+    # -----------------------------------------------------
+    def _fits(self, ticket: AdmissionTicket) -> bool:
+        if self.inflight_docs == 0:
+            return True  # oversized requests run alone instead of never
+        return (
+            self.inflight_docs + ticket.docs <= self.max_docs
+            and self.inflight_pages + ticket.pages <= self.max_pages
+        )
+
+    def _admit(self, ticket: AdmissionTicket) -> None:
+        self.inflight_docs += ticket.docs
+        self.inflight_pages += ticket.pages
+        ticket.admitted_at = time.monotonic()
+
+    def _reject(self, status_code: int, reason: str, retry_after: float) -> AdmissionRejected:
+        self.rejected[status_code] += 1
+        return AdmissionRejected(status_code, max(1, math.ceil(retry_after)), reason)
+
+    def check(self, client: str) -> None:
+        """Raise AdmissionRejected if a request from ``client`` would be
+        rejected now, whatever its size."""
+        queue = self._queues.get(client)
+        if queue is not None and len(queue) >= self.max_queued_per_client:
+            # Roughly when this client's oldest waiting request will start
+            queued = sum(t.docs for t in queue)
+            raise self._reject(
+                429,
+                "Too many queued requests for this client",
+                queued * self.doc_seconds,
+            )
+        wait = self.estimated_wait()
+        if wait > self.latency_target:
+            raise self._reject(
+                503,
+                "Extraction queue is over its latency target",
+                wait - self.latency_target,
+            )
+
+    async def acquire(self, client: str, docs: int, pages: int) -> AdmissionTicket:
+        """Wait for capacity; raises AdmissionRejected when over the limits."""
+        ticket = AdmissionTicket(client=client, docs=max(docs, 1), pages=max(pages, 1))
+
+        if not self._round_robin and self._fits(ticket):
+            self._admit(ticket)
+            return ticket
+
+        self.check(client)
+
+        queue = self._queues.get(client)
+        ticket.future = asyncio.get_running_loop().create_future()
+        if queue is None:
+            queue = self._queues[client] = deque()
+            self._round_robin.append(client)
+        queue.append(ticket)
+        self.queued_docs += ticket.docs
+
+        try:
+            await ticket.future
+        except asyncio.CancelledError:
+            # Client went away while waiting
+            if ticket.admitted_at is None:
+                self._remove_waiting(ticket)
+            else:
+                self.release(ticket)
+            raise
+        return ticket
+
+    def _remove_waiting(self, ticket: AdmissionTicket) -> None:
+        queue = self._queues.get(ticket.client)
+        if queue is None or ticket not in queue:
+            return
+        queue.remove(ticket)
+        self.queued_docs -= ticket.docs
+        if not queue:
+            del self._queues[ticket.client]
+            self._round_robin.remove(ticket.client)
+        self._dispatch()
+
+    def release(self, ticket: AdmissionTicket) -> None:
+        if ticket.admitted_at is None:
+            return
+        elapsed = time.monotonic() - ticket.admitted_at
+        ticket.admitted_at = None
+        self.inflight_docs -= ticket.docs
+        self.inflight_pages -= ticket.pages
+        per_doc = elapsed / ticket.docs
+        self.doc_seconds += self.smoothing * (per_doc - self.doc_seconds)
+        self._dispatch()
+
+    def _dispatch(self) -> None:
+        # Round-robin over clients; stop at the first head that does not fit
+        # so large requests are not starved by a stream of small ones.
+        while self._round_robin:
+            client = self._round_robin[0]
+            queue = self._queues[client]
+            ticket = queue[0]
+            if not self._fits(ticket):
+                return
+            queue.popleft()
+            self.queued_docs -= ticket.docs
+            self._round_robin.popleft()
+            if queue:
+                self._round_robin.append(client)
+            else:
+                del self._queues[client]
+            self._admit(ticket)
+            if not ticket.future.done():
+                ticket.future.set_result(None)
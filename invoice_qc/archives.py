@@ -0,0 +1,149 @@
+"""Streaming extraction of ZIP/TAR archives of invoices.
+
+Suppliers send monthly archives with thousands of PDFs. Instead of
+unpacking them to disk first, the members are read one at a time into
+memory and handed to the extractor as bytes:
+
+- ZIP members are read through the central directory; TAR archives
+  (plain, gzip, bzip2, xz) are read as a stream, so they never need to be
+  seekable
+- only ``.pdf``/``.jpg``/``.jpeg``/``.png`` members are extracted;
+  directories, hidden files, ``__MACOSX`` entries and members larger than
+  ``MAX_MEMBER_BYTES`` are skipped
+- members are extracted by the isolated worker pool (``isolation``). Only a
+  few members per worker are read ahead of it, so memory stays bounded
+  whatever the archive size.
+- results come back in archive order, with the member name (path inside
+  the archive) as ``file_name``
+
+``INVOICE_QC_ARCHIVE_MAX_MEMBER_BYTES`` caps the size of a member.
+"""
+from __future__ import annotations
+
+import os
+import tarfile
+import zipfile
+from pathlib import Path, PurePosixPath
+from typing import BinaryIO, Iterator, List, Optional, Tuple, Union
+
+from .extractor import IMAGE_SUFFIXES, apply_llm_fallback, extract_document
+from .isolation import Extracted, extract_documents
+from .llm_extract import get_fallback
+from .records import InvoiceRecord
+from .sharding import Shard, in_shard
+
+ARCHIVE_SUFFIXES = (".zip", ".tar", ".tar.gz", ".tgz", ".tar.bz2", ".tbz2", ".tar.xz", ".txz")
+PDF_SUFFIXES = (".pdf",)
+
+MAX_MEMBER_BYTES = int(os.getenv("INVOICE_QC_ARCHIVE_MAX_MEMBER_BYTES", str(64 * 2**20)))
+
+ArchiveSource = Union[str, Path, BinaryIO]
+
+
+def archive_suffix(name: str) -> Optional[str]:
+    """The archive suffix of ``name`` (``.tar.gz``, ``.zip``, ...), or None."""
+    lower = name.lower()
+    return next((s for s in ARCHIVE_SUFFIXES if lower.endswith(s)), None)
+
+
+def is_archive(name: str) -> bool:
+    return archive_suffix(name) is not None
+
+
+def _wanted(name: str, size: int, shard: Optional[Shard]) -> bool:
+    path = PurePosixPath(name)
+    if path.name.startswith(".") or "__MACOSX" in path.parts:
+        return False
+    if path.suffix.lower() not in PDF_SUFFIXES + IMAGE_SUFFIXES:
+        return False
+    return size <= MAX_MEMBER_BYTES and in_shard(path.name, shard)
+
+
+def iter_members(
+    archive: ArchiveSource, name: Optional[str] = None, shard: Optional[Shard] = None
+) -> Iterator[Tuple[str, bytes]]:
+    """
+    ``(member name, bytes)`` of every invoice document in ``archive``, one
+    at a time. ``name`` gives the archive type when ``archive`` is a file
+    object (default: the path).
+    """
+    name = name or str(getattr(archive, "name", archive))
+    if archive_suffix(name) == ".zip":
+        with zipfile.ZipFile(archive) as zf:
+            for info in zf.infolist():
+                if not info.is_dir() and _wanted(info.filename, info.file_size, shard):
+                    yield info.filename, zf.read(info)
+        return
+
+    if isinstance(archive, (str, Path)):
+        tf = tarfile.open(archive, mode="r|*")
+    else:
+        tf = tarfile.open(fileobj=archive, mode="r|*")
+    with tf:
+        for member in tf:
+            if member.isfile() and _wanted(member.name, member.size, shard):
+                f = tf.extractfile(member)
+                if f is not None:
+                    # "./a.pdf" (tar run inside the folder) -> "a.pdf"
+                    yield str(PurePosixPath(member.name)), f.read()
+
+
+def count_members(archive: Union[str, Path], shard: Optional[Shard] = None) -> int:
+    """Number of documents ``iter_members`` would yield, without reading them."""
+    if archive_suffix(str(archive)) == ".zip":
+        with zipfile.ZipFile(archive) as zf:
+            return sum(
+                1 for i in zf.infolist() if not i.is_dir() and _wanted(i.filename, i.file_size, shard)
+            )
+    with tarfile.open(archive, mode="r|*") as tf:
+        return sum(1 for m in tf if m.isfile() and _wanted(m.name, m.size, shard))
+
+
+def extract_member(
+    name: str, data: Union[Path, bytes], backend: Optional[str], line_items_mode: Optional[str]
+) -> Extracted:
+    """Extract one document (bytes or a file), recorded under ``name``."""
+    record, confidence, text = extract_document(
+        data, backend, line_items_mode, name=PurePosixPath(name).name
+    )
+    record.file_name = name
+    return record, confidence, text
+
+
+def iter_archive_records(
+    archive: ArchiveSource,
+    backend: Optional[str] = None,
+    line_items_mode: Optional[str] = None,
+    *,
+    name: Optional[str] = None,
+    shard: Optional[Shard] = None,
+    workers: Optional[int] = None,
+) -> Iterator[Extracted]:
+    """Extract every document of ``archive``, in archive order (see the module docstring)."""
+    documents = (
+        (member, (member, data, backend, line_items_mode))
+        for member, data in iter_members(archive, name, shard)
+    )
+    return extract_documents(extract_member, documents, workers=workers)
+
+
+def extract_records_from_archive(
+    archive: ArchiveSource,
+    backend: Optional[str] = None,
+    line_items_mode: Optional[str] = None,
+    shard: Optional[Shard] = None,
+    llm_fallback: Optional[str] = None,
+    workers: Optional[int] = None,
+) -> List[InvoiceRecord]:
+    """``extract_records_from_dir`` for an archive instead of a directory."""
+    fallback = get_fallback(llm_fallback)
+    records: List[InvoiceRecord] = []
+    pending = []
+    for record, confidence, text in iter_archive_records(
+        archive, backend, line_items_mode, shard=shard, workers=workers
+    ):
+        if fallback is not None and fallback.needs_llm(confidence):
+            pending.append((len(records), text, record, confidence))
+        records.append(record)
+    apply_llm_fallback(records, pending, fallback)
+    return records
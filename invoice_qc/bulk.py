@@ -0,0 +1,264 @@
+"""Streaming bulk validation of NDJSON uploads.
+
+``/validate-json`` buffers the whole body, builds every invoice, validates
+the batch and returns one response, so memory grows with the upload.
+``validate_ndjson_stream`` takes the body as an async stream of bytes with
+one invoice object per line instead:
+
+- lines are grouped into chunks of ``CHUNK_LINES`` as they arrive and each
+  chunk is parsed in one TypeAdapter pass (line by line only if the chunk
+  has a bad line)
+- each chunk goes through a ``StreamingValidator`` and is dropped; only one
+  hash per distinct duplicate key is kept across the stream, up to the
+  validator's duplicate detection window
+- the output is NDJSON as well, one line per input line::
+
+    {"line": 3, "invoice_id": "...", "is_valid": false, "errors": [...], "possible_duplicates": []}
+    {"line": 4, "detail": [...]}                      # not a valid invoice
+    {"line": 1, "invoice_id": "...", "is_valid": false, "errors_added": ["anomaly: duplicate_invoice_key"]}
+    {"summary": {...}, "rejected_lines": 1, "batch_id": "..."}  # always last
+
+  the ``errors_added`` form updates an earlier invoice that a later one
+  turned out to duplicate.
+
+Many clients only read the response once they have sent the whole body.
+If the output were written straight to the socket, the server would stop
+reading the body when the socket buffers fill, and both sides would wait on
+each other. The results are therefore written to a spool (in memory up to
+``SPOOL_BYTES``, then a temporary file) by a separate task, and the
+response is read from the spool. The spool only holds output the client
+has not read yet: it is emptied whenever the reader catches up. Unread
+output is capped at ``MAX_SPOOL_BYTES`` (``INVOICE_QC_NDJSON_MAX_SPOOL_MB``,
+default 1024). Past that, the body is no longer read, and the response ends
+with an ``{"error": ...}`` line instead of the summary. A client that only
+reads once it has sent everything can therefore upload roughly that much
+output's worth of invoices (about 150 bytes per result line).
+
+With a ``ResultStore``, every chunk is also saved there as it is validated
+(positions are the input line numbers).
+"""
+from __future__ import annotations
+
+import asyncio
+import os
+import tempfile
+from typing import AsyncIterable, AsyncIterator, List, Optional, Sequence, Tuple
+
+from pydantic import ValidationError
+from pydantic_core import to_json
+from starlette.concurrency import run_in_threadpool
+
+from .records import INVOICE_RECORD, InvoiceRecord, records_from_json
+from .store import ResultStore
+from .validator import DUPLICATE_KEY_ERROR, StreamingValidator
+
+CHUNK_LINES = int(os.getenv("INVOICE_QC_NDJSON_CHUNK_LINES", "2000"))
+MAX_LINE_BYTES = int(os.getenv("INVOICE_QC_NDJSON_MAX_LINE_BYTES", str(1 << 20)))
+SPOOL_BYTES = 1 << 20
+MAX_SPOOL_BYTES = int(os.getenv("INVOICE_QC_NDJSON_MAX_SPOOL_MB", "1024")) * 2**20
+# Largest piece of the spool handed to the response at once
+READ_BYTES = 1 << 16
+
+Line = Tuple[int, Optional[bytes]]
+
+
+async def iter_line_chunks(
+    stream: AsyncIterable[bytes],
+    chunk_lines: int = CHUNK_LINES,
+    max_line_bytes: int = MAX_LINE_BYTES,
+) -> AsyncIterator[List[Line]]:
+    """
+    Non-blank lines of ``stream`` as lists of ``(line number, bytes)``.
+    Lines longer than ``max_line_bytes`` come through as ``(number, None)``
+    and the rest of them is skipped without buffering.
+    """
+    pending = b""
+    line_no = 0
+    skipping = False
+    batch: List[Line] = []
+    async for data in stream:
+        parts = (pending + data).split(b"\n")
+        pending = parts.pop()
+        for part in parts:
+            if skipping:
+                # Tail of an oversized line, already counted
+                skipping = False
+                continue
+            line_no += 1
+            line = part.strip()
+            if line:
+                batch.append((line_no, line if len(line) <= max_line_bytes else None))
+                if len(batch) >= chunk_lines:
+                    yield batch
+                    batch = []
+        if len(pending) > max_line_bytes:
+            if not skipping:
+                line_no += 1
+                batch.append((line_no, None))
+                skipping = True
+            pending = b""
+    if pending.strip() and not skipping:
+        line = pending.strip()
+        batch.append((line_no + 1, line if len(line) <= max_line_bytes else None))
+    if batch:
+        yield batch
+
+
+def _parse_lines(lines: Sequence[Line]) -> Tuple[List[InvoiceRecord], List[int], List[bytes]]:
+    """Invoices with their line numbers, plus NDJSON rows for rejected lines."""
+    if all(data is not None for _, data in lines):
+        try:
+            invoices = records_from_json(b"[" + b",".join(data for _, data in lines) + b"]")
+        except ValidationError:
+            pass
+        else:
+            # A line holding "{...},{...}" parses as two invoices; recheck those
+            if len(invoices) == len(lines):
+                return invoices, [n for n, _ in lines], []
+
+    invoices: List[InvoiceRecord] = []
+    numbers: List[int] = []
+    rejected: List[bytes] = []
+    for n, data in lines:
+        if data is None:
+            detail = [{"type": "too_long", "loc": [], "msg": f"Line exceeds {MAX_LINE_BYTES} bytes"}]
+        else:
+            try:
+                invoices.append(INVOICE_RECORD.validate_json(data))
+                numbers.append(n)
+                continue
+            except ValidationError as e:
+                detail = e.errors(include_url=False, include_context=False, include_input=False)
+        rejected.append(to_json({"line": n, "detail": detail}))
+    return invoices, numbers, rejected
+
+
+class NDJSONValidation:
+    """Parses and validates chunks of lines; the state of one upload."""
+
+    def __init__(self, store: Optional[ResultStore] = None) -> None:
+        self.validator = StreamingValidator()
+        self.rejected_lines = 0
+        self.store = store
+        self.batch_id = store.create_batch("validate-ndjson") if store is not None else None
+
+    def chunk(self, lines: Sequence[Line]) -> bytes:
+        invoices, numbers, rejected = _parse_lines(lines)
+        self.rejected_lines += len(rejected)
+        results, flagged = self.validator.validate_chunk(invoices, numbers)
+        if self.store is not None:
+            self.store.add_invoices(self.batch_id, invoices, [r for _, r in results], numbers)
+            if flagged:
+                self.store.add_errors(
+                    self.batch_id, [(line, DUPLICATE_KEY_ERROR) for line, _ in flagged]
+                )
+        rows = rejected
+        for line, result in results:
+            rows.append(
+                to_json(
+                    {
+                        "line": line,
+                        "invoice_id": result.invoice_id,
+                        "is_valid": result.is_valid,
+                        "errors": result.errors,
+                        "possible_duplicates": result.possible_duplicates,
+                    }
+                )
+            )
+        for line, invoice_id in flagged:
+            rows.append(
+                to_json(
+                    {
+                        "line": line,
+                        "invoice_id": invoice_id,
+                        "is_valid": False,
+                        "errors_added": [DUPLICATE_KEY_ERROR],
+                    }
+                )
+            )
+        return b"\n".join(rows) + b"\n" if rows else b""
+
+    def summary(self) -> bytes:
+        summary = self.validator.summary()
+        if self.store is not None:
+            self.store.finish_batch(self.batch_id, summary)
+        return (
+            to_json(
+                {
+                    "summary": summary,
+                    "rejected_lines": self.rejected_lines,
+                    "batch_id": self.batch_id,
+                }
+            )
+            + b"\n"
+        )
+
+
+async def validate_ndjson_stream(
+    body: AsyncIterable[bytes],
+    chunk_lines: int = CHUNK_LINES,
+    store: Optional[ResultStore] = None,
+    max_spool_bytes: int = MAX_SPOOL_BYTES,
+) -> AsyncIterator[bytes]:
+    """NDJSON results for an NDJSON body of invoices (see the module docstring)."""
+    spool = tempfile.SpooledTemporaryFile(max_size=SPOOL_BYTES)
+    # Spool offsets; both go back to 0 whenever the reader catches up
+    written = read = 0
+    ready = asyncio.Event()
+    done = False
+
+    def append(data: bytes) -> None:
+        nonlocal written
+        spool.seek(written)
+        spool.write(data)
+        written += len(data)
+        ready.set()
+
+    async def produce() -> None:
+        nonlocal done
+        try:
+            # Store writes block too, so they also stay off the event loop
+            validation = await run_in_threadpool(NDJSONValidation, store)
+            async for lines in iter_line_chunks(body, chunk_lines):
+                # Parsing and validation are CPU-bound: keep the event loop free
+                append(await run_in_threadpool(validation.chunk, lines))
+                if written - read > max_spool_bytes:
+                    append(
+                        to_json(
+                            {
+                                "error": "unread output over the spool limit; read the "
+                                "response while uploading or split the upload",
+                                "batch_id": validation.batch_id,
+                            }
+                        )
+                        + b"\n"
+                    )
+                    return
+            append(await run_in_threadpool(validation.summary))
+        finally:
+            done = True
+            ready.set()
+
+    task = asyncio.create_task(produce())
+    try:
+        while True:
+            if read < written:
+                spool.seek(read)
+                data = spool.read(min(written - read, READ_BYTES))
+                read += len(data)
+                if read == written:
+                    # Caught up: drop what has been sent (frees the temp file)
+                    spool.seek(0)
+                    spool.truncate()
+                    read = written = 0
+                yield data
+                continue
+            if done:
+                break
+            await ready.wait()
+            ready.clear()
+        # Re-raise a failure of the body stream (e.g. client disconnect)
+        await task
+    finally:
+        task.cancel()
+        spool.close()
@@ -0,0 +1,172 @@
+"""Server-side chat sessions over a fixed invoice set.
+
+``/chat-direct`` takes the invoices and summary with every question, so a
+multi-turn chat re-uploads and re-serializes the same data each time. A
+``ChatSession`` is created once per invoice set instead and keeps
+everything that depends only on that set:
+
+- the prompt prefix (instructions + invoice/summary JSON), built once
+- the ``InvoiceQueryEngine`` used for local aggregate answers
+- the recent question/answer history, added to follow-up prompts
+
+``ChatSessionStore`` keeps sessions in memory. A session expires ``ttl``
+seconds after its last use. The store is bounded both by ``max_sessions``
+and by ``max_bytes``, the total size of the sessions' serialized invoice
+sets (the parsed copy held by the query engine is of the same order); the
+least recently used sessions are evicted until a new one fits. A single
+invoice set larger than ``max_bytes`` is refused with
+``ChatSessionTooLarge``. The store is per process, so with several workers
+a client must stick to one worker, or recreate the session when it gets a
+404.
+"""
+from __future__ import annotations
+
+import json
+import os
+import secrets
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Any, List, Mapping, Optional, Sequence, Tuple
+
+from .query import InvoiceQueryEngine
+
+SESSION_TTL = float(os.getenv("INVOICE_QC_CHAT_SESSION_TTL", "1800"))
+MAX_SESSIONS = int(os.getenv("INVOICE_QC_MAX_CHAT_SESSIONS", "256"))
+MAX_BYTES = int(os.getenv("INVOICE_QC_CHAT_SESSIONS_MAX_MB", "512")) * 1024 * 1024
+
+# Question/answer pairs repeated in follow-up prompts
+MAX_HISTORY_TURNS = 3
+
+
+def build_prompt_prefix(invoices: Sequence[Any], summary: Mapping[str, Any]) -> str:
+    """Everything in the chat prompt that does not depend on the question."""
+    return f"""
+You are a multilingual invoice assistant.
+
+You must answer ONLY using the invoice data provided.
+If the answer is not present in the invoices, reply:
+"Information not found in the invoices."
+
+Always respond in the SAME LANGUAGE as the user's question.
+
+--- INVOICES (JSON) ---
+{json.dumps(invoices, indent=2, ensure_ascii=False)}
+
+--- SUMMARY (JSON) ---
+{json.dumps(summary, indent=2, ensure_ascii=False)}
+"""
+
+
+def build_prompt(prefix: str, question: str, history: Sequence[Tuple[str, str]] = ()) -> str:
+    parts = [prefix]
+    if history:
+        parts.append("--- EARLIER IN THIS CONVERSATION ---")
+        for q, a in history:
+            parts.append(f"User: {q}\nAssistant: {a}\n")
+    parts.append(f"--- USER QUESTION ---\n{question}\n")
+    return "\n".join(parts)
+
+
+class ChatSessionTooLarge(ValueError):
+    pass
+
+
+@dataclass
+class ChatSession:
+    session_id: str
+    invoice_count: int
+    prefix: str
+    engine: InvoiceQueryEngine
+    # Bytes charged against the store's budget
+    size: int
+    history: List[Tuple[str, str]] = field(default_factory=list)
+    last_used: float = field(default_factory=time.monotonic)
+
+    def prompt(self, question: str) -> str:
+        return build_prompt(self.prefix, question, self.history[-MAX_HISTORY_TURNS:])
+
+    def record(self, question: str, answer: str) -> None:
+        self.history.append((question, answer))
+        del self.history[:-MAX_HISTORY_TURNS]
+
+
+class ChatSessionStore:
+    def __init__(
+        self,
+        ttl: float = SESSION_TTL,
+        max_sessions: int = MAX_SESSIONS,
+        max_bytes: int = MAX_BYTES,
+    ) -> None:
+        self.ttl = ttl
+        self.max_sessions = max_sessions
+        self.max_bytes = max_bytes
+        # Least recently used first
+        self._sessions: "OrderedDict[str, ChatSession]" = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._sessions)
+
+    @property
+    def total_bytes(self) -> int:
+        return self._bytes
+
+    def _pop_oldest(self) -> None:
+        _, session = self._sessions.popitem(last=False)
+        self._bytes -= session.size
+
+    def _evict_expired(self, now: float) -> None:
+        while self._sessions:
+            session = next(iter(self._sessions.values()))
+            if now - session.last_used < self.ttl:
+                break
+            self._pop_oldest()
+
+    def create(self, invoices: Sequence[Any], summary: Mapping[str, Any]) -> ChatSession:
+        # Built outside the lock: serializing a large batch takes a while
+        prefix = build_prompt_prefix(invoices, summary)
+        size = len(prefix.encode("utf-8"))
+        if size > self.max_bytes:
+            raise ChatSessionTooLarge(
+                f"Invoice set is {size} bytes; chat sessions are limited to {self.max_bytes}"
+            )
+        session = ChatSession(
+            session_id=secrets.token_urlsafe(16),
+            invoice_count=len(invoices),
+            prefix=prefix,
+            engine=InvoiceQueryEngine(invoices, summary),
+            size=size,
+        )
+        with self._lock:
+            self._evict_expired(session.last_used)
+            while self._sessions and (
+                len(self._sessions) >= self.max_sessions
+                or self._bytes + size > self.max_bytes
+            ):
+                self._pop_oldest()
+            self._sessions[session.session_id] = session
+            self._bytes += size
+        return session
+
+    def get(self, session_id: str) -> Optional[ChatSession]:
+        """The live session (its TTL is refreshed), or None if unknown/expired."""
+        now = time.monotonic()
+        with self._lock:
+            self._evict_expired(now)
+            session = self._sessions.get(session_id)
+            if session is None:
+                return None
+            session.last_used = now
+            self._sessions.move_to_end(session_id)
+            return session
+
+    def delete(self, session_id: str) -> bool:
+        with self._lock:
+            session = self._sessions.pop(session_id, None)
+            if session is None:
+                return False
+            self._bytes -= session.size
+            return True
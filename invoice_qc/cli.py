@@ -2,39 +2,61 @@
 from __future__ import annotations
 
 import argparse
-import json
+import signal
 import sys
-from pathlib import Path
 from typing import List
 
-from .extractor import extract_invoices_from_dir, export_invoices_to_json
-from .models import Invoice
-from .validator import validate_invoices
+from .archives import extract_records_from_archive
+from .extractor import extract_records_from_dir
+from .manifest import extract_records_incremental
+from .watch import FolderWatcher
+from .llm_extract import FALLBACK_MODES
+from .pdf_backends import BACKENDS
+from .profiling import profiled
+from .records import InvoiceRecord
+from .reports import REPORT_FORMATS, read_invoices, read_report, write_invoices, write_report
+from .sharding import merge_reports, parse_shard
+from .validator import invoice_key, validate_invoices
+
+
+def _extract(args: argparse.Namespace) -> List[InvoiceRecord]:
+    if args.archive:
+        return extract_records_from_archive(
+            args.archive,
+            args.pdf_backend,
+            args.line_items,
+            args.shard,
+            args.llm_fallback,
+            args.workers,
+        )
+    return extract_records_from_dir(
+        args.pdf_dir,
+        args.pdf_backend,
+        args.line_items,
+        args.shard,
+        args.llm_fallback,
+        args.workers,
+    )
 
 
 def cmd_extract(args: argparse.Namespace) -> int:
-    invoices = extract_invoices_from_dir(args.pdf_dir)
-    export_invoices_to_json(invoices, args.output)
+    invoices = _extract(args)
+    write_invoices(args.output, invoices, args.format)
     print(f"Extracted {len(invoices)} invoices to {args.output}")
     return 0
 
 
-def _load_invoices_from_json(path: str) -> List[Invoice]:
-    data = json.loads(Path(path).read_text(encoding="utf-8"))
-    return [Invoice(**obj) for obj in data]
+def _load_invoices_from_json(path: str) -> List[InvoiceRecord]:
+    # Any format written by `extract`; JSON is bulk-validated straight from bytes
+    return read_invoices(path)
 
 
 def cmd_validate(args: argparse.Namespace) -> int:
     invoices = _load_invoices_from_json(args.input)
     results, summary = validate_invoices(invoices)
 
-    report = {
-        "summary": summary.model_dump(),
-        "results": [r.model_dump() for r in results],
-    }
-    Path(args.report).write_text(
-        json.dumps(report, indent=2, default=str), encoding="utf-8"
-    )
+    keys = [invoice_key(inv) for inv in invoices]
+    write_report(args.report, summary, results, args.format, keys)
 
     print(f"Total invoices: {summary.total_invoices}")
     print(f"Valid invoices: {summary.valid_invoices}")
@@ -50,16 +72,29 @@ def cmd_validate(args: argparse.Namespace) -> int:
 
 
 def cmd_full_run(args: argparse.Namespace) -> int:
-    invoices = extract_invoices_from_dir(args.pdf_dir)
+    if args.incremental and args.archive:
+        print("--incremental works on --pdf-dir only", file=sys.stderr)
+        return 2
+    if args.incremental:
+        invoices, stats = extract_records_incremental(
+            args.pdf_dir,
+            args.manifest,
+            args.pdf_backend,
+            args.line_items,
+            args.shard,
+            args.llm_fallback,
+            args.workers,
+        )
+        print(
+            f"[INCREMENTAL] New: {stats.added}, Changed: {stats.changed}, "
+            f"Unchanged: {stats.unchanged}, Removed: {stats.removed}, Failed: {stats.failed}"
+        )
+    else:
+        invoices = _extract(args)
     results, summary = validate_invoices(invoices)
 
-    report = {
-        "summary": summary.model_dump(),
-        "results": [r.model_dump() for r in results],
-    }
-    Path(args.report).write_text(
-        json.dumps(report, indent=2, default=str), encoding="utf-8"
-    )
+    keys = [invoice_key(inv) for inv in invoices]
+    write_report(args.report, summary, results, args.format, keys)
 
     print(
         f"[FULL RUN] Total: {summary.total_invoices}, "
@@ -75,27 +110,252 @@ def cmd_full_run(args: argparse.Namespace) -> int:
     return 0 if summary.invalid_invoices == 0 else 1
 
 
+def cmd_merge_reports(args: argparse.Namespace) -> int:
+    reports = [read_report(path) for path in args.inputs]
+    summary, results, keys = merge_reports(reports)
+
+    write_report(args.report, summary, results, args.format, keys)
+
+    print(
+        f"[MERGED {len(reports)} REPORTS] Total: {summary.total_invoices}, "
+        f"Valid: {summary.valid_invoices}, Invalid: {summary.invalid_invoices}"
+    )
+    if summary.error_counts:
+        print("Top errors:")
+        for err, count in sorted(
+            summary.error_counts.items(), key=lambda kv: -kv[1]
+        )[:5]:
+            print(f"  {err}: {count}")
+
+    return 0 if summary.invalid_invoices == 0 else 1
+
+
+def _add_profile_arg(p: argparse.ArgumentParser) -> None:
+    p.add_argument(
+        "--profile",
+        nargs="?",
+        const="invoice-qc.prof",
+        default=None,
+        metavar="FILE",
+        help="Profile this run: save cProfile stats to FILE (default invoice-qc.prof) "
+        "and print a per-stage timing breakdown to stderr",
+    )
+
+
+def _run_profiled(args: argparse.Namespace) -> int:
+    with profiled() as session:
+        exit_code = args.func(args)
+    path = session.save(args.profile)
+    print(session.format_text(), file=sys.stderr)
+    if path is not None:
+        print(f"[PROFILE] cProfile stats written to {path}", file=sys.stderr)
+    return exit_code
+
+
+def _add_llm_fallback_arg(p: argparse.ArgumentParser) -> None:
+    p.add_argument(
+        "--llm-fallback",
+        choices=FALLBACK_MODES,
+        default=None,
+        help="Re-extract low-confidence invoices with an LLM, in batches "
+        "(default: $INVOICE_QC_LLM_FALLBACK or off)",
+    )
+
+
+def _add_source_args(p: argparse.ArgumentParser) -> None:
+    source = p.add_mutually_exclusive_group(required=True)
+    source.add_argument("--pdf-dir", help="Directory containing PDF files")
+    source.add_argument(
+        "--archive",
+        help="ZIP/TAR archive of PDFs/images, extracted member by member without unpacking",
+    )
+    p.add_argument(
+        "--workers",
+        type=int,
+        default=None,
+        help="Isolated extraction worker processes (default: $INVOICE_QC_EXTRACTION_WORKERS)",
+    )
+
+
+def _shard_arg(value: str):
+    try:
+        return parse_shard(value)
+    except ValueError as e:
+        raise argparse.ArgumentTypeError(str(e))
+
+
+def cmd_watch(args: argparse.Namespace) -> int:
+    watcher = FolderWatcher(
+        args.dir,
+        args.report,
+        workers=args.workers,
+        batch_size=args.batch_size,
+        batch_window=args.batch_window,
+        poll_interval=args.poll_interval,
+        settle=args.settle,
+        use_inotify=not args.polling,
+        process_existing=args.process_existing,
+        manifest_path=args.manifest,
+        retries=args.retries,
+        backend=args.pdf_backend,
+        line_items_mode=args.line_items,
+        llm_fallback=args.llm_fallback,
+    )
+
+    def _shutdown(signum, frame) -> None:
+        print("[WATCH] shutting down, draining in-flight work...")
+        watcher.stop()
+
+    signal.signal(signal.SIGINT, _shutdown)
+    signal.signal(signal.SIGTERM, _shutdown)
+    watcher.run()
+    return 0
+
+
 def main() -> None:
     parser = argparse.ArgumentParser(prog="invoice-qc")
     sub = parser.add_subparsers(dest="command", required=True)
 
     p_extract = sub.add_parser("extract", help="Extract invoices from PDFs")
-    p_extract.add_argument("--pdf-dir", required=True, help="Directory containing PDF files")
-    p_extract.add_argument("--output", required=True, help="Output JSON file")
+    _add_source_args(p_extract)
+    p_extract.add_argument("--output", required=True, help="Output file (JSON by default)")
+    p_extract.add_argument(
+        "--pdf-backend",
+        choices=["auto", *BACKENDS],
+        default=None,
+        help="PDF text backend (default: $INVOICE_QC_PDF_BACKEND or auto)",
+    )
+    p_extract.add_argument(
+        "--line-items",
+        choices=["text", "table"],
+        default=None,
+        help="Line-item extraction mode (default: $INVOICE_QC_LINE_ITEMS_MODE or text)",
+    )
+    p_extract.add_argument(
+        "--format",
+        choices=REPORT_FORMATS,
+        default=None,
+        help="Output format (default: from the file suffix, else json)",
+    )
+    p_extract.add_argument(
+        "--shard",
+        type=_shard_arg,
+        default=None,
+        help="Only process shard i of N (e.g. 0/4), assigned by a stable hash of the file name",
+    )
+    _add_llm_fallback_arg(p_extract)
+    _add_profile_arg(p_extract)
     p_extract.set_defaults(func=cmd_extract)
 
     p_validate = sub.add_parser("validate", help="Validate invoices from JSON")
-    p_validate.add_argument("--input", required=True, help="Input JSON file")
-    p_validate.add_argument("--report", required=True, help="Output validation report JSON")
+    p_validate.add_argument("--input", required=True, help="Input invoices file (JSON by default)")
+    p_validate.add_argument("--report", required=True, help="Output validation report (JSON by default)")
+    p_validate.add_argument(
+        "--format",
+        choices=REPORT_FORMATS,
+        default=None,
+        help="Output format (default: from the file suffix, else json)",
+    )
+    _add_profile_arg(p_validate)
     p_validate.set_defaults(func=cmd_validate)
 
     p_full = sub.add_parser("full-run", help="Extract + Validate")
-    p_full.add_argument("--pdf-dir", required=True, help="Directory containing PDF files")
-    p_full.add_argument("--report", required=True, help="Output validation report JSON")
+    _add_source_args(p_full)
+    p_full.add_argument("--report", required=True, help="Output validation report (JSON by default)")
+    p_full.add_argument(
+        "--pdf-backend",
+        choices=["auto", *BACKENDS],
+        default=None,
+        help="PDF text backend (default: $INVOICE_QC_PDF_BACKEND or auto)",
+    )
+    p_full.add_argument(
+        "--line-items",
+        choices=["text", "table"],
+        default=None,
+        help="Line-item extraction mode (default: $INVOICE_QC_LINE_ITEMS_MODE or text)",
+    )
+    p_full.add_argument(
+        "--format",
+        choices=REPORT_FORMATS,
+        default=None,
+        help="Output format (default: from the file suffix, else json)",
+    )
+    p_full.add_argument(
+        "--incremental",
+        action="store_true",
+        help="Only re-extract new or changed PDFs, reusing cached invoices from the manifest",
+    )
+    p_full.add_argument(
+        "--manifest",
+        default=None,
+        help="Manifest file for --incremental (default: <pdf-dir>/.invoice_qc_manifest.json)",
+    )
+    p_full.add_argument(
+        "--shard",
+        type=_shard_arg,
+        default=None,
+        help="Only process shard i of N (e.g. 0/4), assigned by a stable hash of the file name",
+    )
+    _add_llm_fallback_arg(p_full)
+    _add_profile_arg(p_full)
     p_full.set_defaults(func=cmd_full_run)
 
+    p_merge = sub.add_parser("merge-reports", help="Merge shard reports into one report")
+    p_merge.add_argument("inputs", nargs="+", help="Shard reports written by full-run/validate")
+    p_merge.add_argument("--report", required=True, help="Output merged report (JSON by default)")
+    p_merge.add_argument(
+        "--format",
+        choices=REPORT_FORMATS,
+        default=None,
+        help="Output format (default: from the file suffix, else json)",
+    )
+    _add_profile_arg(p_merge)
+    p_merge.set_defaults(func=cmd_merge_reports)
+
+    p_watch = sub.add_parser("watch", help="Watch a drop folder and validate new PDFs continuously")
+    p_watch.add_argument("--dir", required=True, help="Directory to watch for PDF files")
+    p_watch.add_argument("--report", required=True, help="Rolling JSONL report (appended per batch)")
+    p_watch.add_argument("--workers", type=int, default=2, help="Extraction worker processes")
+    p_watch.add_argument("--batch-size", type=int, default=50, help="Validate once this many invoices are ready")
+    p_watch.add_argument(
+        "--batch-window", type=float, default=30.0, help="...or once the oldest ready invoice is this many seconds old"
+    )
+    p_watch.add_argument("--poll-interval", type=float, default=2.0, help="Seconds between directory scans when polling")
+    p_watch.add_argument("--settle", type=float, default=1.0, help="Seconds a file must stay unchanged before it is read")
+    p_watch.add_argument("--polling", action="store_true", help="Poll the directory even if inotify is available")
+    p_watch.add_argument(
+        "--process-existing",
+        action="store_true",
+        help="On the first start (no manifest yet), also process PDFs already in the directory",
+    )
+    p_watch.add_argument(
+        "--manifest",
+        default=None,
+        help="Manifest of processed files (default: <dir>/.invoice_qc_watch_manifest.json)",
+    )
+    p_watch.add_argument(
+        "--retries", type=int, default=2, help="Times a failed extraction is retried before it is reported"
+    )
+    p_watch.add_argument(
+        "--pdf-backend",
+        choices=["auto", *BACKENDS],
+        default=None,
+        help="PDF text backend (default: $INVOICE_QC_PDF_BACKEND or auto)",
+    )
+    p_watch.add_argument(
+        "--line-items",
+        choices=["text", "table"],
+        default=None,
+        help="Line-item extraction mode (default: $INVOICE_QC_LINE_ITEMS_MODE or text)",
+    )
+    _add_llm_fallback_arg(p_watch)
+    p_watch.set_defaults(func=cmd_watch)
+
     args = parser.parse_args()
-    exit_code = args.func(args)
+    if getattr(args, "profile", None):
+        exit_code = _run_profiled(args)
+    else:
+        exit_code = args.func(args)
     sys.exit(exit_code)
 
 
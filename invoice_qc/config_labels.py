@@ -3,10 +3,16 @@
 from __future__ import annotations
 
 import re
+from dataclasses import dataclass, field
 from datetime import date
+from functools import lru_cache
+from typing import Dict, List, Optional, Pattern
 
 ALLOWED_CURRENCIES = {"INR", "EUR", "USD", "GBP"}
 
+# Symbols captured by the "currency" patterns of the language packs
+CURRENCY_SYMBOLS = {"€": "EUR", "₹": "INR", "£": "GBP"}
+
 # Date patterns: adjust after seeing real PDFs
 DATE_PATTERNS = [
     # DD/MM/YYYY or D/M/YYYY
@@ -68,6 +74,212 @@ LABEL_PATTERNS = {
     ],
 }
 
+
+@dataclass(frozen=True)
+class LabelPack:
+    """Label patterns of one language; amount patterns capture the amount as group 1."""
+
+    language: str
+    patterns: Dict[str, List[Pattern]]
+    date_patterns: List[Pattern] = field(default_factory=lambda: DATE_PATTERNS)
+    # "1.234,56" instead of "1,234.56"
+    decimal_comma: bool = False
+
+
+ENGLISH_PACK = LabelPack("en", LABEL_PATTERNS)
+
+# "1.234,56", "1 234,56", "19,00" (and "1234.56" from exports)
+_DECIMAL_COMMA_AMOUNT = r"[-+]?(?:\d{1,3}(?:[. \u00a0]\d{3})+|\d+)(?:[.,]\d+)?"
+# "1,18,000.00" (lakh grouping) as well as "118,000.00"
+_INDIAN_AMOUNT = r"[-+]?\d+(?:,\d+)*(?:\.\d+)?"
+# Devanagari vowel signs are not \w, so (?<!\w) cannot tell "विक्रेता" from "क्रेता"
+_NOT_AFTER_DEVANAGARI = r"(?<![\u0900-\u097F])"
+
+# Label packs by langdetect code, as uncompiled sources: most documents are
+# English, so the other packs are only compiled once a document needs them.
+# "{amount}" expands to the pack's amount pattern (with an optional
+# currency code or symbol before it). Fields a pack does not find fall back
+# to LABEL_PATTERNS.
+_LABEL_PACK_SOURCES = {
+    "de": {
+        "decimal_comma": True,
+        "amount": r"(?:[A-Z]{3}|€)?\s*(" + _DECIMAL_COMMA_AMOUNT + ")",
+        "date_patterns": [r"\b(\d{1,2})\.(\d{1,2})\.(\d{4})\b"],
+        "patterns": {
+            "invoice_number": [
+                r"Rechnungs\s*-?\s*(?:nummer|nr\.?)\s*[:\-]?\s*([A-Za-z0-9\-\/\.]+)",
+                r"Beleg\s*-?\s*(?:nummer|nr\.?)\s*[:\-]?\s*([A-Za-z0-9\-\/\.]+)",
+            ],
+            "invoice_date": [
+                r"Rechnungsdatum\s*[:\-]?\s*(.+?)(?=\n|$)",
+                r"(?<!\w)Datum\s*[:\-]?\s*(.+?)(?=\n|$)",
+            ],
+            "due_date": [
+                r"(?:Fälligkeitsdatum|Fällig\s*am|Zahlbar\s*bis)\s*[:\-]?\s*(.+?)(?=\n|$)",
+            ],
+            "seller_name": [
+                r"(?<!\w)(?:Verkäufer|Lieferant|Rechnungssteller)\b\s*[:\-]?\s*(.+?)(?=\n|$)",
+            ],
+            "seller_tax_id": [
+                r"(?:USt\s*-?\s*IdNr\.?|USt\s*-?\s*ID|Steuernummer)\s*[:\-]?\s*([A-Za-z0-9]+)",
+            ],
+            "buyer_name": [
+                r"(?<!\w)(?:Käufer|Rechnungsempfänger|Kunde)\b\s*[:\-]?\s*(.+?)(?=\n|$)",
+            ],
+            "buyer_tax_id": [
+                r"(?:Kunden|Käufer)\s*-?\s*(?:USt\s*-?\s*IdNr\.?|USt\s*-?\s*ID)\s*[:\-]?\s*([A-Za-z0-9]+)",
+            ],
+            "currency": [r"Währung\s*[:\-]?\s*([A-Z]{3})", r"(€)"],
+            "net_total": [
+                r"(?:Nettobetrag|Nettosumme|Zwischensumme|Gesamtwert(?!\s*inkl))\s*[:\-]?\s*{amount}",
+            ],
+            "tax_amount": [
+                r"(?:MwSt\.?|USt\.?|Mehrwertsteuer|Umsatzsteuer)(?:\s*\d+(?:,\d+)?\s*%)?\s*[:\-]?\s*{amount}",
+            ],
+            "gross_total": [
+                r"(?:Gesamtbetrag|Bruttobetrag|Rechnungsbetrag|Endbetrag|Zahlbetrag"
+                r"|Gesamtwert\s*inkl\.?\s*MwSt\.?)\s*[:\-]?\s*{amount}",
+            ],
+        },
+    },
+    "fr": {
+        "decimal_comma": True,
+        "amount": r"(?:[A-Z]{3}|€)?\s*(" + _DECIMAL_COMMA_AMOUNT + ")",
+        "patterns": {
+            "invoice_number": [
+                r"(?:N°|Numéro)\s*(?:de\s*)?facture\s*[:\-]?\s*([A-Za-z0-9\-\/\.]+)",
+                r"Facture\s*(?:N°|No\.?|#)\s*[:\-]?\s*([A-Za-z0-9\-\/\.]+)",
+            ],
+            "invoice_date": [
+                r"Date\s*(?:de\s*(?:la\s*)?)?facture\s*[:\-]?\s*(.+?)(?=\n|$)",
+                r"Date\s*d'émission\s*[:\-]?\s*(.+?)(?=\n|$)",
+            ],
+            "due_date": [
+                r"(?:Date\s*d'échéance|[ÉE]chéance)\s*[:\-]?\s*(.+?)(?=\n|$)",
+            ],
+            "seller_name": [
+                r"(?<!\w)(?:Vendeur|Fournisseur|[ÉE]metteur)\b\s*[:\-]?\s*(.+?)(?=\n|$)",
+            ],
+            "seller_tax_id": [
+                r"(?:N°\s*(?:de\s*)?TVA(?:\s*intracommunautaire)?|SIRET|SIREN)\s*[:\-]?\s*([A-Za-z0-9]+)",
+            ],
+            "buyer_name": [
+                r"(?<!\w)(?:Client|Acheteur|Destinataire|Facturé\s*à)\b\s*[:\-]?\s*(.+?)(?=\n|$)",
+            ],
+            "buyer_tax_id": [
+                r"(?:Client|Acheteur)\s*N°\s*TVA\s*[:\-]?\s*([A-Za-z0-9]+)",
+            ],
+            "currency": [r"Devise\s*[:\-]?\s*([A-Z]{3})", r"(€)"],
+            "net_total": [
+                r"(?:Total\s*HT|Montant\s*HT|Sous\s*-?\s*total)\s*[:\-]?\s*{amount}",
+            ],
+            "tax_amount": [
+                r"(?:Total\s*TVA|Montant\s*TVA|TVA)(?:\s*\d+(?:,\d+)?\s*%)?\s*[:\-]?\s*{amount}",
+            ],
+            "gross_total": [
+                r"(?:Total\s*TTC|Montant\s*TTC|Net\s*à\s*payer|Total\s*à\s*payer)\s*[:\-]?\s*{amount}",
+            ],
+        },
+    },
+    "es": {
+        "decimal_comma": True,
+        "amount": r"(?:[A-Z]{3}|€)?\s*(" + _DECIMAL_COMMA_AMOUNT + ")",
+        "patterns": {
+            "invoice_number": [
+                r"(?:N[úu]mero\s*de\s*factura|Factura\s*(?:N[º°o]\.?|#))\s*[:\-]?\s*([A-Za-z0-9\-\/\.]+)",
+            ],
+            "invoice_date": [
+                r"Fecha\s*(?:de\s*(?:la\s*)?factura|de\s*emisi[óo]n)\s*[:\-]?\s*(.+?)(?=\n|$)",
+                r"(?<!\w)Fecha\s*[:\-]?\s*(.+?)(?=\n|$)",
+            ],
+            "due_date": [
+                r"(?:Fecha\s*de\s*vencimiento|Vencimiento)\s*[:\-]?\s*(.+?)(?=\n|$)",
+            ],
+            "seller_name": [
+                r"(?<!\w)(?:Vendedor|Proveedor|Emisor)\b\s*[:\-]?\s*(.+?)(?=\n|$)",
+            ],
+            "seller_tax_id": [
+                r"(?:NIF|CIF)\s*(?:del\s*)?(?:emisor|proveedor)?\s*[:\-]?\s*([A-Za-z0-9]+)",
+            ],
+            "buyer_name": [
+                r"(?<!\w)(?:Cliente|Comprador|Facturar\s*a)\b\s*[:\-]?\s*(.+?)(?=\n|$)",
+            ],
+            "buyer_tax_id": [
+                r"(?:NIF|CIF)\s*(?:del\s*)?cliente\s*[:\-]?\s*([A-Za-z0-9]+)",
+            ],
+            "currency": [r"Moneda\s*[:\-]?\s*([A-Z]{3})", r"(€)"],
+            "net_total": [
+                r"(?:Base\s*imponible|Importe\s*neto)\s*[:\-]?\s*{amount}",
+            ],
+            "tax_amount": [
+                r"(?:IVA|Cuota\s*IVA)(?:\s*\d+(?:,\d+)?\s*%)?\s*[:\-]?\s*{amount}",
+            ],
+            "gross_total": [
+                r"(?:Importe\s*total|Total\s*factura|Total\s*a\s*pagar)\s*[:\-]?\s*{amount}",
+            ],
+        },
+    },
+    "hi": {
+        "amount": r"(?:₹|रु\.?|Rs\.?|INR)?\s*(" + _INDIAN_AMOUNT + ")",
+        "patterns": {
+            "invoice_number": [
+                r"(?:चालान|बीजक|इनवॉइस)\s*(?:संख्या|सं\.?|नं\.?)\s*[:\-]?\s*([A-Za-z0-9\-\/\.]+)",
+            ],
+            "invoice_date": [
+                r"(?:चालान|बीजक|इनवॉइस)\s*(?:दिनांक|तारीख|तिथि)\s*[:\-]?\s*(.+?)(?=\n|$)",
+                _NOT_AFTER_DEVANAGARI + r"(?:दिनांक|तारीख)\s*[:\-]?\s*(.+?)(?=\n|$)",
+            ],
+            "due_date": [
+                r"(?:देय\s*(?:तिथि|दिनांक)|भुगतान\s*की\s*अंतिम\s*तिथि)\s*[:\-]?\s*(.+?)(?=\n|$)",
+            ],
+            "seller_name": [
+                r"(?:विक्रेता|आपूर्तिकर्ता)\s*(?:का\s*नाम)?\s*[:\-]?\s*(.+?)(?=\n|$)",
+            ],
+            "seller_tax_id": [
+                r"(?:विक्रेता|आपूर्तिकर्ता)\s*(?:का\s*)?(?:जीएसटीआईएन|जीएसटी|GSTIN|GST)\s*(?:संख्या|नं\.?)?\s*[:\-]?\s*([A-Za-z0-9]+)",
+            ],
+            "buyer_name": [
+                _NOT_AFTER_DEVANAGARI + r"(?:क्रेता|खरीदार|ग्राहक)\s*(?:का\s*नाम)?\s*[:\-]?\s*(.+?)(?=\n|$)",
+            ],
+            "buyer_tax_id": [
+                _NOT_AFTER_DEVANAGARI + r"(?:क्रेता|खरीदार|ग्राहक)\s*(?:का\s*)?(?:जीएसटीआईएन|जीएसटी|GSTIN|GST)\s*(?:संख्या|नं\.?)?\s*[:\-]?\s*([A-Za-z0-9]+)",
+            ],
+            "currency": [r"मुद्रा\s*[:\-]?\s*([A-Z]{3})", r"(₹)"],
+            "net_total": [
+                r"(?:उप\s*-?\s*योग|कर\s*योग्य\s*(?:राशि|मूल्य))\s*[:\-]?\s*{amount}",
+            ],
+            "tax_amount": [
+                _NOT_AFTER_DEVANAGARI + r"(?:कुल\s*कर|आईजीएसटी|सीजीएसटी|एसजीएसटी|जीएसटी)\s*[:\-]?\s*{amount}",
+            ],
+            "gross_total": [
+                r"(?:कुल\s*(?:देय\s*)?राशि|कुल\s*योग|सकल\s*योग)\s*[:\-]?\s*{amount}",
+            ],
+        },
+    },
+}
+
+LABEL_PACK_LANGUAGES = frozenset(_LABEL_PACK_SOURCES)
+
+
+@lru_cache(maxsize=None)
+def _compile_pack(language: str) -> LabelPack:
+    source = _LABEL_PACK_SOURCES[language]
+    amount = source["amount"]
+    patterns = {
+        key: [re.compile(p.replace("{amount}", amount), re.I) for p in sources]
+        for key, sources in source["patterns"].items()
+    }
+    date_patterns = DATE_PATTERNS + [re.compile(p) for p in source.get("date_patterns", [])]
+    return LabelPack(language, patterns, date_patterns, source.get("decimal_comma", False))
+
+
+def label_pack(language: Optional[str]) -> LabelPack:
+    """The pack for a detected language; English for unknown or unsupported ones."""
+    if language in _LABEL_PACK_SOURCES:
+        return _compile_pack(language)
+    return ENGLISH_PACK
+
+
 MIN_VALID_DATE = date(2000, 1, 1)
 MAX_VALID_DATE = date(2100, 1, 1)
 
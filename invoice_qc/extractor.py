@@ -1,12 +1,13 @@
 # invoice_qc/extractor.py
 from __future__ import annotations
 
-import json
+import io
+import os
 import re
 from dataclasses import dataclass
 from datetime import datetime, date
 from pathlib import Path
-from typing import List, Optional
+from typing import Dict, List, Optional, Sequence, Tuple, Union
 
 import pdfplumber
 try:
@@ -30,48 +31,120 @@ from .config_labels import (
 	DATE_PATTERNS,
 	ALLOWED_CURRENCIES,
 	AMOUNT_PATTERN,
+	CURRENCY_SYMBOLS,
+	ENGLISH_PACK,
+	TABLE_HEADERS,
+	LabelPack,
+	label_pack,
 )
-from .lang_utils import clean_text, extract_lines
-from .models import Invoice, LineItem
+from .lang_utils import clean_text, detect_language, extract_lines
+from .isolation import extract_documents
+from .llm_extract import LLMFallback, get_fallback
+from .models import Invoice
+from .pdf_backends import PdfSource, extract_pdf_pages, pdf_input
+from .profiling import stage
+from .records import InvoiceRecord, LineItemRecord, to_records
+from .sharding import Shard, in_shard
+
+
+# How line items are extracted from PDFs: "text" splits the flattened text,
+# "table" runs pdfplumber table detection on the cropped table region.
+LINE_ITEMS_MODE = os.getenv("INVOICE_QC_LINE_ITEMS_MODE", "text")
+
+IMAGE_SUFFIXES = (".jpg", ".jpeg", ".png")
+
+# Leading characters of a document used to detect its language (label pack)
+LANGUAGE_SAMPLE_CHARS = 1000
 
 
 @dataclass
 class RawInvoiceText:
 	path: Path
 	full_text: str
+	# Set when line items were read from the PDF table itself; parse_raw_invoice
+	# then uses them instead of parsing the flattened text.
+	line_items: Optional[List[LineItemRecord]] = None
+
+
+def _document_path(source: Union[Path, bytes], name: Optional[str]) -> Path:
+	if name is not None:
+		return Path(name)
+	return Path("document") if isinstance(source, bytes) else source
+
 
+def extract_text_from_pdf(
+	pdf_path: PdfSource,
+	backend: Optional[str] = None,
+	line_items_mode: Optional[str] = None,
+	name: Optional[str] = None,
+) -> RawInvoiceText:
+	"""Extract the text of every page of ``pdf_path``.
 
-def extract_text_from_pdf(pdf_path: Path) -> RawInvoiceText:
-	parts: List[str] = []
-	with pdfplumber.open(str(pdf_path)) as pdf:
-		for page in pdf.pages:
-			parts.append(page.extract_text() or "")
-	return RawInvoiceText(path=pdf_path, full_text="\n".join(parts))
+	``backend`` selects a text backend from ``pdf_backends`` (``auto``,
+	``pdfium``, ``pdfplumber`` or ``pdfminer``); ``None`` uses the configured
+	default. With ``line_items_mode="table"`` line items are also read from the
+	table region (see ``extract_line_items_from_table``).
 
+	``pdf_path`` may also be the PDF bytes (an archive member); ``name`` then
+	names the document.
+	"""
+	with stage("extract_text_from_pdf"):
+		with stage("pdf_text"):
+			_, parts = extract_pdf_pages(pdf_path, backend)
+		line_items = None
+		if (line_items_mode or LINE_ITEMS_MODE) == "table":
+			with stage("line_items_table"):
+				line_items = extract_line_items_from_table(pdf_path, parts)
+		return RawInvoiceText(
+			path=_document_path(pdf_path, name), full_text="\n".join(parts), line_items=line_items
+		)
 
-def extract_text_from_image(image_path: Path) -> RawInvoiceText:
+
+def extract_text_from_image(image_path: Union[Path, bytes], name: Optional[str] = None) -> RawInvoiceText:
 	"""Extract text from an image using pytesseract (if available).
 
 	If pytesseract or Pillow are not installed, returns an empty string so the
-	rest of the pipeline can continue without crashing.
+	rest of the pipeline can continue without crashing. Like
+	``extract_text_from_pdf``, also takes the image bytes and a ``name``.
 	"""
+	path = _document_path(image_path, name)
 	if Image is None or pytesseract is None:
 		# OCR not available in this environment
-		return RawInvoiceText(path=image_path, full_text="")
+		return RawInvoiceText(path=path, full_text="")
 
 	try:
-		img = Image.open(str(image_path))
-		text = pytesseract.image_to_string(img)
-		return RawInvoiceText(path=image_path, full_text=text or "")
+		with stage("extract_text_from_image"):
+			if isinstance(image_path, bytes):
+				img = Image.open(io.BytesIO(image_path))
+			else:
+				img = Image.open(str(image_path))
+			text = pytesseract.image_to_string(img)
+		return RawInvoiceText(path=path, full_text=text or "")
 	except Exception:
-		return RawInvoiceText(path=image_path, full_text="")
+		return RawInvoiceText(path=path, full_text="")
+
+
+def extract_document(
+	source: Union[Path, bytes],
+	backend: Optional[str] = None,
+	line_items_mode: Optional[str] = None,
+	name: Optional[str] = None,
+) -> Tuple[InvoiceRecord, Dict[str, float], str]:
+	"""Extract and parse one PDF or image (by suffix): ``(record, confidence, text)``."""
+	path = _document_path(source, name)
+	if path.suffix.lower() in IMAGE_SUFFIXES:
+		raw = extract_text_from_image(source, name)
+	else:
+		raw = extract_text_from_pdf(source, backend, line_items_mode, name)
+	record, confidence = parse_raw_invoice_scored(raw)
+	return record, confidence, raw.full_text
 
 
-def _parse_date_from_text(text: str) -> Optional[str]:
+def _parse_date_from_text(text: str, date_patterns=DATE_PATTERNS) -> Optional[str]:
 	if not text:
 		return None
 
-	for pattern in DATE_PATTERNS:
+	for pattern in date_patterns:
 		m = pattern.search(text)
 		if not m:
 			continue
@@ -106,18 +179,42 @@ def _parse_amount(s: str) -> Optional[float]:
 		return None
 
 
-def _extract_single_field(text: str, key: str) -> Optional[str]:
-	patterns = LABEL_PATTERNS.get(key, [])
-	for pattern in patterns:
-		for line in text.splitlines():
+def _parse_local_amount(s: str, decimal_comma: bool) -> Optional[float]:
+	"""Amount captured by a label pack: "1.234,56" / "1 234,56" or "1,18,000.00"."""
+	s = re.sub(r"[\s\u00a0]", "", s)
+	if decimal_comma:
+		if "," in s:
+			s = s.replace(".", "").replace(",", ".")
+		elif re.fullmatch(r"[-+]?\d{1,3}(?:\.\d{3})+", s):
+			s = s.replace(".", "")
+	else:
+		s = s.replace(",", "")
+	try:
+		return float(s)
+	except ValueError:
+		return None
+
+
+def _field_patterns(pack: LabelPack, key: str) -> List[re.Pattern]:
+	# A language pack first, then the English labels its documents often still use
+	if pack is ENGLISH_PACK:
+		return LABEL_PATTERNS.get(key, [])
+	return pack.patterns.get(key, []) + LABEL_PATTERNS.get(key, [])
+
+
+def _extract_single_field(text: str, key: str, pack: LabelPack = ENGLISH_PACK) -> Optional[str]:
+	lines = text.splitlines()
+	for pattern in _field_patterns(pack, key):
+		for line in lines:
 			m = pattern.search(line)
 			if m:
 				return m.groups()[-1].strip()
 	return None
 
 
-def _guess_currency(text: str) -> Optional[str]:
-	val = _extract_single_field(text, "currency")
+def _guess_currency(text: str, pack: LabelPack = ENGLISH_PACK) -> Optional[str]:
+	val = _extract_single_field(text, "currency", pack)
+	val = CURRENCY_SYMBOLS.get(val, val)
 	if val and val.upper() in ALLOWED_CURRENCIES:
 		return val.upper()
 
@@ -127,7 +224,7 @@ def _guess_currency(text: str) -> Optional[str]:
 	return None
 
 
-def _extract_line_items(text: str) -> List[LineItem]:
+def _extract_line_items(text: str) -> List[LineItemRecord]:
 	"""
 	Naive line-item parser:
 	- Find header line with 'Description' and 'Qty'/'Quantity'
@@ -146,7 +243,7 @@ def _extract_line_items(text: str) -> List[LineItem]:
 	if header_idx is None:
 		return []
 
-	items: List[LineItem] = []
+	items: List[LineItemRecord] = []
 	for line in lines[header_idx + 1 :]:
 		low = line.lower()
 		if "grand" in low and "total" in low:
@@ -162,7 +259,7 @@ def _extract_line_items(text: str) -> List[LineItem]:
 		line_total = _parse_amount(parts[3]) if len(parts) > 3 else None
 
 		items.append(
-			LineItem(
+			LineItemRecord(
 				description=description,
 				quantity=qty,
 				unit_price=unit_price,
@@ -173,15 +270,204 @@ def _extract_line_items(text: str) -> List[LineItem]:
 	return items
 
 
-def parse_raw_invoice(raw: RawInvoiceText) -> Invoice:
+_TABLE_HEADER_RES = [re.compile(p, re.I) for p in TABLE_HEADERS["line_items"]]
+_LINE_ITEM_FIELDS = ["description", "quantity", "unit_price", "line_total"]
+_TABLE_END_RE = re.compile(
+	r"(?:Sub\s*total|Net\s*Total|Grand\s*Total|Total\s*(?:Payable|Amount|Due))", re.I
+)
+# Ruled tables first, then whitespace-aligned columns
+_TABLE_SETTINGS = [
+	{},
+	{"vertical_strategy": "text", "horizontal_strategy": "text"},
+]
+
+
+def _is_table_header(line: str) -> bool:
+	description_re, quantity_re = _TABLE_HEADER_RES[0], _TABLE_HEADER_RES[1]
+	return bool(description_re.search(line) and quantity_re.search(line))
+
+
+def _find_table_bbox(page) -> Optional[tuple]:
+	"""Bounding box from the header row down to the totals block (or page end)."""
+	description_hits = page.search(TABLE_HEADERS["line_items"][0], regex=True, case=False)
+	quantity_hits = page.search(TABLE_HEADERS["line_items"][1], regex=True, case=False)
+
+	for desc in description_hits:
+		height = desc["bottom"] - desc["top"]
+		same_row = [q for q in quantity_hits if abs(q["top"] - desc["top"]) < height]
+		if not same_row:
+			continue
+
+		header_top = desc["top"]
+		header_bottom = max(desc["bottom"], *(q["bottom"] for q in same_row))
+		x0 = min(desc["x0"], *(q["x0"] for q in same_row))
+
+		bottom = page.height
+		for hit in page.search(_TABLE_END_RE.pattern, regex=True, case=False):
+			if hit["top"] > header_bottom:
+				bottom = min(bottom, hit["top"])
+
+		# Pad by one header height so ruling lines around the header are kept
+		return (
+			max(x0 - height, 0),
+			max(header_top - height, 0),
+			page.width,
+			bottom,
+		)
+	return None
+
+
+def _map_header_cells(cells: List[Optional[str]]) -> Dict[int, str]:
+	mapping: Dict[int, str] = {}
+	for idx, cell in enumerate(cells):
+		text = (cell or "").strip()
+		if not text:
+			continue
+		for pattern, field in zip(_TABLE_HEADER_RES, _LINE_ITEM_FIELDS):
+			if field not in mapping.values() and pattern.search(text):
+				mapping[idx] = field
+				break
+	return mapping
+
+
+def _line_items_from_table(table: Optional[List[List[Optional[str]]]]) -> Optional[List[LineItemRecord]]:
+	if not table:
+		return None
+
+	mapping: Dict[int, str] = {}
+	header_row = None
+	for i, row in enumerate(table):
+		mapping = _map_header_cells(row)
+		if "description" in mapping.values():
+			header_row = i
+			break
+	if header_row is None:
+		return None
+
+	items: List[LineItemRecord] = []
+	for row in table[header_row + 1 :]:
+		values: Dict[str, str] = {}
+		for idx, field in mapping.items():
+			cell = row[idx] if idx < len(row) else None
+			values[field] = " ".join((cell or "").split())
+
+		description = values.get("description", "")
+		if description and _TABLE_END_RE.search(description):
+			break
+
+		quantity = _parse_amount(values.get("quantity", ""))
+		unit_price = _parse_amount(values.get("unit_price", ""))
+		line_total = _parse_amount(values.get("line_total", ""))
+
+		if quantity is None and unit_price is None and line_total is None:
+			# Wrapped description text continues the previous item
+			if description and items:
+				items[-1].description = f"{items[-1].description} {description}"
+			continue
+
+		items.append(
+			LineItemRecord(
+				description=description,
+				quantity=quantity,
+				unit_price=unit_price,
+				line_total=line_total,
+			)
+		)
+
+	return items
+
+
+def extract_line_items_from_table(pdf_path: PdfSource, page_texts: List[str]) -> Optional[List[LineItemRecord]]:
+	"""
+	Layout-aware line-item parser:
+	- Pick the first page whose text has a header line matching TABLE_HEADERS
+	- Locate the header row on that page and crop from it to the totals block
+	- Run pdfplumber table detection on the cropped region only
+	- Build line items from the cells, mapped by header
+
+	Returns None when no table is found so callers can fall back to the
+	text parser.
+	"""
+	page_index = next(
+		(
+			i
+			for i, text in enumerate(page_texts)
+			if any(_is_table_header(line) for line in text.splitlines())
+		),
+		None,
+	)
+	if page_index is None:
+		return None
+
+	# pdfplumber only parses the pages it is asked for
+	with pdfplumber.open(pdf_input(pdf_path), pages=[page_index + 1]) as pdf:
+		page = pdf.pages[0]
+		bbox = _find_table_bbox(page)
+		if bbox is None:
+			return None
+		region = page.crop(bbox)
+		for settings in _TABLE_SETTINGS:
+			items = _line_items_from_table(region.extract_table(settings))
+			if items:
+				return items
+	return None
+
+
+def parse_raw_invoice_record(raw: RawInvoiceText) -> InvoiceRecord:
+	return parse_raw_invoice_scored(raw)[0]
+
+
+def parse_raw_invoice_scored(raw: RawInvoiceText) -> Tuple[InvoiceRecord, Dict[str, float]]:
+	"""Parse ``raw`` and score each field (0..1) by how it was obtained.
+
+	A labelled match scores high, a guess (date anywhere in the text, currency
+	code found somewhere) lower, and a default (file stem as invoice number,
+	today's date, UNKNOWN_SELLER, INR) scores 0-0.2. Amounts that add up
+	(net + tax == gross) and line items that sum to the net total are scored
+	higher. ``llm_extract`` uses the scores to decide which documents go to the
+	LLM fallback.
+	"""
+	with stage("parse_raw_invoice"):
+		return _parse_raw_invoice_record(raw)
+
+
+def _labelled_amount(text: str, key: str, pack: LabelPack = ENGLISH_PACK) -> Optional[float]:
+	if pack is not ENGLISH_PACK:
+		for pat in pack.patterns.get(key, []):
+			m = pat.search(text)
+			if m:
+				value = _parse_local_amount(m.group(1), pack.decimal_comma)
+				if value is not None:
+					return value
+	for pat in LABEL_PATTERNS.get(key, []):
+		m = pat.search(text)
+		if m:
+			value = _parse_amount(m.group(1))
+			if value is not None:
+				return value
+	return None
+
+
+def _parse_raw_invoice_record(raw: RawInvoiceText) -> Tuple[InvoiceRecord, Dict[str, float]]:
 	text = raw.full_text
+	confidence: Dict[str, float] = {}
 
-	invoice_number_raw = _extract_single_field(text, "invoice_number") or raw.path.stem
+	# Only the detected language's labels are tried (plus English), however
+	# many packs exist; the packs compile on first use.
+	language = detect_language(text[:LANGUAGE_SAMPLE_CHARS]) if text.strip() else "unknown"
+	pack = label_pack(language)
 
-	invoice_date_raw = _extract_single_field(text, "invoice_date") or text
-	invoice_date_str = _parse_date_from_text(invoice_date_raw)
+	invoice_number_raw = _extract_single_field(text, "invoice_number", pack)
+	confidence["invoice_number"] = 0.9 if invoice_number_raw else 0.2
+	invoice_number_raw = invoice_number_raw or raw.path.stem
+
+	invoice_date_label = _extract_single_field(text, "invoice_date", pack)
+	invoice_date_str = _parse_date_from_text(invoice_date_label or text, pack.date_patterns)
 	if invoice_date_str is None:
 		invoice_date_str = datetime.today().date().isoformat()
+		confidence["invoice_date"] = 0.0
+	else:
+		confidence["invoice_date"] = 0.9 if invoice_date_label else 0.5
 
 	# Ensure invoice_date_str is an ISO string (some helpers may return date objects)
 	if isinstance(invoice_date_str, (datetime, date)):
@@ -189,45 +475,55 @@ def parse_raw_invoice(raw: RawInvoiceText) -> Invoice:
 	else:
 		invoice_date_str = str(invoice_date_str)
 
-	due_date_raw = _extract_single_field(text, "due_date")
-	due_date_str = _parse_date_from_text(due_date_raw) if due_date_raw else None
+	due_date_raw = _extract_single_field(text, "due_date", pack)
+	due_date_str = _parse_date_from_text(due_date_raw, pack.date_patterns) if due_date_raw else None
 	if isinstance(due_date_str, (datetime, date)):
 		due_date_str = due_date_str.isoformat()
 	elif due_date_str is not None:
 		due_date_str = str(due_date_str)
-
-	seller_name = _extract_single_field(text, "seller_name") or "UNKNOWN_SELLER"
-	buyer_name = _extract_single_field(text, "buyer_name") or "UNKNOWN_BUYER"
-
-	currency = _guess_currency(text) or "INR"
-
-	net_total = None
-	for pat in LABEL_PATTERNS.get("net_total", []):
-		m = pat.search(text)
-		if m:
-			net_total = _parse_amount(m.group(1))
-			if net_total is not None:
-				break
-
-	tax_amount = None
-	for pat in LABEL_PATTERNS.get("tax_amount", []):
-		m = pat.search(text)
-		if m:
-			tax_amount = _parse_amount(m.group(1))
-			if tax_amount is not None:
-				break
-
-	gross_total = None
-	for pat in LABEL_PATTERNS.get("gross_total", []):
-		m = pat.search(text)
-		if m:
-			gross_total = _parse_amount(m.group(1))
-			if gross_total is not None:
-				break
-
-	line_items = _extract_line_items(text)
-
-	return Invoice(
+	# Optional field: no label at all is a plausible answer
+	if due_date_raw is None:
+		confidence["due_date"] = 0.6
+	else:
+		confidence["due_date"] = 0.9 if due_date_str else 0.2
+
+	seller_name = _extract_single_field(text, "seller_name", pack)
+	confidence["seller_name"] = 0.8 if seller_name else 0.0
+	seller_name = seller_name or "UNKNOWN_SELLER"
+	buyer_name = _extract_single_field(text, "buyer_name", pack)
+	confidence["buyer_name"] = 0.8 if buyer_name else 0.0
+	buyer_name = buyer_name or "UNKNOWN_BUYER"
+
+	currency = _guess_currency(text, pack)
+	if currency is None:
+		confidence["currency"] = 0.2
+	else:
+		confidence["currency"] = 0.9 if _extract_single_field(text, "currency", pack) else 0.7
+	currency = currency or "INR"
+
+	net_total = _labelled_amount(text, "net_total", pack)
+	tax_amount = _labelled_amount(text, "tax_amount", pack)
+	gross_total = _labelled_amount(text, "gross_total", pack)
+	amounts = {"net_total": net_total, "tax_amount": tax_amount, "gross_total": gross_total}
+	for key, value in amounts.items():
+		confidence[key] = 0.0 if value is None else 0.7
+	if None not in amounts.values():
+		consistent = abs(net_total + tax_amount - gross_total) <= 0.01 * max(abs(gross_total), 1.0)
+		for key in amounts:
+			confidence[key] = 1.0 if consistent else 0.4
+
+	if raw.line_items is not None:
+		line_items = raw.line_items
+		confidence["line_items"] = 0.9
+	else:
+		line_items = _extract_line_items(text)
+		confidence["line_items"] = 0.6 if line_items else 0.2
+	if line_items and net_total is not None:
+		totals = [li.line_total for li in line_items]
+		if None not in totals and abs(sum(totals) - net_total) <= 0.01 * max(abs(net_total), 1.0):
+			confidence["line_items"] = 1.0
+
+	record = InvoiceRecord(
 		invoice_number=invoice_number_raw,
 		# Invoice model expects ISO date strings (Pydantic string field)
 		invoice_date=invoice_date_str,
@@ -239,34 +535,95 @@ def parse_raw_invoice(raw: RawInvoiceText) -> Invoice:
 		tax_amount=tax_amount,
 		gross_total=gross_total,
 		line_items=line_items,
+		language=language if language != "unknown" else None,
 	)
+	return record, confidence
 
 
-def extract_invoices_from_dir(pdf_dir: str) -> List[Invoice]:
-	base = Path(pdf_dir)
-	pdf_files = sorted(base.glob("*.pdf"))
-	invoices: List[Invoice] = []
-	for pdf_path in pdf_files:
-		raw = extract_text_from_pdf(pdf_path)
-		inv = parse_raw_invoice(raw)
-		invoices.append(inv)
-	return invoices
+def parse_raw_invoice(raw: RawInvoiceText) -> Invoice:
+	return parse_raw_invoice_record(raw).to_model()
 
 
-def export_invoices_to_json(invoices: List[Invoice], output_path: str = None) -> None:
+def list_pdf_files(pdf_dir: str, shard: Optional[Shard] = None) -> List[Path]:
+	"""Sorted PDFs of ``pdf_dir``, restricted to ``shard`` (index, count) if given."""
+	base = Path(pdf_dir)
+	return [p for p in sorted(base.glob("*.pdf")) if in_shard(p.name, shard)]
+
+
+def apply_llm_fallback(
+	records: List[InvoiceRecord],
+	pending: List[Tuple[int, str, InvoiceRecord, Dict[str, float]]],
+	fallback: Optional[LLMFallback],
+) -> List[int]:
+	"""Re-extract ``pending`` ``(index, text, record, confidence)`` entries of
+	``records`` in place, batched through ``fallback``.
+
+	Returns the indexes (into ``records``) the LLM gave no answer for; those
+	records are left unrefined."""
+	# Documents that could not be extracted have no text to send
+	pending = [p for p in pending if p[2].extraction_error is None]
+	if fallback is None or not pending:
+		return []
+	refined, unanswered = fallback.refine_checked(
+		[(text, record, conf) for _, text, record, conf in pending]
+	)
+	for (index, _, _, _), record in zip(pending, refined):
+		records[index] = record
+	return [pending[i][0] for i in unanswered]
+
+
+def extract_records_from_dir(
+	pdf_dir: str,
+	backend: Optional[str] = None,
+	line_items_mode: Optional[str] = None,
+	shard: Optional[Shard] = None,
+	llm_fallback: Optional[str] = None,
+	workers: Optional[int] = None,
+) -> List[InvoiceRecord]:
+	"""Extract every PDF of ``pdf_dir``.
+
+	With an ``llm_fallback`` (``gemini``; default ``$INVOICE_QC_LLM_FALLBACK``)
+	low-confidence documents are re-extracted by the LLM, in batches, once
+	the whole directory has been parsed.
+
+	Documents are extracted by ``workers`` isolated worker processes with a
+	time and memory budget each (see ``isolation``).
 	"""
-	Export invoices to JSON file.
+	fallback = get_fallback(llm_fallback)
+	pdf_files = list_pdf_files(pdf_dir, shard)
+	records: List[InvoiceRecord] = []
+	pending = []
+	documents = ((p.name, (p, backend, line_items_mode)) for p in pdf_files)
+	for record, confidence, text in extract_documents(extract_document, documents, workers=workers):
+		if fallback is not None and fallback.needs_llm(confidence):
+			pending.append((len(records), text, record, confidence))
+		records.append(record)
+	apply_llm_fallback(records, pending, fallback)
+	return records
+
+
+def extract_invoices_from_dir(
+	pdf_dir: str,
+	backend: Optional[str] = None,
+	line_items_mode: Optional[str] = None,
+) -> List[Invoice]:
+	records = extract_records_from_dir(pdf_dir, backend, line_items_mode)
+	return [r.to_model() for r in records]
+
+
+def export_invoices_to_json(
+	invoices: Sequence[Union[Invoice, InvoiceRecord]], output_path: str = None
+) -> None:
+	"""
+	Export invoices to JSON file (``reports.write_invoices`` in JSON format).
 	
 	Args:
-		invoices: List of Invoice objects.
+		invoices: List of Invoice models or InvoiceRecord objects.
 		output_path: Path to output JSON file. If None, saves to data/extracted_invoices.json
 	"""
+	# Imported here: reports pulls in the optional msgpack/pyarrow writers
+	from .reports import write_invoices
+
 	if output_path is None:
-		data_dir = Path(__file__).parent.parent / "data"
-		data_dir.mkdir(exist_ok=True)
-		output_path = str(data_dir / "extracted_invoices.json")
-	
-	data = [inv.model_dump() for inv in invoices]
-	out = Path(output_path)
-	out.parent.mkdir(parents=True, exist_ok=True)
-	out.write_text(json.dumps(data, indent=2, default=str), encoding="utf-8")
+		output_path = str(Path(__file__).parent.parent / "data" / "extracted_invoices.json")
+	write_invoices(output_path, to_records(invoices), "json")
@@ -6,10 +6,19 @@ from google import generativeai as genai
 # Load API Key
 # ----------------------------------------------------
 API_KEY = os.getenv("GEMINI_API_KEY")
+# Alternative endpoint (e.g. http://127.0.0.1:8765, the stub server of
+# benchmarks/gemini_stub.py for load tests); spoken to over REST
+API_ENDPOINT = os.getenv("GEMINI_API_ENDPOINT")
 
 if API_KEY:
     print(f"✅ GEMINI_API_KEY loaded: {API_KEY[:6]}********")
-    genai.configure(api_key=API_KEY)
+    if API_ENDPOINT:
+        print(f"🔀 Gemini endpoint: {API_ENDPOINT}")
+        genai.configure(
+            api_key=API_KEY, transport="rest", client_options={"api_endpoint": API_ENDPOINT}
+        )
+    else:
+        genai.configure(api_key=API_KEY)
 else:
     print("❌ ERROR: GEMINI_API_KEY not found in environment!")
 
@@ -39,9 +48,12 @@ def _extract_text(response):
     return None
 
 
-def _call_gemini(prompt: str) -> str | None:
+def _call_gemini(prompt: str, json_output: bool = False) -> str | None:
     """
     Try multiple Gemini models. Return response text or None.
+
+    With ``json_output`` the model is asked for a JSON response
+    (``response_mime_type``), for structured extraction.
     """
     if not API_KEY:
         print("❌ Gemini key missing, skipping call.")
@@ -56,7 +68,13 @@ def _call_gemini(prompt: str) -> str | None:
         try:
             print(f"🤖 Trying model: {model_name}")
             model = genai.GenerativeModel(model_name)
-            response = model.generate_content(prompt)
+            if json_output:
+                response = model.generate_content(
+                    prompt,
+                    generation_config={"response_mime_type": "application/json"},
+                )
+            else:
+                response = model.generate_content(prompt)
             text = _extract_text(response)
 
             if text:
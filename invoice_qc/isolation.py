@@ -0,0 +1,393 @@
+"""Isolated extraction workers with per-document time and memory budgets.
+
+A malformed or huge PDF can keep pdfplumber busy for minutes or grow it to
+gigabytes. In-process, that stalls the whole ``full-run`` or takes down
+an API worker. ``IsolatedPool`` runs each document in a long-lived worker
+process instead:
+
+- a worker handles one document at a time; a monitor thread in the parent
+  enforces the budgets
+- a document running longer than ``timeout`` seconds, or a worker whose RSS
+  goes over ``max_rss_bytes``, gets its worker killed (SIGKILL) and
+  replaced. The document fails with ``ExtractionFailed("timeout")`` or
+  ``ExtractionFailed("memory_limit")``. The other workers are not touched.
+- a worker that dies on its own (segfault in native code) fails its
+  document with ``crashed``; an exception in the extractor with ``failed``
+- a worker whose RSS is above ``recycle_rss_bytes`` (half the limit by
+  default) after a document is replaced before it takes the next one, so
+  memory left behind by earlier documents does not get the next one
+  killed as ``memory_limit``
+
+``extract_documents`` runs a sequence of documents through the process-wide
+pool for the requested worker count (one pool per count, shared by every
+caller), in order and with a bounded number in flight (in-process while a
+profiling session is active). A failed document becomes
+a placeholder record whose ``extraction_error`` the validator reports as
+``extraction: <reason>``.
+
+RSS is read from ``/proc`` (Linux) or with ``psutil`` if installed;
+without either only the timeout applies. Workers are started with the
+``forkserver`` method where available, so forking stays safe in the
+threaded API process.
+
+Settings: ``INVOICE_QC_ISOLATED_EXTRACTION`` (``0`` extracts in-process,
+as before), ``INVOICE_QC_EXTRACTION_TIMEOUT`` (seconds),
+``INVOICE_QC_EXTRACTION_MAX_RSS_MB``, ``INVOICE_QC_EXTRACTION_RECYCLE_RSS_MB``,
+``INVOICE_QC_EXTRACTION_WORKERS``.
+"""
+from __future__ import annotations
+
+import atexit
+import multiprocessing as mp
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+from dataclasses import dataclass
+from multiprocessing.connection import Connection, wait
+from pathlib import PurePosixPath
+from typing import Any, Callable, Deque, Dict, Iterable, Iterator, Optional, Tuple
+
+from .profiling import profiling_active
+from .records import InvoiceRecord
+
+try:
+    import psutil
+except Exception:
+    psutil = None
+
+ISOLATED = os.getenv("INVOICE_QC_ISOLATED_EXTRACTION", "1").lower() not in ("0", "false", "no")
+TIMEOUT = float(os.getenv("INVOICE_QC_EXTRACTION_TIMEOUT", "120"))
+MAX_RSS_BYTES = int(os.getenv("INVOICE_QC_EXTRACTION_MAX_RSS_MB", "2048")) * 2**20
+# Unset: half of the RSS limit
+_RECYCLE_RSS_MB = os.getenv("INVOICE_QC_EXTRACTION_RECYCLE_RSS_MB")
+RECYCLE_RSS_BYTES = int(_RECYCLE_RSS_MB) * 2**20 if _RECYCLE_RSS_MB else None
+WORKERS = int(os.getenv("INVOICE_QC_EXTRACTION_WORKERS", str(min(os.cpu_count() or 1, 4))))
+# Documents queued per worker beyond the one it is working on
+PREFETCH = 2
+
+# Seconds between RSS checks of busy workers
+POLL_INTERVAL = 0.1
+
+_PAGE_SIZE = os.sysconf("SC_PAGE_SIZE") if hasattr(os, "sysconf") else 4096
+
+Extracted = Tuple[InvoiceRecord, Dict[str, float], str]
+
+
+class ExtractionFailed(Exception):
+    def __init__(self, reason: str, detail: str = "") -> None:
+        super().__init__(f"{reason}: {detail}" if detail else reason)
+        self.reason = reason
+        self.detail = detail
+
+
+def failed_record(name: str, reason: str) -> InvoiceRecord:
+    """Placeholder for a document that could not be extracted."""
+    return InvoiceRecord(
+        invoice_number=PurePosixPath(name).stem,
+        invoice_date=None,
+        seller_name=None,
+        buyer_name=None,
+        file_name=name,
+        extraction_error=reason,
+    )
+
+
+def _rss_bytes(pid: int) -> Optional[int]:
+    try:
+        with open(f"/proc/{pid}/statm") as fh:
+            return int(fh.read().split()[1]) * _PAGE_SIZE
+    except OSError:
+        pass
+    if psutil is not None:
+        try:
+            return psutil.Process(pid).memory_info().rss
+        except Exception:
+            return None
+    return None
+
+
+def _worker_main(conn: Connection, initializer: Optional[Callable[[], None]]) -> None:
+    if initializer is not None:
+        initializer()
+    while True:
+        try:
+            task = conn.recv()
+        except (EOFError, OSError):
+            return
+        if task is None:
+            return
+        fn, args = task
+        try:
+            reply = ("ok", fn(*args))
+        except Exception as e:
+            reply = ("error", f"{type(e).__name__}: {e}")
+        try:
+            conn.send(reply)
+        except Exception as e:
+            # e.g. an unpicklable result
+            conn.send(("error", f"{type(e).__name__}: {e}"))
+
+
+@dataclass
+class _Task:
+    fn: Callable
+    args: Tuple
+    future: Future
+
+
+class _Worker:
+    def __init__(self, ctx, initializer: Optional[Callable[[], None]]) -> None:
+        self.conn, child = ctx.Pipe()
+        self.process = ctx.Process(target=_worker_main, args=(child, initializer), daemon=True)
+        self.process.start()
+        child.close()
+        self.task: Optional[_Task] = None
+        self.started = 0.0
+
+    def kill(self) -> None:
+        self.process.kill()
+        self.process.join()
+        self.conn.close()
+
+
+class IsolatedPool:
+    def __init__(
+        self,
+        workers: int = WORKERS,
+        timeout: float = TIMEOUT,
+        max_rss_bytes: Optional[int] = MAX_RSS_BYTES,
+        initializer: Optional[Callable[[], None]] = None,
+        recycle_rss_bytes: Optional[int] = RECYCLE_RSS_BYTES,
+    ) -> None:
+        self.workers = max(1, workers)
+        self.timeout = timeout
+        self.max_rss_bytes = max_rss_bytes
+        if recycle_rss_bytes is None and max_rss_bytes is not None:
+            recycle_rss_bytes = max_rss_bytes // 2
+        self.recycle_rss_bytes = recycle_rss_bytes
+        self.initializer = initializer
+        methods = mp.get_all_start_methods()
+        self._ctx = mp.get_context("forkserver" if "forkserver" in methods else "spawn")
+        self._queue: Deque[_Task] = deque()
+        self._lock = threading.Lock()
+        self._wake_r, self._wake_w = self._ctx.Pipe(duplex=False)
+        self._closed = False
+        self.stats = {
+            "completed": 0,
+            "timeout": 0,
+            "memory_limit": 0,
+            "crashed": 0,
+            "failed": 0,
+            "recycled": 0,
+        }
+        self._workers = [_Worker(self._ctx, initializer) for _ in range(self.workers)]
+        self._monitor = threading.Thread(target=self._run, name="isolated-pool", daemon=True)
+        self._monitor.start()
+
+    def __enter__(self) -> "IsolatedPool":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.shutdown()
+
+    def submit(self, fn: Callable, *args: Any) -> Future:
+        """Run ``fn(*args)`` in a worker; ``fn`` must be importable (pickled by name)."""
+        future: Future = Future()
+        with self._lock:
+            if self._closed:
+                raise RuntimeError("IsolatedPool is shut down")
+            self._queue.append(_Task(fn, args, future))
+        self._wake()
+        return future
+
+    def shutdown(self, wait: bool = True) -> None:
+        """Finish the queued documents, then stop the workers."""
+        with self._lock:
+            self._closed = True
+        self._wake()
+        if wait:
+            self._monitor.join()
+
+    def _wake(self) -> None:
+        try:
+            self._wake_w.send_bytes(b"")
+        except OSError:
+            pass
+
+    # -- monitor thread ------------------------------------------------
+
+    def _respawn(self, worker: _Worker) -> None:
+        worker.kill()
+        self._workers[self._workers.index(worker)] = _Worker(self._ctx, self.initializer)
+
+    def _replace(self, worker: _Worker, reason: str, detail: str = "") -> None:
+        task, worker.task = worker.task, None
+        if task is not None:
+            self.stats[reason] += 1
+            task.future.set_exception(ExtractionFailed(reason, detail))
+        self._respawn(worker)
+
+    def _assign(self) -> None:
+        for worker in self._workers:
+            if worker.task is not None:
+                continue
+            while self._queue:
+                task = self._queue.popleft()
+                if task.future.set_running_or_notify_cancel():
+                    break
+            else:
+                return
+            worker.task, worker.started = task, time.monotonic()
+            try:
+                worker.conn.send((task.fn, task.args))
+            except Exception as e:
+                if isinstance(e, (OSError, EOFError)):
+                    self._replace(worker, "crashed")
+                else:
+                    # Arguments that cannot be pickled
+                    worker.task = None
+                    self.stats["failed"] += 1
+                    task.future.set_exception(ExtractionFailed("failed", str(e)))
+
+    def _receive(self, worker: _Worker) -> None:
+        try:
+            status, value = worker.conn.recv()
+        except (EOFError, OSError):
+            # Reap the dead worker first: exitcode is None until it is joined
+            worker.kill()
+            self._replace(worker, "crashed", f"exit code {worker.process.exitcode}")
+            return
+        task, worker.task = worker.task, None
+        if task is None:
+            return
+        if status == "ok":
+            self.stats["completed"] += 1
+            task.future.set_result(value)
+        else:
+            self.stats["failed"] += 1
+            task.future.set_exception(ExtractionFailed("failed", value))
+        if self.recycle_rss_bytes is not None:
+            rss = _rss_bytes(worker.process.pid)
+            if rss is not None and rss > self.recycle_rss_bytes:
+                self.stats["recycled"] += 1
+                self._respawn(worker)
+
+    def _enforce_limits(self) -> None:
+        now = time.monotonic()
+        for worker in list(self._workers):
+            if worker.task is None:
+                continue
+            elapsed = now - worker.started
+            if elapsed > self.timeout:
+                self._replace(worker, "timeout", f"after {elapsed:.0f}s")
+                continue
+            if self.max_rss_bytes is not None:
+                rss = _rss_bytes(worker.process.pid)
+                if rss is not None and rss > self.max_rss_bytes:
+                    self._replace(worker, "memory_limit", f"RSS {rss // 2**20} MiB")
+
+    def _run(self) -> None:
+        try:
+            while True:
+                with self._lock:
+                    self._assign()
+                    busy = [w for w in self._workers if w.task is not None]
+                    if self._closed and not busy and not self._queue:
+                        break
+                # Wake up for results, new work, the next deadline or RSS check
+                next_deadline = min(
+                    (w.started + self.timeout for w in busy), default=time.monotonic() + 1.0
+                )
+                timeout = max(0.0, min(POLL_INTERVAL, next_deadline - time.monotonic()))
+                if not busy:
+                    timeout = None
+                ready = wait([w.conn for w in busy] + [self._wake_r], timeout)
+                if self._wake_r in ready:
+                    while self._wake_r.poll():
+                        self._wake_r.recv_bytes()
+                by_conn = {w.conn: w for w in busy}
+                with self._lock:
+                    for conn in ready:
+                        worker = by_conn.get(conn)
+                        if worker is not None:
+                            self._receive(worker)
+                    self._enforce_limits()
+        finally:
+            for worker in self._workers:
+                try:
+                    worker.conn.send(None)
+                except Exception:
+                    pass
+            for worker in self._workers:
+                worker.process.join(timeout=5)
+                if worker.process.is_alive():
+                    worker.process.kill()
+                    worker.process.join()
+
+
+# worker count -> pool. A pool is never shut down while the process runs:
+# other threads may still be submitting to it.
+_POOLS: Dict[int, IsolatedPool] = {}
+_POOL_LOCK = threading.Lock()
+
+
+def get_pool(workers: Optional[int] = None) -> IsolatedPool:
+    """The process-wide pool with ``workers`` workers (default ``WORKERS``)."""
+    count = max(1, workers if workers is not None else WORKERS)
+    with _POOL_LOCK:
+        pool = _POOLS.get(count)
+        if pool is None:
+            pool = _POOLS[count] = IsolatedPool(count)
+        return pool
+
+
+@atexit.register
+def _shutdown_pools() -> None:
+    for pool in _POOLS.values():
+        pool.shutdown()
+
+
+def extract_documents(
+    fn: Callable[..., Extracted],
+    documents: Iterable[Tuple[str, Tuple]],
+    *,
+    isolated: Optional[bool] = None,
+    workers: Optional[int] = None,
+) -> Iterator[Extracted]:
+    """
+    ``fn(*args)`` for every ``(name, args)`` of ``documents``, in order.
+    Isolated (the default, see ``ISOLATED``), a document that fails yields
+    ``(failed_record(name, reason), {}, "")``. In-process, errors propagate.
+    Inside a ``profiled()`` session the default is in-process, so the
+    profile sees the extraction rather than the parent waiting for workers.
+    """
+    if isolated is None:
+        isolated = ISOLATED and not profiling_active()
+    if not isolated:
+        for _, args in documents:
+            yield fn(*args)
+        return
+
+    pool = get_pool(workers)
+    window = pool.workers * (1 + PREFETCH)
+    in_flight: Deque[Tuple[str, Future]] = deque()
+
+    def _result(name: str, future: Future) -> Extracted:
+        try:
+            return future.result()
+        except ExtractionFailed as e:
+            return failed_record(name, e.reason), {}, ""
+
+    try:
+        for name, args in documents:
+            in_flight.append((name, pool.submit(fn, *args)))
+            if len(in_flight) >= window:
+                yield _result(*in_flight.popleft())
+        while in_flight:
+            yield _result(*in_flight.popleft())
+    finally:
+        # Abandoned early: drop what has not started yet
+        for _, future in in_flight:
+            future.cancel()
@@ -2,13 +2,17 @@
 from __future__ import annotations
 import re
 from typing import Optional
-from langdetect import detect
+from langdetect import DetectorFactory, detect
 import dateparser
 
 AMOUNT_TOKEN = r"[-+]?\d{1,3}(?:[.,\s]\d{3})*(?:[.,]\d+)?"
 AMOUNT_RE = re.compile(AMOUNT_TOKEN)
 
 
+# langdetect is randomized; seed it so a document always gets the same label pack
+DetectorFactory.seed = 0
+
+
 def detect_language(text: str) -> str:
     try:
         return detect(text)
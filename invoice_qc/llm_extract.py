@@ -0,0 +1,404 @@
+"""Confidence-gated, batched LLM fallback for field extraction.
+
+``parse_raw_invoice_scored`` scores every field it extracts. Only documents
+whose weakest core field is below ``threshold`` go to the LLM, and those
+are sent several per prompt (``batch_size``) with a JSON-only answer format:
+
+- every document is cached by the hash of its text, in memory and
+  optionally in ``cache_dir``, so a re-run never pays twice for the same
+  document
+- at most ``max_concurrency`` prompts are in flight per fallback instance,
+  shared by every caller in the process (API requests, CLI batches)
+- an LLM value only replaces a field the regex extractor was unsure of
+  (below ``REPLACE_BELOW``), and only after it passes the same type checks
+  as the regex value (ISO date, known currency, number)
+
+The model is any callable ``prompt -> str | None``. ``gemini`` uses
+``gemini_fallback._call_gemini`` in JSON mode. ``StubModel`` answers
+locally, for tests and benchmarks.
+
+Configuration: ``INVOICE_QC_LLM_FALLBACK`` (``off``/``gemini``, default
+``off``), ``INVOICE_QC_LLM_CONFIDENCE_THRESHOLD``, ``INVOICE_QC_LLM_BATCH_SIZE``,
+``INVOICE_QC_LLM_MAX_CONCURRENCY``, ``INVOICE_QC_LLM_CACHE_DIR``.
+"""
+from __future__ import annotations
+
+import dataclasses
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Mapping, Optional, Sequence, Tuple
+
+from .config_labels import ALLOWED_CURRENCIES
+from .profiling import stage
+from .records import InvoiceRecord, LineItemRecord
+
+LLM_FALLBACK = os.getenv("INVOICE_QC_LLM_FALLBACK", "off")
+CONFIDENCE_THRESHOLD = float(os.getenv("INVOICE_QC_LLM_CONFIDENCE_THRESHOLD", "0.6"))
+BATCH_SIZE = int(os.getenv("INVOICE_QC_LLM_BATCH_SIZE", "8"))
+MAX_CONCURRENCY = int(os.getenv("INVOICE_QC_LLM_MAX_CONCURRENCY", "2"))
+CACHE_DIR = os.getenv("INVOICE_QC_LLM_CACHE_DIR") or None
+
+FALLBACK_MODES = ["off", "gemini"]
+
+# Fields whose confidence decides whether a document goes to the LLM
+CORE_FIELDS = [
+    "invoice_number",
+    "invoice_date",
+    "seller_name",
+    "buyer_name",
+    "currency",
+    "gross_total",
+]
+# Fields at or above this confidence keep the regex value
+REPLACE_BELOW = 0.7
+
+# Long documents are cut; the header and totals are what matter
+MAX_DOC_CHARS = 8000
+# Bump when the prompt or the answer format changes (invalidates the cache)
+PROMPT_VERSION = "1"
+
+_TEXT_FIELDS = ["invoice_number", "seller_name", "buyer_name"]
+_DATE_FIELDS = ["invoice_date", "due_date"]
+_AMOUNT_FIELDS = ["net_total", "tax_amount", "gross_total"]
+
+PROMPT_HEADER = """You extract fields from invoices.
+
+For EACH document below return one JSON object with these keys:
+"id" (copy it from the document header), "invoice_number", "invoice_date"
+and "due_date" (YYYY-MM-DD), "seller_name", "buyer_name", "currency"
+(ISO 4217 code), "net_total", "tax_amount", "gross_total" (numbers) and
+"line_items" (a list of objects with "description", "quantity",
+"unit_price", "line_total").
+Use null for anything the document does not state. Do not guess.
+
+Reply with ONLY a JSON array of these objects.
+"""
+
+Model = Callable[[str], Optional[str]]
+
+
+def invoice_confidence(confidence: Mapping[str, float]) -> float:
+    """Document confidence: its weakest core field."""
+    return min(confidence.get(f, 0.0) for f in CORE_FIELDS)
+
+
+def build_prompt(docs: Sequence[Tuple[str, str]]) -> str:
+    """Prompt for ``(doc_id, text)`` pairs."""
+    parts = [PROMPT_HEADER]
+    for doc_id, text in docs:
+        parts.append(f"=== DOCUMENT {doc_id} ===\n{text[:MAX_DOC_CHARS]}\n")
+    return "\n".join(parts)
+
+
+def parse_response(text: Optional[str]) -> Dict[str, Dict[str, Any]]:
+    """``{doc_id: fields}`` from a model answer; empty if it is unusable."""
+    if not text:
+        return {}
+    text = text.strip()
+    fenced = re.match(r"^```(?:json)?\s*(.*?)\s*```$", text, re.S)
+    if fenced:
+        text = fenced.group(1)
+    try:
+        data = json.loads(text)
+    except ValueError:
+        return {}
+    if isinstance(data, dict):
+        data = data.get("invoices") or data.get("documents") or [data]
+    if not isinstance(data, list):
+        return {}
+    return {
+        str(item["id"]): item
+        for item in data
+        if isinstance(item, dict) and item.get("id") is not None
+    }
+
+
+def _clean_amount(value: Any) -> Optional[float]:
+    if isinstance(value, bool) or value is None:
+        return None
+    if isinstance(value, (int, float)):
+        return float(value)
+    try:
+        return float(str(value).replace(",", "").strip())
+    except ValueError:
+        return None
+
+
+def _clean_date(value: Any) -> Optional[str]:
+    if not isinstance(value, str):
+        return None
+    try:
+        return date.fromisoformat(value.strip()[:10]).isoformat()
+    except ValueError:
+        return None
+
+
+def _clean_line_items(value: Any) -> Optional[List[LineItemRecord]]:
+    if not isinstance(value, list):
+        return None
+    items = []
+    for item in value:
+        if not isinstance(item, dict) or not str(item.get("description") or "").strip():
+            continue
+        items.append(
+            LineItemRecord(
+                description=str(item["description"]).strip(),
+                quantity=_clean_amount(item.get("quantity")),
+                unit_price=_clean_amount(item.get("unit_price")),
+                line_total=_clean_amount(item.get("line_total")),
+            )
+        )
+    return items or None
+
+
+def clean_fields(fields: Mapping[str, Any]) -> Dict[str, Any]:
+    """Keep only well-typed values from an LLM answer."""
+    clean: Dict[str, Any] = {}
+    for key in _TEXT_FIELDS:
+        value = fields.get(key)
+        if isinstance(value, (str, int)) and str(value).strip():
+            clean[key] = str(value).strip()
+    for key in _DATE_FIELDS:
+        value = _clean_date(fields.get(key))
+        if value is not None:
+            clean[key] = value
+    currency = fields.get("currency")
+    if isinstance(currency, str) and currency.strip().upper() in ALLOWED_CURRENCIES:
+        clean["currency"] = currency.strip().upper()
+    for key in _AMOUNT_FIELDS:
+        value = _clean_amount(fields.get(key))
+        if value is not None:
+            clean[key] = value
+    line_items = _clean_line_items(fields.get("line_items"))
+    if line_items is not None:
+        clean["line_items"] = line_items
+    return clean
+
+
+def merge_fields(
+    record: InvoiceRecord, confidence: Mapping[str, float], fields: Mapping[str, Any]
+) -> InvoiceRecord:
+    """Replace the low-confidence fields of ``record`` with cleaned LLM values."""
+    updates = {
+        key: value
+        for key, value in clean_fields(fields).items()
+        if confidence.get(key, 0.0) < REPLACE_BELOW
+    }
+    if not updates:
+        return record
+    return dataclasses.replace(record, **updates)
+
+
+class LLMCache:
+    """Document-hash -> LLM fields, in memory (LRU) and optionally on disk."""
+
+    def __init__(self, max_entries: int = 10_000, directory: Optional[str] = None) -> None:
+        self.max_entries = max_entries
+        self.directory = Path(directory) if directory else None
+        self._entries: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def key(text: str) -> str:
+        return hashlib.sha256(f"{PROMPT_VERSION}\0{text}".encode("utf-8")).hexdigest()
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            fields = self._entries.get(key)
+            if fields is not None:
+                self._entries.move_to_end(key)
+                return fields
+        if self.directory is None:
+            return None
+        path = self.directory / f"{key}.json"
+        try:
+            fields = json.loads(path.read_text(encoding="utf-8"))
+        except (OSError, ValueError):
+            return None
+        self._remember(key, fields)
+        return fields
+
+    def put(self, key: str, fields: Dict[str, Any]) -> None:
+        self._remember(key, fields)
+        if self.directory is not None:
+            self.directory.mkdir(parents=True, exist_ok=True)
+            tmp = self.directory / f"{key}.json.tmp"
+            tmp.write_text(json.dumps(fields, ensure_ascii=False), encoding="utf-8")
+            os.replace(tmp, self.directory / f"{key}.json")
+
+    def _remember(self, key: str, fields: Dict[str, Any]) -> None:
+        with self._lock:
+            self._entries[key] = fields
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+
+class LLMFallback:
+    def __init__(
+        self,
+        model: Model,
+        threshold: float = CONFIDENCE_THRESHOLD,
+        batch_size: int = BATCH_SIZE,
+        max_concurrency: int = MAX_CONCURRENCY,
+        cache: Optional[LLMCache] = None,
+    ) -> None:
+        self.model = model
+        self.threshold = threshold
+        self.batch_size = max(1, batch_size)
+        self.max_concurrency = max(1, max_concurrency)
+        self.cache = cache if cache is not None else LLMCache()
+        # Shared by every caller of this instance, not just one refine() call
+        self._slots = threading.BoundedSemaphore(self.max_concurrency)
+        self.stats = {"documents": 0, "cache_hits": 0, "llm_calls": 0, "failed": 0}
+        self._stats_lock = threading.Lock()
+
+    def needs_llm(self, confidence: Mapping[str, float]) -> bool:
+        return invoice_confidence(confidence) < self.threshold
+
+    def _count(self, **deltas: int) -> None:
+        with self._stats_lock:
+            for key, delta in deltas.items():
+                self.stats[key] += delta
+
+    def _call(self, batch: Sequence[Tuple[str, str]]) -> Dict[str, Dict[str, Any]]:
+        """One prompt for ``(cache_key, text)`` pairs; returns fields by key."""
+        ids = {f"doc{i}": key for i, (key, _) in enumerate(batch)}
+        prompt = build_prompt([(f"doc{i}", text) for i, (_, text) in enumerate(batch)])
+        with self._slots:
+            answer = self.model(prompt)
+        self._count(llm_calls=1)
+        parsed = parse_response(answer)
+        return {ids[doc_id]: fields for doc_id, fields in parsed.items() if doc_id in ids}
+
+    def extract(self, texts: Sequence[str]) -> List[Optional[Dict[str, Any]]]:
+        """LLM fields for each text (None where the model gave no answer)."""
+        keys = [LLMCache.key(t) for t in texts]
+        found: Dict[str, Dict[str, Any]] = {}
+        missing: Dict[str, str] = {}
+        for key, text in zip(keys, texts):
+            if key in found or key in missing:
+                continue
+            cached = self.cache.get(key)
+            if cached is not None:
+                found[key] = cached
+            else:
+                missing[key] = text
+        self._count(documents=len(texts), cache_hits=len(texts) - len(missing))
+
+        pending = list(missing.items())
+        batches = [
+            pending[i : i + self.batch_size] for i in range(0, len(pending), self.batch_size)
+        ]
+        if batches:
+            with ThreadPoolExecutor(max_workers=min(self.max_concurrency, len(batches))) as pool:
+                for answers in pool.map(self._call, batches):
+                    for key, fields in answers.items():
+                        self.cache.put(key, fields)
+                        found[key] = fields
+        failed = sum(1 for key in missing if key not in found)
+        if failed:
+            self._count(failed=failed)
+        return [found.get(key) for key in keys]
+
+    def refine(
+        self, items: Sequence[Tuple[str, InvoiceRecord, Mapping[str, float]]]
+    ) -> List[InvoiceRecord]:
+        """
+        ``(text, record, confidence)`` -> records, with low-confidence
+        documents re-extracted by the LLM. Output is aligned with ``items``.
+        """
+        return self.refine_checked(items)[0]
+
+    def refine_checked(
+        self, items: Sequence[Tuple[str, InvoiceRecord, Mapping[str, float]]]
+    ) -> Tuple[List[InvoiceRecord], List[int]]:
+        """
+        ``refine``, plus the indexes of the low-confidence documents the LLM
+        gave no answer for (failed call or unusable reply). Those come back
+        unrefined and are worth retrying later.
+        """
+        records = [record for _, record, _ in items]
+        low = [i for i, (_, _, confidence) in enumerate(items) if self.needs_llm(confidence)]
+        if not low:
+            return records, []
+        with stage("llm_fallback"):
+            answers = self.extract([items[i][0] for i in low])
+        unanswered = []
+        for i, fields in zip(low, answers):
+            if fields is None:
+                unanswered.append(i)
+            elif fields:
+                _, record, confidence = items[i]
+                records[i] = merge_fields(record, confidence, fields)
+        return records, unanswered
+
+
+class StubModel:
+    """
+    Local stand-in for the LLM: answers every document of a prompt with
+    ``fields`` after ``latency`` seconds. Counts prompts and documents.
+    """
+
+    def __init__(self, fields: Optional[Mapping[str, Any]] = None, latency: float = 0.0) -> None:
+        self.fields = dict(
+            fields
+            or {
+                "invoice_number": "STUB-1",
+                "invoice_date": "2024-01-01",
+                "seller_name": "Stub Seller",
+                "buyer_name": "Stub Buyer",
+                "currency": "EUR",
+                "net_total": 100.0,
+                "tax_amount": 20.0,
+                "gross_total": 120.0,
+            }
+        )
+        self.latency = latency
+        self.calls = 0
+        self.documents = 0
+        self._lock = threading.Lock()
+
+    def __call__(self, prompt: str) -> Optional[str]:
+        ids = re.findall(r"^=== DOCUMENT (\S+) ===$", prompt, re.M)
+        with self._lock:
+            self.calls += 1
+            self.documents += len(ids)
+        if self.latency:
+            time.sleep(self.latency)
+        return json.dumps([{"id": doc_id, **self.fields} for doc_id in ids])
+
+
+def _gemini_model(prompt: str) -> Optional[str]:
+    # Imported lazily: the module configures the client (and logs) on import
+    from .gemini_fallback import _call_gemini
+
+    return _call_gemini(prompt, json_output=True)
+
+
+_FALLBACKS: Dict[str, LLMFallback] = {}
+_FALLBACKS_LOCK = threading.Lock()
+
+
+def get_fallback(mode: Optional[str] = None) -> Optional[LLMFallback]:
+    """The shared fallback for ``mode`` (default: configured); None when off."""
+    mode = mode or LLM_FALLBACK
+    if mode == "off":
+        return None
+    if mode not in FALLBACK_MODES:
+        raise ValueError(f"Unknown LLM fallback {mode!r}; expected one of {FALLBACK_MODES}")
+    with _FALLBACKS_LOCK:
+        fallback = _FALLBACKS.get(mode)
+        if fallback is None:
+            fallback = _FALLBACKS[mode] = LLMFallback(
+                _gemini_model, cache=LLMCache(directory=CACHE_DIR)
+            )
+        return fallback
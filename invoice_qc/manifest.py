@@ -0,0 +1,191 @@
+"""Incremental extraction backed by a manifest of processed files.
+
+``full-run --incremental`` keeps, per PDF, its size, mtime, content hash and
+the extracted invoice. On the next run only new or changed files are
+re-extracted:
+
+- size and mtime unchanged: the cached invoice is reused without reading
+  the file
+- size or mtime changed: the file is hashed; same hash means it was only
+  touched, so the cached invoice is reused
+- new or different content: the file is extracted again
+- files no longer in the directory are dropped from the manifest
+
+The manifest also records the extraction settings; when those change
+every file is re-extracted. Invoices refined by the LLM fallback are stored
+refined, so they are not sent to the LLM again. Files whose extraction
+failed (timeout, memory limit, crash), or that needed the LLM but got no
+answer from it, are not stored, so the next run tries them again.
+"""
+from __future__ import annotations
+
+import hashlib
+import os
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+from pydantic import TypeAdapter, ValidationError
+
+from .extractor import apply_llm_fallback, extract_document, list_pdf_files
+from .isolation import extract_documents
+from .llm_extract import LLM_FALLBACK, get_fallback
+from .records import InvoiceRecord
+from .sharding import Shard
+
+MANIFEST_VERSION = 1
+DEFAULT_MANIFEST_NAME = ".invoice_qc_manifest.json"
+
+
+@dataclass(slots=True)
+class ManifestEntry:
+    size: int
+    mtime_ns: int
+    sha256: str
+    # None: seen but never extracted (files already in a watched folder
+    # when ``watch`` first started); hash left empty for those
+    invoice: Optional[InvoiceRecord] = None
+
+
+@dataclass(slots=True)
+class Manifest:
+    version: int
+    settings: Dict[str, Optional[str]]
+    files: Dict[str, ManifestEntry]
+
+
+@dataclass(slots=True)
+class IncrementalStats:
+    added: int = 0
+    changed: int = 0
+    unchanged: int = 0
+    removed: int = 0
+    failed: int = 0
+
+
+_MANIFEST = TypeAdapter(Manifest)
+
+
+def _sha256(path: Path) -> str:
+    h = hashlib.sha256()
+    with path.open("rb") as fh:
+        for chunk in iter(lambda: fh.read(1 << 20), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def load_manifest(path: Path) -> Optional[Manifest]:
+    """Return the stored manifest, or None if it is missing or unreadable."""
+    if not path.exists():
+        return None
+    try:
+        manifest = _MANIFEST.validate_json(path.read_bytes())
+    except ValidationError:
+        return None
+    if manifest.version != MANIFEST_VERSION:
+        return None
+    return manifest
+
+
+def save_manifest(path: Path, manifest: Manifest) -> None:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_name(path.name + ".tmp")
+    tmp.write_bytes(_MANIFEST.dump_json(manifest))
+    # Atomic swap so an interrupted run never leaves a truncated manifest
+    os.replace(tmp, path)
+
+
+def extract_records_incremental(
+    pdf_dir: str,
+    manifest_path: Optional[str] = None,
+    backend: Optional[str] = None,
+    line_items_mode: Optional[str] = None,
+    shard: Optional[Shard] = None,
+    llm_fallback: Optional[str] = None,
+    workers: Optional[int] = None,
+) -> Tuple[List[InvoiceRecord], IncrementalStats]:
+    """
+    Same result as ``extract_records_from_dir``, but only new or changed
+    PDFs are extracted; the rest come from the manifest. Each shard keeps
+    its own default manifest.
+    """
+    base = Path(pdf_dir)
+    if manifest_path:
+        mpath = Path(manifest_path)
+    elif shard is not None:
+        mpath = base / f".invoice_qc_manifest.{shard[0]}-of-{shard[1]}.json"
+    else:
+        mpath = base / DEFAULT_MANIFEST_NAME
+    settings = {"pdf_backend": backend, "line_items": line_items_mode}
+    fallback = get_fallback(llm_fallback)
+    if fallback is not None:
+        # Only recorded when on, so existing manifests stay valid
+        settings["llm_fallback"] = llm_fallback or LLM_FALLBACK
+
+    previous = load_manifest(mpath)
+    if previous is None or previous.settings != settings:
+        old_files: Dict[str, ManifestEntry] = {}
+    else:
+        old_files = previous.files
+
+    stats = IncrementalStats()
+    files: Dict[str, ManifestEntry] = {}
+    records: List[Optional[InvoiceRecord]] = []
+    # (index in records, path, size, mtime_ns, sha256) of the files to extract
+    to_extract: List[Tuple[int, Path, int, int, str]] = []
+    pending = []
+    pending_names: List[str] = []
+    listed = set()
+
+    for pdf_path in list_pdf_files(pdf_dir, shard):
+        name = pdf_path.name
+        listed.add(name)
+        st = pdf_path.stat()
+        entry = old_files.get(name)
+        if entry is not None and entry.invoice is None:
+            entry = None
+
+        if entry is not None and entry.size == st.st_size and entry.mtime_ns == st.st_mtime_ns:
+            stats.unchanged += 1
+        else:
+            digest = _sha256(pdf_path)
+            if entry is not None and entry.sha256 == digest:
+                stats.unchanged += 1
+                entry = ManifestEntry(st.st_size, st.st_mtime_ns, digest, entry.invoice)
+            else:
+                if entry is None:
+                    stats.added += 1
+                else:
+                    stats.changed += 1
+                to_extract.append((len(records), pdf_path, st.st_size, st.st_mtime_ns, digest))
+                records.append(None)
+                continue
+
+        files[name] = entry
+        records.append(entry.invoice)
+
+    documents = ((path.name, (path, backend, line_items_mode)) for _, path, _, _, _ in to_extract)
+    extracted = extract_documents(extract_document, documents, workers=workers)
+    for (index, path, size, mtime_ns, digest), (record, confidence, text) in zip(
+        to_extract, extracted
+    ):
+        records[index] = record
+        if record.extraction_error is not None:
+            stats.failed += 1
+            continue
+        files[path.name] = ManifestEntry(size, mtime_ns, digest, record)
+        if fallback is not None and fallback.needs_llm(confidence):
+            pending.append((index, text, record, confidence))
+            pending_names.append(path.name)
+
+    unanswered = set(apply_llm_fallback(records, pending, fallback))
+    for (index, _, _, _), name in zip(pending, pending_names):
+        if index in unanswered:
+            del files[name]
+            stats.failed += 1
+        else:
+            files[name].invoice = records[index]
+
+    stats.removed = sum(1 for name in old_files if name not in listed)
+    save_manifest(mpath, Manifest(version=MANIFEST_VERSION, settings=settings, files=files))
+    return records, stats
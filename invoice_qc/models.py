@@ -36,12 +36,16 @@ class Invoice(BaseModel):
     line_items: List[LineItem] = []
     language: Optional[str] = None
     file_name: Optional[str] = None
+    # Why the document could not be extracted (timeout, memory_limit, ...)
+    extraction_error: Optional[str] = None
 
 
 class InvoiceValidationResult(BaseModel):
     invoice_id: str
     is_valid: bool
     errors: List[str]
+    # Invoice ids this one looks like a resubmission of (near duplicates)
+    possible_duplicates: List[str] = []
 
 
 class BatchValidationSummary(BaseModel):
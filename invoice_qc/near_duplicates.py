@@ -0,0 +1,279 @@
+"""Near-duplicate invoice detection with MinHash and LSH.
+
+The exact duplicate check in ``validate_invoices`` keys on
+``(invoice_number, seller_name, invoice_date)``. A resubmitted invoice
+whose number has OCR noise (``INV-1O01`` vs ``INV-1001``) or whose seller
+name varies (``Acme Ltd.`` vs ``ACME Limited``) gets a different key. Pairwise
+fuzzy matching would be O(n²), so instead:
+
+1. every invoice becomes a set of shingles built from normalized fields:
+   character 3-grams of the invoice number (OCR look-alikes folded), seller
+   and buyer (legal suffixes dropped), plus the date, currency, gross total
+   and line-item description words
+2. a MinHash signature of ``NUM_PERM`` values estimates the Jaccard
+   similarity of two shingle sets
+3. LSH: the signature is cut into ``BANDS`` bands. Invoices sharing any band
+   become candidates. Each bucket member is paired with the bucket's first
+   member only, so a large bucket costs O(k) pairs, not O(k²).
+4. a candidate pair is accepted when the estimated similarity is at
+   least ``THRESHOLD``, the gross totals agree, and either the folded
+   invoice numbers are equal, or the normalized seller and the date are
+   and the folded numbers are one edit apart without a digit changing
+   (a garbled or dropped letter). Recurring and sequential invoices
+   (``INV-2024-001``/``002``) and look-alike invoices of other sellers
+   are not accepted. Pairs with the same exact key are left to the exact
+   check.
+
+Invoices whose extraction failed are left out, as in the exact check.
+Accepted pairs are merged into groups (union-find). Every member of a group
+is reported as ``anomaly: possible_duplicate`` with the other members'
+invoice ids.
+
+Signatures are computed with numpy, ``CHUNK`` invoices and ``PERM_BLOCK``
+permutations at a time: the temporaries are ``PERM_BLOCK`` x (shingles in
+the chunk) uint64 matrices, about 10 MB each at ~40 shingles per invoice.
+Time grows linearly with the batch; without numpy the check is skipped.
+``INVOICE_QC_NEAR_DUPLICATES=0`` turns it off.
+"""
+from __future__ import annotations
+
+import os
+import re
+import zlib
+from typing import Dict, List, Optional, Sequence, Set, Tuple
+
+from .config import EPSILON
+from .records import InvoiceLike
+
+try:
+    import numpy as np
+except Exception:
+    np = None
+
+NEAR_DUPLICATES = os.getenv("INVOICE_QC_NEAR_DUPLICATES", "1").lower() not in ("0", "false", "no")
+POSSIBLE_DUPLICATE_ERROR = "anomaly: possible_duplicate"
+
+NUM_PERM = 64
+BANDS = 16  # 4 rows per band: ~89% recall at similarity 0.6
+THRESHOLD = float(os.getenv("INVOICE_QC_NEAR_DUPLICATE_THRESHOLD", "0.6"))
+# Matched ids listed per invoice
+MAX_MATCHES = 10
+# Invoices hashed per numpy pass, and permutations per pass over their
+# shingles; together they bound the temporary matrices
+CHUNK = 2_000
+PERM_BLOCK = 16
+# Candidate pairs scored per pass
+PAIR_CHUNK = 20_000
+
+_SEED = 1729
+
+_OCR_FOLD = str.maketrans({"o": "0", "q": "0", "i": "1", "l": "1", "s": "5", "b": "8", "z": "2"})
+_NON_ALNUM = re.compile(r"[^0-9a-z]+")
+_WORD = re.compile(r"[0-9a-z]+")
+_LEGAL_SUFFIXES = {
+    "ltd", "limited", "llc", "inc", "corp", "corporation", "co", "company",
+    "gmbh", "ag", "kg", "sa", "sas", "sarl", "bv", "pvt", "plc", "srl", "spa",
+}
+
+
+def fold_invoice_number(value: Optional[str]) -> str:
+    """Lowercase alphanumerics with OCR look-alikes folded (O->0, I/l->1, ...)."""
+    return _NON_ALNUM.sub("", (value or "").lower()).translate(_OCR_FOLD)
+
+
+def normalize_name(value: Optional[str]) -> str:
+    words = [w for w in _WORD.findall((value or "").lower()) if w not in _LEGAL_SUFFIXES]
+    return " ".join(words)
+
+
+def numbers_near_equal(a: str, b: str) -> bool:
+    """
+    Folded numbers equal, or one edit apart where the edit changes no digit:
+    after folding a differing digit means a different invoice.
+    """
+    if a == b:
+        return True
+    if abs(len(a) - len(b)) > 1:
+        return False
+    if len(a) < len(b):
+        a, b = b, a
+    i = 0
+    while i < len(b) and a[i] == b[i]:
+        i += 1
+    if len(a) == len(b):
+        if a[i].isdigit() and b[i].isdigit():
+            return False
+        return a[i + 1 :] == b[i + 1 :]
+    # a has one extra character at i
+    return not a[i].isdigit() and a[i + 1 :] == b[i:]
+
+
+def _grams(prefix: str, value: str) -> Set[str]:
+    if len(value) <= 3:
+        return {prefix + value} if value else set()
+    return {prefix + value[i : i + 3] for i in range(len(value) - 2)}
+
+
+def shingles(inv: InvoiceLike, number: str, seller: str) -> Set[str]:
+    """Shingle set of ``inv``; ``number``/``seller`` are its folded/normalized values."""
+    out = _grams("n:", number)
+    out |= _grams("s:", seller)
+    out |= _grams("b:", normalize_name(inv.buyer_name))
+    if inv.invoice_date:
+        out.add(f"d:{inv.invoice_date}")
+    if inv.currency:
+        out.add(f"c:{inv.currency.upper()}")
+    if inv.gross_total is not None:
+        out.add(f"g:{inv.gross_total:.2f}")
+    for li in inv.line_items[:50]:
+        for word in _WORD.findall((li.description or "").lower()):
+            out.add(f"l:{word}")
+    return out
+
+
+def _permutations():
+    # Multiply-shift hashing: (a * h + b) mod 2**64, top 32 bits; a is odd
+    rng = np.random.default_rng(_SEED)
+    a = rng.integers(0, 2**63, size=(NUM_PERM, 1), dtype=np.uint64) * np.uint64(2) + np.uint64(1)
+    b = rng.integers(0, 2**63, size=(NUM_PERM, 1), dtype=np.uint64)
+    return a, b
+
+
+def minhash_signatures(
+    invoices: Sequence[InvoiceLike], numbers: Sequence[str], sellers: Sequence[str]
+) -> Tuple["np.ndarray", "np.ndarray"]:
+    """
+    ``(NUM_PERM, n)`` uint32 signatures and a mask of invoices that had any
+    shingles. Shingles are built and dropped chunk by chunk.
+    """
+    a, b = _permutations()
+    n = len(invoices)
+    sig = np.full((NUM_PERM, n), np.iinfo(np.uint32).max, dtype=np.uint32)
+    usable = np.zeros(n, dtype=bool)
+    shift = np.uint64(32)
+    for start in range(0, n, CHUNK):
+        stop = min(start + CHUNK, n)
+        chunk = [
+            shingles(invoices[i], numbers[i], sellers[i]) for i in range(start, stop)
+        ]
+        sizes = np.fromiter(map(len, chunk), dtype=np.int64, count=len(chunk))
+        usable[start:stop] = sizes > 0
+        hashes: List[int] = []
+        for s in chunk:
+            hashes.extend(map(zlib.crc32, map(str.encode, s)))
+        if not hashes:
+            continue
+        h = np.asarray(hashes, dtype=np.uint64)
+        present = np.flatnonzero(sizes)
+        starts = np.concatenate(([0], np.cumsum(sizes)[:-1]))[present]
+        for row in range(0, NUM_PERM, PERM_BLOCK):
+            rows = slice(row, row + PERM_BLOCK)
+            values = ((a[rows] * h + b[rows]) >> shift).astype(np.uint32)
+            sig[rows, start + present] = np.minimum.reduceat(values, starts, axis=1)
+    return sig, usable
+
+
+def lsh_candidates(sig: "np.ndarray", usable: "np.ndarray") -> "np.ndarray":
+    """Unique candidate pairs ``(k, 2)`` (``i < j``) sharing at least one band."""
+    rows = NUM_PERM // BANDS
+    index = np.flatnonzero(usable)
+    if len(index) < 2:
+        return np.empty((0, 2), dtype=np.int64)
+    pairs = []
+    for band in range(BANDS):
+        block = sig[band * rows : (band + 1) * rows, index].astype(np.uint64)
+        key = np.zeros(len(index), dtype=np.uint64)
+        for row in block:
+            key = key * np.uint64(1000003) ^ row
+        order = np.argsort(key, kind="stable")
+        sorted_key = key[order]
+        run_start = np.ones(len(order), dtype=bool)
+        run_start[1:] = sorted_key[1:] != sorted_key[:-1]
+        # Pair every bucket member with the bucket's first member
+        first = order[np.maximum.accumulate(np.where(run_start, np.arange(len(order)), 0))]
+        member = ~run_start
+        if member.any():
+            pairs.append(np.stack([index[first[member]], index[order[member]]], axis=1))
+    if not pairs:
+        return np.empty((0, 2), dtype=np.int64)
+    found = np.concatenate(pairs)
+    found.sort(axis=1)
+    # Dedup on one int64 key per pair (much faster than unique(axis=0))
+    n = np.int64(sig.shape[1])
+    key = np.unique(found[:, 0] * n + found[:, 1])
+    return np.stack([key // n, key % n], axis=1)
+
+
+def find_near_duplicates(
+    invoices: Sequence[InvoiceLike], keys: Optional[Sequence[Tuple[str, str, str]]] = None
+) -> Dict[int, List[str]]:
+    """
+    ``{index: matched invoice ids}`` for invoices that look like
+    resubmissions of another invoice in the batch. ``keys`` (the exact
+    duplicate keys, aligned with ``invoices``) excludes exact matches.
+    """
+    if np is None or len(invoices) < 2:
+        return {}
+
+    numbers = [fold_invoice_number(inv.invoice_number) for inv in invoices]
+    sellers = [normalize_name(inv.seller_name) for inv in invoices]
+    sig, usable = minhash_signatures(invoices, numbers, sellers)
+    # Failed extractions are placeholders, not invoices
+    usable &= np.fromiter(
+        (not inv.extraction_error for inv in invoices), dtype=bool, count=len(invoices)
+    )
+    candidates = lsh_candidates(sig, usable)
+    if not len(candidates):
+        return {}
+
+    gross = np.fromiter(
+        (np.nan if inv.gross_total is None else inv.gross_total for inv in invoices),
+        dtype=np.float64,
+        count=len(invoices),
+    )
+    # Estimated Jaccard similarity and equal gross totals (unknown matches
+    # anything), in chunks to bound memory
+    similar = []
+    for start in range(0, len(candidates), PAIR_CHUNK):
+        chunk = candidates[start : start + PAIR_CHUNK]
+        score = (sig[:, chunk[:, 0]] == sig[:, chunk[:, 1]]).mean(axis=0)
+        ga, gb = gross[chunk[:, 0]], gross[chunk[:, 1]]
+        same_total = np.isnan(ga) | np.isnan(gb) | (np.abs(ga - gb) <= EPSILON)
+        similar.append(chunk[(score >= THRESHOLD) & same_total])
+    accepted = np.concatenate(similar)
+
+    parent = list(range(len(invoices)))
+
+    def find(x: int) -> int:
+        while parent[x] != x:
+            parent[x] = parent[parent[x]]
+            x = parent[x]
+        return x
+
+    # A resubmission keeps its number (up to OCR noise), or its seller and
+    # date with the number at most slightly garbled
+    for i, j in accepted.tolist():
+        if keys is not None and keys[i] == keys[j]:
+            continue
+        if (numbers[i] and numbers[i] == numbers[j]) or (
+            sellers[i]
+            and sellers[i] == sellers[j]
+            and invoices[i].invoice_date
+            and invoices[i].invoice_date == invoices[j].invoice_date
+            and numbers_near_equal(numbers[i], numbers[j])
+        ):
+            parent[find(i)] = find(j)
+
+    groups: Dict[int, List[int]] = {}
+    for i in range(len(invoices)):
+        groups.setdefault(find(i), []).append(i)
+
+    matches: Dict[int, List[str]] = {}
+    for members in groups.values():
+        if len(members) < 2:
+            continue
+        for i in members:
+            matches[i] = [
+                invoices[j].invoice_number or "" for j in members if j != i
+            ][:MAX_MATCHES]
+    return matches
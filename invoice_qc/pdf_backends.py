@@ -0,0 +1,209 @@
+"""Interchangeable PDF text backends.
+
+``extract_text_from_pdf`` used to call pdfplumber directly. pdfplumber is pure
+Python and by far the slowest stage for born-digital PDFs, so text extraction
+now goes through a small backend interface:
+
+- ``pdfplumber``: the original extractor, used as the reference output.
+- ``pdfium``: pypdfium2 (PDFium, native code). Text runs are regrouped into
+  visual lines so the output lines up with pdfplumber's.
+- ``pdfminer``: raw pdfminer.six layout analysis (ships with pdfplumber).
+- ``auto``: try the fastest available backend and fall back to pdfplumber
+  when it fails or returns almost no text for the document.
+
+The backend is chosen with the ``INVOICE_QC_PDF_BACKEND`` environment
+variable (default ``auto``) or per call.
+
+A document is a path or the PDF bytes themselves (an archive member read
+into memory), see ``PdfSource``.
+"""
+from __future__ import annotations
+
+import io
+import os
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple, Union
+
+import pdfplumber
+
+try:
+    import pypdfium2 as pdfium
+except Exception:
+    pdfium = None
+
+DEFAULT_BACKEND = os.getenv("INVOICE_QC_PDF_BACKEND", "auto")
+
+# A fast backend returning fewer characters than this per page is treated as
+# a miss (scanned page, odd encoding) and the document is re-read with
+# pdfplumber in ``auto`` mode.
+MIN_CHARS_PER_PAGE = 20
+
+PdfSource = Union[Path, bytes]
+
+
+def pdf_input(source: PdfSource):
+    """What pdfplumber/pdfminer open: a path string or a file object over the bytes."""
+    return io.BytesIO(source) if isinstance(source, bytes) else str(source)
+
+
+def _pdfium_input(source: PdfSource):
+    return source if isinstance(source, bytes) else str(source)
+
+
+class PdfTextBackend:
+    """Base class: turn a PDF into one text string per page."""
+
+    name = "base"
+
+    def is_available(self) -> bool:
+        return True
+
+    def extract_pages(self, pdf_path: PdfSource) -> List[str]:
+        raise NotImplementedError
+
+
+class PdfplumberBackend(PdfTextBackend):
+    name = "pdfplumber"
+
+    def extract_pages(self, pdf_path: PdfSource) -> List[str]:
+        with pdfplumber.open(pdf_input(pdf_path)) as pdf:
+            return [page.extract_text() or "" for page in pdf.pages]
+
+
+class PdfiumBackend(PdfTextBackend):
+    """pypdfium2 text extraction with runs regrouped into visual lines.
+
+    PDFium returns text in content-stream order. The rectangles of its text
+    runs are sorted top-to-bottom and left-to-right instead, and runs that
+    overlap vertically are joined into one line, like pdfplumber does.
+    """
+
+    name = "pdfium"
+
+    def is_available(self) -> bool:
+        return pdfium is not None
+
+    def extract_pages(self, pdf_path: PdfSource) -> List[str]:
+        doc = pdfium.PdfDocument(_pdfium_input(pdf_path))
+        try:
+            pages: List[str] = []
+            for index in range(len(doc)):
+                page = doc[index]
+                textpage = page.get_textpage()
+                try:
+                    pages.append(self._page_text(textpage))
+                finally:
+                    textpage.close()
+                    page.close()
+            return pages
+        finally:
+            doc.close()
+
+    @staticmethod
+    def _page_text(textpage) -> str:
+        runs: List[Tuple[float, float, float, str]] = []
+        for i in range(textpage.count_rects()):
+            left, bottom, right, top = textpage.get_rect(i)
+            text = textpage.get_text_bounded(left, bottom, right, top).strip()
+            if text:
+                runs.append((top, bottom, left, text))
+
+        # PDF coordinates grow upwards: highest ``top`` first
+        runs.sort(key=lambda r: (-r[0], r[2]))
+
+        lines: List[str] = []
+        current: List[Tuple[float, str]] = []
+        line_top = line_bottom = 0.0
+        for top, bottom, left, text in runs:
+            overlap = min(top, line_top) - max(bottom, line_bottom)
+            height = min(top - bottom, line_top - line_bottom)
+            if current and height > 0 and overlap >= 0.5 * height:
+                current.append((left, text))
+                line_top = max(line_top, top)
+                line_bottom = min(line_bottom, bottom)
+                continue
+            if current:
+                lines.append(" ".join(t for _, t in sorted(current)))
+            current = [(left, text)]
+            line_top, line_bottom = top, bottom
+        if current:
+            lines.append(" ".join(t for _, t in sorted(current)))
+        return "\n".join(lines)
+
+
+class PdfminerBackend(PdfTextBackend):
+    name = "pdfminer"
+
+    def extract_pages(self, pdf_path: PdfSource) -> List[str]:
+        from pdfminer.high_level import extract_text
+
+        text = extract_text(pdf_input(pdf_path))
+        pages = text.split("\f")
+        # pdfminer terminates every page with a form feed
+        if pages and not pages[-1].strip():
+            pages.pop()
+        return [p.strip("\n") for p in pages]
+
+
+BACKENDS: Dict[str, PdfTextBackend] = {
+    b.name: b for b in (PdfplumberBackend(), PdfiumBackend(), PdfminerBackend())
+}
+
+# Order in which ``auto`` tries backends; pdfplumber is always the fallback
+AUTO_ORDER = ["pdfium", "pdfplumber"]
+
+
+def get_backend(name: str) -> PdfTextBackend:
+    backend = BACKENDS.get(name)
+    if backend is None:
+        raise ValueError(
+            f"Unknown PDF backend {name!r}; expected one of "
+            f"{sorted(BACKENDS) + ['auto']}"
+        )
+    if not backend.is_available():
+        raise ValueError(f"PDF backend {name!r} is not installed")
+    return backend
+
+
+def count_pdf_pages(pdf_path: PdfSource) -> int:
+    """Page count without extracting any text (PDFium when available)."""
+    if pdfium is not None:
+        try:
+            doc = pdfium.PdfDocument(_pdfium_input(pdf_path))
+            try:
+                return len(doc)
+            finally:
+                doc.close()
+        except Exception:
+            pass
+    with pdfplumber.open(pdf_input(pdf_path)) as pdf:
+        return len(pdf.pages)
+
+
+def _looks_complete(pages: List[str]) -> bool:
+    chars = sum(len(p.strip()) for p in pages)
+    return chars >= MIN_CHARS_PER_PAGE * max(len(pages), 1)
+
+
+def extract_pdf_pages(
+    pdf_path: PdfSource, backend: Optional[str] = None
+) -> Tuple[str, List[str]]:
+    """Return ``(backend_name, page_texts)`` for ``pdf_path``."""
+    name = backend or DEFAULT_BACKEND
+    if name != "auto":
+        return name, get_backend(name).extract_pages(pdf_path)
+
+    for candidate in AUTO_ORDER:
+        impl = BACKENDS[candidate]
+        if not impl.is_available():
+            continue
+        if candidate == "pdfplumber":
+            break
+        try:
+            pages = impl.extract_pages(pdf_path)
+        except Exception:
+            continue
+        if _looks_complete(pages):
+            return candidate, pages
+
+    return "pdfplumber", BACKENDS["pdfplumber"].extract_pages(pdf_path)
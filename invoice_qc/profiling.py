@@ -0,0 +1,196 @@
+"""Opt-in profiling of a single CLI run or API request.
+
+``profiled()`` opens a profiling session for the current context: cProfile
+runs for the duration and every ``stage()`` block entered from the same
+context records its wall time. Stages nest; a stage entered inside another
+is reported as ``outer/inner``.
+
+The pipeline marks its main steps (``extract_text_from_pdf`` and its
+sub-steps, ``extract_text_from_image``, ``parse_raw_invoice``,
+``validate_invoices``). Without an active session ``stage()`` only does a
+context-variable lookup, so the markers stay in place at no real cost.
+
+cProfile only follows the thread it was enabled in, so ``profiled()`` has to
+be entered in the thread that does the work. For the same reason
+``isolation.extract_documents`` extracts in-process while a session is
+active (``profiling_active()``). A profile is saved as a pstats
+file (``python -m pstats``, snakeviz, ...); ``summary()`` gives the per-stage
+breakdown and the top functions as plain data.
+
+API profiling is off unless ``INVOICE_QC_PROFILING`` is set to ``1``. When
+``INVOICE_QC_PROFILE_TOKEN`` is also set, a request must present that token.
+Saved profiles go to ``INVOICE_QC_PROFILE_DIR``.
+"""
+from __future__ import annotations
+
+import cProfile
+import io
+import os
+import pstats
+import tempfile
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional
+
+PROFILING_ENABLED = os.getenv("INVOICE_QC_PROFILING", "0").lower() in ("1", "true", "yes")
+PROFILE_TOKEN = os.getenv("INVOICE_QC_PROFILE_TOKEN") or None
+PROFILE_DIR = os.getenv(
+    "INVOICE_QC_PROFILE_DIR", os.path.join(tempfile.gettempdir(), "invoice_qc_profiles")
+)
+
+# Functions listed in summary(), by cumulative time
+TOP_FUNCTIONS = 25
+
+
+@dataclass(slots=True)
+class StageTiming:
+    calls: int = 0
+    seconds: float = 0.0
+
+
+class ProfileSession:
+    def __init__(self) -> None:
+        self.stages: Dict[str, StageTiming] = {}
+        self.wall_seconds = 0.0
+        self.profiler: Optional[cProfile.Profile] = cProfile.Profile()
+        self._stack: List[str] = []
+
+    def _timing(self, name: str) -> StageTiming:
+        # Created on entry so outer stages are listed before their children
+        timing = self.stages.get(name)
+        if timing is None:
+            timing = self.stages[name] = StageTiming()
+        return timing
+
+    def stage_breakdown(self) -> Dict[str, Dict]:
+        wall = self.wall_seconds or 1.0
+        return {
+            name: {
+                "calls": t.calls,
+                "seconds": round(t.seconds, 6),
+                "share": round(t.seconds / wall, 4),
+            }
+            for name, t in self.stages.items()
+        }
+
+    def top_functions(self, limit: int = TOP_FUNCTIONS) -> List[Dict]:
+        if self.profiler is None:
+            return []
+        stats = pstats.Stats(self.profiler, stream=io.StringIO())
+        stats.sort_stats(pstats.SortKey.CUMULATIVE)
+        rows = []
+        for func in stats.fcn_list[:limit]:
+            _, ncalls, tottime, cumtime, _ = stats.stats[func]
+            filename, lineno, funcname = func
+            rows.append(
+                {
+                    "function": f"{filename}:{lineno}({funcname})",
+                    "calls": ncalls,
+                    "tottime": round(tottime, 6),
+                    "cumtime": round(cumtime, 6),
+                }
+            )
+        return rows
+
+    def summary(self) -> Dict:
+        return {
+            "wall_seconds": round(self.wall_seconds, 6),
+            "stages": self.stage_breakdown(),
+            "top_functions": self.top_functions(),
+        }
+
+    def format_text(self, limit: int = TOP_FUNCTIONS) -> str:
+        """Stage table followed by the usual pstats listing."""
+        lines = [f"Wall time: {self.wall_seconds:.3f}s", "Stages:"]
+        for name, t in self.stages.items():
+            share = t.seconds / (self.wall_seconds or 1.0)
+            lines.append(f"  {name:<45} {t.calls:>6} calls {t.seconds:>9.3f}s {share:>7.1%}")
+        if self.profiler is not None:
+            out = io.StringIO()
+            stats = pstats.Stats(self.profiler, stream=out)
+            stats.sort_stats(pstats.SortKey.CUMULATIVE).print_stats(limit)
+            lines.append(out.getvalue())
+        return "\n".join(lines)
+
+    def save(self, path: Path) -> Optional[Path]:
+        """Write the cProfile data as a pstats file; None if there is none."""
+        if self.profiler is None:
+            return None
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self.profiler.dump_stats(str(path))
+        return path
+
+
+_CURRENT: ContextVar[Optional[ProfileSession]] = ContextVar("invoice_qc_profile", default=None)
+
+
+@contextmanager
+def stage(name: str) -> Iterator[None]:
+    """Time a pipeline step when a profiling session is active."""
+    session = _CURRENT.get()
+    if session is None:
+        yield
+        return
+    session._stack.append(name)
+    timing = session._timing("/".join(session._stack))
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        timing.calls += 1
+        timing.seconds += time.perf_counter() - start
+        session._stack.pop()
+
+
+def profiling_active() -> bool:
+    """Whether a ``profiled()`` session is open in the current context."""
+    return _CURRENT.get() is not None
+
+
+@contextmanager
+def profiled(enabled: bool = True) -> Iterator[Optional[ProfileSession]]:
+    """Profile the enclosed block; yields the session (None when disabled)."""
+    if not enabled:
+        yield None
+        return
+    session = ProfileSession()
+    token = _CURRENT.set(session)
+    try:
+        session.profiler.enable()
+    except ValueError:
+        # Another profiler already owns this thread; keep the stage timings
+        session.profiler = None
+    start = time.perf_counter()
+    try:
+        yield session
+    finally:
+        if session.profiler is not None:
+            session.profiler.disable()
+        session.wall_seconds = time.perf_counter() - start
+        _CURRENT.reset(token)
+
+
+def profile_requested(value: Optional[str]) -> bool:
+    """
+    Whether an API request asked for profiling (header or query value).
+
+    Raises PermissionError when it asked but profiling is not allowed.
+    """
+    if not value or value.lower() in ("0", "false", "no"):
+        return False
+    if not PROFILING_ENABLED:
+        raise PermissionError("Profiling is disabled on this server (INVOICE_QC_PROFILING)")
+    if PROFILE_TOKEN is not None and value != PROFILE_TOKEN:
+        raise PermissionError("Invalid profiling token")
+    return True
+
+
+def save_request_profile(session: ProfileSession, label: str) -> Optional[Path]:
+    """Save under ``PROFILE_DIR`` with a timestamped, label-based name."""
+    stamp = time.strftime("%Y%m%d-%H%M%S")
+    name = f"{stamp}-{label}-{os.getpid()}-{time.perf_counter_ns() % 1_000_000:06d}.prof"
+    return session.save(Path(PROFILE_DIR) / name)
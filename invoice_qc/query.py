@@ -0,0 +1,415 @@
+"""Local aggregate queries over a batch of extracted invoices.
+
+Questions like "total tax by seller" or "how many invoices are in EUR" used
+to go to Gemini together with the whole JSON dump. Sums and counts are
+computed exactly here instead:
+
+- ``InvoiceQueryEngine`` precomputes, once per batch, counts and
+  ``net_total``/``tax_amount``/``gross_total`` sums grouped by seller,
+  buyer, currency, month and year, plus the batch ``error_counts``
+- ``query()`` is the structured interface (used by ``POST /query``)
+- ``answer()`` is a small English intent matcher for ``/chat-direct``; it
+  returns None for anything it does not recognise so the question goes to
+  the LLM as before. Every content word of the question must be a known
+  metric, dimension or filter; "how many invoices are overdue" has a
+  condition the engine cannot apply, so it is not answered locally. A currency, month or year the batch does not contain
+  is still applied as a filter (the exact answer is 0); a quoted or
+  capitalised name that is no seller or buyer of the batch makes it
+  return None.
+
+Amounts are always summed per currency; adding EUR to INR would not be an
+exact answer.
+"""
+from __future__ import annotations
+
+import re
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Mapping, Optional, Sequence
+
+from .config_labels import ALLOWED_CURRENCIES, CURRENCY_SYMBOLS
+
+METRICS = ["count", "net_total", "tax_amount", "gross_total"]
+AMOUNT_METRICS = METRICS[1:]
+
+# group name -> invoice field (month and year are derived from invoice_date)
+DIMENSIONS = {
+    "seller": "seller_name",
+    "buyer": "buyer_name",
+    "currency": "currency",
+    "month": "invoice_date",
+    "year": "invoice_date",
+}
+GROUP_BYS = [*DIMENSIONS, "error_code"]
+
+UNKNOWN = "(unknown)"
+
+
+@dataclass
+class Aggregate:
+    count: int = 0
+    # metric -> currency -> sum
+    sums: Dict[str, Dict[str, float]] = field(default_factory=dict)
+
+    def add(self, inv: Mapping[str, Any]) -> None:
+        self.count += 1
+        currency = inv.get("currency") or UNKNOWN
+        for metric in AMOUNT_METRICS:
+            value = inv.get(metric)
+            if value is None:
+                continue
+            per_currency = self.sums.setdefault(metric, {})
+            per_currency[currency] = per_currency.get(currency, 0.0) + float(value)
+
+    def value(self, metric: str):
+        if metric == "count":
+            return self.count
+        return {cur: round(v, 2) for cur, v in self.sums.get(metric, {}).items()}
+
+
+def _group_key(inv: Mapping[str, Any], dimension: str) -> str:
+    raw = inv.get(DIMENSIONS[dimension])
+    if not raw:
+        return UNKNOWN
+    if dimension == "month":
+        return str(raw)[:7]
+    if dimension == "year":
+        return str(raw)[:4]
+    return str(raw).strip()
+
+
+class InvoiceQueryEngine:
+    def __init__(
+        self,
+        invoices: Sequence[Mapping[str, Any]],
+        summary: Optional[Mapping[str, Any]] = None,
+    ) -> None:
+        self.invoices = list(invoices)
+        self.summary = dict(summary or {})
+        self.error_counts: Dict[str, int] = dict(self.summary.get("error_counts") or {})
+
+        self.total = Aggregate()
+        self.groups: Dict[str, Dict[str, Aggregate]] = {d: {} for d in DIMENSIONS}
+        for inv in self.invoices:
+            self.total.add(inv)
+            for dimension, groups in self.groups.items():
+                key = _group_key(inv, dimension)
+                agg = groups.get(key)
+                if agg is None:
+                    agg = groups[key] = Aggregate()
+                agg.add(inv)
+
+    # -----------------------------------------------------
+    # structured queries
+    # -----------------------------------------------------
+    def _filtered(self, filters: Mapping[str, str]) -> List[Mapping[str, Any]]:
+        wanted = {d: str(v).strip().lower() for d, v in filters.items()}
+        return [
+            inv
+            for inv in self.invoices
+            if all(_group_key(inv, d).lower() == v for d, v in wanted.items())
+        ]
+
+    def query(
+        self,
+        metric: str = "count",
+        group_by: Optional[str] = None,
+        filters: Optional[Mapping[str, str]] = None,
+    ) -> Dict[str, Any]:
+        """
+        Aggregate ``metric`` over the batch, optionally grouped and filtered.
+
+        Raises ValueError for unknown metrics/dimensions.
+        """
+        filters = dict(filters or {})
+        if metric not in METRICS:
+            raise ValueError(f"Unknown metric {metric!r}; expected one of {METRICS}")
+        if group_by is not None and group_by not in GROUP_BYS:
+            raise ValueError(f"Unknown group_by {group_by!r}; expected one of {GROUP_BYS}")
+        for dimension in filters:
+            if dimension not in DIMENSIONS:
+                raise ValueError(
+                    f"Unknown filter {dimension!r}; expected one of {list(DIMENSIONS)}"
+                )
+
+        if group_by == "error_code":
+            if metric != "count" or filters:
+                raise ValueError("error_code only supports an unfiltered count")
+            rows = [
+                {"group": code, "value": count}
+                for code, count in sorted(self.error_counts.items(), key=lambda kv: -kv[1])
+            ]
+            return {"metric": metric, "group_by": group_by, "filters": filters, "rows": rows}
+
+        if not filters:
+            total = self.total
+            groups = self.groups[group_by] if group_by else {}
+        elif len(filters) == 1 and not group_by:
+            # Single filter: the precomputed group is the answer
+            ((dimension, value),) = filters.items()
+            wanted = str(value).strip().lower()
+            total = next(
+                (agg for key, agg in self.groups[dimension].items() if key.lower() == wanted),
+                Aggregate(),
+            )
+            groups = {}
+        else:
+            total = Aggregate()
+            groups: Dict[str, Aggregate] = {}
+            for inv in self._filtered(filters):
+                total.add(inv)
+                if group_by:
+                    groups.setdefault(_group_key(inv, group_by), Aggregate()).add(inv)
+
+        rows = [
+            {"group": key, "count": agg.count, "value": agg.value(metric)}
+            for key, agg in sorted(groups.items(), key=lambda kv: -kv[1].count)
+        ]
+        return {
+            "metric": metric,
+            "group_by": group_by,
+            "filters": filters,
+            "total": {"count": total.count, "value": total.value(metric)},
+            "rows": rows,
+        }
+
+    # -----------------------------------------------------
+    # natural-language intent matching
+    # -----------------------------------------------------
+    _OPEN_ENDED = re.compile(r"\b(why|explain|describe|summari[sz]e|compare|suggest|should)\b")
+    _COUNT = re.compile(r"\b(how many|count|number of)\b")
+    _AGGREGATE = re.compile(r"\b(total|sum|how much)\b")
+    _GROUP = re.compile(
+        r"\b(?:by|per|for each|each|grouped by)\s+"
+        r"(seller|vendor|supplier|buyer|customer|client|currency|month|year|error(?:\s*code)?)s?\b"
+    )
+    _GROUP_ALIASES = {
+        "vendor": "seller",
+        "supplier": "seller",
+        "customer": "buyer",
+        "client": "buyer",
+        "error": "error_code",
+        "error code": "error_code",
+        "errorcode": "error_code",
+    }
+    _METRIC_WORDS = [
+        (re.compile(r"\b(tax|vat|gst)\b"), "tax_amount"),
+        (re.compile(r"\b(net|subtotal)\b"), "net_total"),
+        (re.compile(r"\b(gross|grand total|amount|value|revenue|spend)\b"), "gross_total"),
+    ]
+    _VALIDITY = re.compile(r"\b(in)?valid\b")
+    _ERRORS = re.compile(r"\b(errors?|issues?|problems?)\b")
+    _NEGATION = re.compile(r"\b(not|no|non|without|never)\b|n't\b")
+    _INVOICES = re.compile(r"\binvoices?\b")
+
+    # Entities named in the question: quoted, or capitalised words after a
+    # preposition ("from Acme Corp", "billed to Beta Ltd")
+    _QUOTED = re.compile(r"[\"“]([^\"”]+)[\"”]|(?<!\w)'([^']+)'(?!\w)")
+    _CAPITALISED = re.compile(
+        r"\b(?:from|by|to|for|of|with)\s+([A-Z][\w&.\-]*(?:\s+(?:&\s+)?[A-Z][\w&.\-]*)*)"
+    )
+    _DATE = re.compile(r"(?<![\w-])\d{4}-\d{2}-\d{2}(?![\w-])")
+    _YEAR_MONTH = re.compile(r"(?<![\w-])(\d{4})-(\d{2})(?![\w-])")
+    _MONTH_NAMES = {
+        name: index
+        for index, names in enumerate(
+            [
+                ("january", "jan"), ("february", "feb"), ("march", "mar"), ("april", "apr"),
+                ("may",), ("june", "jun"), ("july", "jul"), ("august", "aug"),
+                ("september", "sep", "sept"), ("october", "oct"), ("november", "nov"),
+                ("december", "dec"),
+            ],
+            start=1,
+        )
+        for name in names
+    }
+    _MONTH_NAME = re.compile(
+        r"\b(" + "|".join(sorted(_MONTH_NAMES, key=len, reverse=True)) + r")\b\.?(?:\s+(\d{4})\b)?"
+    )
+    _YEAR = re.compile(r"(?<![\w-])((?:19|20)\d{2})(?![\w-])")
+
+    # Words that carry no condition: question scaffolding and the nouns the
+    # intents above already cover
+    _FILLER = frozenset(
+        """
+        a all altogether an and any are aren across at be been batch bills by can count
+        current currently did didn do documents does doesn don each far for from get give
+        got grouped had has have here how i in invoice invoices is isn it its list many me
+        much my number of on our overall please per s show so some sum t tell that the
+        there these this those to total uploaded we were what whats with you
+        """.split()
+    )
+    _WORD = re.compile(r"[^\W_]+")
+
+    def _detect_filters(self, question: str) -> Optional[Dict[str, str]]:
+        """Filters named in the question; None if one cannot be resolved."""
+        q = question.lower()
+        filters: Dict[str, str] = {}
+
+        currencies = {c for c in self.groups["currency"] if c != UNKNOWN} | ALLOWED_CURRENCIES
+        for currency in currencies:
+            if re.search(rf"\b{re.escape(currency.lower())}\b", q):
+                filters["currency"] = currency
+        for symbol, currency in CURRENCY_SYMBOLS.items():
+            if symbol in q:
+                filters["currency"] = currency
+
+        names = {
+            dimension: [n for n in self.groups[dimension] if n != UNKNOWN and len(n) > 2]
+            for dimension in ("seller", "buyer")
+        }
+        for dimension, candidates in names.items():
+            for name in candidates:
+                if name.lower() in q:
+                    filters[dimension] = name
+        mentioned = [m.group(1) or m.group(2) for m in self._QUOTED.finditer(question)]
+        mentioned += [m.group(1) for m in self._CAPITALISED.finditer(question)]
+        for entity in mentioned:
+            entity = entity.strip().lower()
+            if (
+                not entity
+                or entity in self._GROUP_ALIASES
+                or entity.rstrip("s") in DIMENSIONS
+                or entity.upper() in currencies
+                or self._MONTH_NAME.fullmatch(entity)
+                or any(pattern.fullmatch(entity) for pattern, _ in self._METRIC_WORDS)
+                or any(n.lower() in entity for c in names.values() for n in c)
+            ):
+                continue
+            return None  # a seller/buyer this batch does not have
+
+        if self._DATE.search(q):
+            return None  # single days are not a dimension
+        year_month = self._YEAR_MONTH.search(q)
+        month_name = self._MONTH_NAME.search(q)
+        if month_name and month_name.group(1) == "may" and not month_name.group(2):
+            # "may" is only a month after a preposition ("in May")
+            if not re.search(r"\b(?:in|for|during|of|since)\s+may\b", q):
+                month_name = None
+        if year_month:
+            filters["month"] = f"{year_month.group(1)}-{year_month.group(2)}"
+        elif month_name:
+            if not month_name.group(2):
+                return None  # "in March": of which year?
+            filters["month"] = f"{month_name.group(2)}-{self._MONTH_NAMES[month_name.group(1)]:02d}"
+        else:
+            year = self._YEAR.search(q)
+            if year:
+                filters["year"] = year.group(1)
+        return filters
+
+    def _asks_invalid(self, q: str) -> bool:
+        # "invalid" / "with errors", flipped by "not" / "without" / "no"
+        about_invalid = "invalid" in q or not self._VALIDITY.search(q)
+        return about_invalid != bool(self._NEGATION.search(q))
+
+    def _fully_understood(self, question: str) -> bool:
+        """True if no word of ``question`` is left after removing everything known."""
+        q = " ".join(question.lower().split())
+        for quoted in self._QUOTED.finditer(q):
+            q = q.replace(quoted.group(0), " ")
+        names = [
+            n.lower() for d in ("seller", "buyer") for n in self.groups[d] if n != UNKNOWN
+        ]
+        for name in sorted(names, key=len, reverse=True):
+            q = q.replace(name, " ")
+        for symbol in CURRENCY_SYMBOLS:
+            q = q.replace(symbol, " ")
+        currencies = {c for c in self.groups["currency"] if c != UNKNOWN} | ALLOWED_CURRENCIES
+        patterns = [
+            self._COUNT, self._AGGREGATE, self._GROUP, self._VALIDITY, self._ERRORS,
+            self._NEGATION, self._DATE, self._YEAR_MONTH, self._MONTH_NAME, self._YEAR,
+            *(pattern for pattern, _ in self._METRIC_WORDS),
+            re.compile(r"\b(" + "|".join(re.escape(c.lower()) for c in currencies) + r")\b"),
+        ]
+        for pattern in patterns:
+            q = pattern.sub(" ", q)
+        return all(word in self._FILLER for word in self._WORD.findall(q))
+
+    def _mentions_single_invoice(self, q: str) -> bool:
+        for inv in self.invoices:
+            number = str(inv.get("invoice_number") or "").strip().lower()
+            if len(number) > 2 and number in q:
+                return True
+        return False
+
+    def answer(self, question: str) -> Optional[str]:
+        """Answer aggregate questions locally; None means "ask the LLM"."""
+        q = " ".join(question.lower().split())
+        if self._OPEN_ENDED.search(q) or self._mentions_single_invoice(q):
+            return None
+
+        is_count = bool(self._COUNT.search(q))
+        is_aggregate = bool(self._AGGREGATE.search(q))
+        if not (is_count or is_aggregate):
+            return None
+
+        group_match = self._GROUP.search(q)
+        group_by = None
+        if group_match:
+            word = group_match.group(1)
+            group_by = self._GROUP_ALIASES.get(word, word)
+
+        filters = self._detect_filters(question)
+        if filters is None or not self._fully_understood(question):
+            return None
+
+        # Validity / error questions come straight from the summary, which
+        # is for the whole batch. "How many invoices have errors?" counts
+        # invoices; "how many errors?" is the breakdown by error code.
+        mentions_errors = bool(self._ERRORS.search(q))
+        counts_invoices = not mentions_errors or bool(self._INVOICES.search(q))
+        if (
+            is_count
+            and not group_by
+            and (self._VALIDITY.search(q) or (mentions_errors and counts_invoices))
+        ):
+            if filters or not self.summary:
+                return None
+            total = self.summary.get("total_invoices", 0)
+            if self._asks_invalid(q):
+                return f"{self.summary.get('invalid_invoices', 0)} of {total} invoices are invalid."
+            return f"{self.summary.get('valid_invoices', 0)} of {total} invoices are valid."
+        if mentions_errors and group_by in (None, "error_code"):
+            if filters or self._NEGATION.search(q):
+                return None
+            group_by = "error_code"
+            is_count = True
+
+        metric = "count"
+        if not is_count:
+            metric = next((m for pattern, m in self._METRIC_WORDS if pattern.search(q)), None)
+            if metric is None:
+                return None
+
+        if group_by in filters:
+            filters.pop(group_by)
+        try:
+            result = self.query(metric, group_by, filters)
+        except ValueError:
+            return None
+        return format_result(result)
+
+
+def _format_value(metric: str, value) -> str:
+    if metric == "count":
+        return str(value)
+    if not value:
+        return "0.00"
+    return " + ".join(f"{cur} {amount:,.2f}" for cur, amount in sorted(value.items()))
+
+
+def format_result(result: Mapping[str, Any]) -> str:
+    metric = result["metric"]
+    label = "Number of invoices" if metric == "count" else f"Total {metric}"
+    scope = ", ".join(f"{k} = {v}" for k, v in result["filters"].items())
+    header = label + (f" ({scope})" if scope else "")
+
+    if not result["group_by"]:
+        return f"{header}: {_format_value(metric, result['total']['value'])}"
+
+    lines = [f"{header} by {result['group_by']}:"]
+    if not result["rows"]:
+        lines.append("- none")
+    for row in result["rows"]:
+        lines.append(f"- {row['group']}: {_format_value(metric, row['value'])}")
+    return "\n".join(lines)
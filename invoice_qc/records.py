@@ -0,0 +1,138 @@
+"""Compact internal invoice representation for the bulk pipeline.
+
+``Invoice``/``LineItem`` pydantic models are the public schema of the API and
+the CLI files, but building one model per invoice and per line item dominates
+memory and CPU on batches with hundreds of thousands of line items. The
+extractor and the validator work on these slotted dataclasses instead, which
+mirror the model fields one to one. Conversion to and from the models only
+happens at the API and CLI boundaries.
+
+Lists of invoices are validated and serialized in bulk through the
+``INVOICE_RECORDS`` TypeAdapter, straight from/to JSON bytes.
+"""
+from __future__ import annotations
+
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Sequence, Union
+
+from pydantic import TypeAdapter
+
+from .models import Invoice, LineItem
+
+
+@dataclass(slots=True)
+class LineItemRecord:
+    description: str
+    quantity: Optional[float] = None
+    unit_price: Optional[float] = None
+    line_total: Optional[float] = None
+
+    def to_model(self) -> LineItem:
+        return LineItem.model_construct(
+            description=self.description,
+            quantity=self.quantity,
+            unit_price=self.unit_price,
+            line_total=self.line_total,
+        )
+
+
+@dataclass(slots=True, kw_only=True)
+class InvoiceRecord:
+    # Same required/optional split as models.Invoice
+    invoice_number: Optional[str]
+    invoice_date: Optional[str]  # ISO date string
+    due_date: Optional[str] = None
+
+    seller_name: Optional[str]
+    buyer_name: Optional[str]
+
+    currency: Optional[str] = None
+    net_total: Optional[float] = None
+    tax_amount: Optional[float] = None
+    gross_total: Optional[float] = None
+
+    payment_terms: Optional[str] = None
+    external_reference: Optional[str] = None
+
+    line_items: List[LineItemRecord] = field(default_factory=list)
+    language: Optional[str] = None
+    file_name: Optional[str] = None
+    extraction_error: Optional[str] = None
+
+    @classmethod
+    def from_model(cls, inv: Invoice) -> "InvoiceRecord":
+        return cls(
+            invoice_number=inv.invoice_number,
+            invoice_date=inv.invoice_date,
+            due_date=inv.due_date,
+            seller_name=inv.seller_name,
+            buyer_name=inv.buyer_name,
+            currency=inv.currency,
+            net_total=inv.net_total,
+            tax_amount=inv.tax_amount,
+            gross_total=inv.gross_total,
+            payment_terms=inv.payment_terms,
+            external_reference=inv.external_reference,
+            line_items=[
+                LineItemRecord(li.description, li.quantity, li.unit_price, li.line_total)
+                for li in inv.line_items
+            ],
+            language=inv.language,
+            file_name=inv.file_name,
+            extraction_error=inv.extraction_error,
+        )
+
+    def to_model(self) -> Invoice:
+        # Records are already validated, so skip re-validation
+        return Invoice.model_construct(
+            invoice_number=self.invoice_number,
+            invoice_date=self.invoice_date,
+            due_date=self.due_date,
+            seller_name=self.seller_name,
+            buyer_name=self.buyer_name,
+            currency=self.currency,
+            net_total=self.net_total,
+            tax_amount=self.tax_amount,
+            gross_total=self.gross_total,
+            payment_terms=self.payment_terms,
+            external_reference=self.external_reference,
+            line_items=[li.to_model() for li in self.line_items],
+            language=self.language,
+            file_name=self.file_name,
+            extraction_error=self.extraction_error,
+        )
+
+
+# Anything the validator accepts: records internally, models from API callers
+InvoiceLike = Union[Invoice, InvoiceRecord]
+
+INVOICE_RECORDS = TypeAdapter(List[InvoiceRecord])
+INVOICE_RECORD = TypeAdapter(InvoiceRecord)
+
+
+def records_from_json(data: Union[str, bytes]) -> List[InvoiceRecord]:
+    """Parse and validate a JSON array of invoices in one pass."""
+    return INVOICE_RECORDS.validate_json(data)
+
+
+def records_from_python(data: Sequence[Dict]) -> List[InvoiceRecord]:
+    return INVOICE_RECORDS.validate_python(data)
+
+
+def to_records(invoices: Sequence[InvoiceLike]) -> List[InvoiceRecord]:
+    return [
+        inv if isinstance(inv, InvoiceRecord) else InvoiceRecord.from_model(inv)
+        for inv in invoices
+    ]
+
+
+def records_to_json(records: Sequence[InvoiceRecord], indent: Optional[int] = None) -> bytes:
+    return INVOICE_RECORDS.dump_json(list(records), indent=indent)
+
+
+def records_to_python(records: Sequence[InvoiceRecord]) -> List[Dict]:
+    return INVOICE_RECORDS.dump_python(list(records), mode="json")
+
+
+def records_to_models(records: Sequence[InvoiceRecord]) -> List[Invoice]:
+    return [r.to_model() for r in records]
@@ -0,0 +1,278 @@
+"""Report and invoice file formats for the CLI.
+
+Reports and extracted invoices used to be written as pretty JSON via
+``json.dumps(..., default=str)``. Serialization now goes through
+pydantic-core (``to_json``) directly from the models/records, and a few
+compact formats are available for large batches:
+
+- ``json``: pretty-printed JSON, the original format (default)
+- ``jsonl``: one object per line; reports start with a ``{"summary": ...}`` line
+- ``msgpack``: the same structure as ``json``, binary (needs ``msgpack``)
+- ``parquet`` / ``arrow``: columnar tables (needs ``pyarrow``); for reports
+  the summary is stored in the schema metadata under ``invoice_qc.summary``
+
+Reports can also carry the duplicate key of every result (``invoice_keys``,
+aligned with ``results``) so shard reports can be merged later; see
+``sharding.merge_reports``.
+
+When no format is given it is inferred from the file suffix.
+"""
+from __future__ import annotations
+
+import json
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from pydantic_core import to_json, to_jsonable_python
+
+from .models import BatchValidationSummary, InvoiceValidationResult
+from .records import (
+    InvoiceRecord,
+    records_from_json,
+    records_from_python,
+    records_to_json,
+    records_to_python,
+)
+
+try:
+    import msgpack
+except Exception:
+    msgpack = None
+
+try:
+    import pyarrow as pa
+    import pyarrow.feather as feather
+    import pyarrow.parquet as pq
+except Exception:
+    pa = None
+
+REPORT_FORMATS = ["json", "jsonl", "msgpack", "parquet", "arrow"]
+
+_SUFFIX_FORMATS = {
+    ".json": "json",
+    ".jsonl": "jsonl",
+    ".ndjson": "jsonl",
+    ".msgpack": "msgpack",
+    ".mpk": "msgpack",
+    ".parquet": "parquet",
+    ".arrow": "arrow",
+    ".feather": "arrow",
+}
+
+SUMMARY_METADATA_KEY = b"invoice_qc.summary"
+
+
+def resolve_format(path: str, fmt: Optional[str] = None) -> str:
+    if fmt:
+        return fmt
+    return _SUFFIX_FORMATS.get(Path(path).suffix.lower(), "json")
+
+
+def _require_msgpack() -> None:
+    if msgpack is None:
+        raise RuntimeError("msgpack format requires the 'msgpack' package")
+
+
+def _require_pyarrow() -> None:
+    if pa is None:
+        raise RuntimeError("parquet/arrow formats require the 'pyarrow' package")
+
+
+def _write_table(table, path: Path, fmt: str) -> None:
+    if fmt == "parquet":
+        pq.write_table(table, str(path))
+    else:
+        feather.write_feather(table, str(path))
+
+
+def _read_table(path: Path, fmt: str):
+    if fmt == "parquet":
+        return pq.read_table(str(path))
+    return feather.read_table(str(path))
+
+
+def _line_item_type():
+    return pa.struct(
+        [
+            ("description", pa.string()),
+            ("quantity", pa.float64()),
+            ("unit_price", pa.float64()),
+            ("line_total", pa.float64()),
+        ]
+    )
+
+
+def _invoice_schema():
+    string_fields = [
+        "invoice_number",
+        "invoice_date",
+        "due_date",
+        "seller_name",
+        "buyer_name",
+        "currency",
+    ]
+    float_fields = ["net_total", "tax_amount", "gross_total"]
+    tail_fields = ["payment_terms", "external_reference"]
+    return pa.schema(
+        [(name, pa.string()) for name in string_fields]
+        + [(name, pa.float64()) for name in float_fields]
+        + [(name, pa.string()) for name in tail_fields]
+        + [
+            ("line_items", pa.list_(_line_item_type())),
+            ("language", pa.string()),
+            ("file_name", pa.string()),
+            ("extraction_error", pa.string()),
+        ]
+    )
+
+
+def _results_schema(with_keys: bool):
+    fields = [
+        ("invoice_id", pa.string()),
+        ("is_valid", pa.bool_()),
+        ("errors", pa.list_(pa.string())),
+        ("possible_duplicates", pa.list_(pa.string())),
+    ]
+    if with_keys:
+        fields.append(("invoice_key", pa.list_(pa.string())))
+    return pa.schema(fields)
+
+
+# ---------------------------------------------------------
+# VALIDATION REPORTS
+# ---------------------------------------------------------
+InvoiceKey = Tuple[str, str, str]
+
+
+def build_report(
+    summary: BatchValidationSummary,
+    results: Sequence[InvoiceValidationResult],
+    keys: Optional[Sequence[InvoiceKey]] = None,
+) -> Dict:
+    report = {"summary": summary, "results": list(results)}
+    if keys is not None:
+        report["invoice_keys"] = list(keys)
+    return report
+
+
+def write_report(
+    path: str,
+    summary: BatchValidationSummary,
+    results: Sequence[InvoiceValidationResult],
+    fmt: Optional[str] = None,
+    keys: Optional[Sequence[InvoiceKey]] = None,
+) -> None:
+    fmt = resolve_format(path, fmt)
+    out = Path(path)
+    out.parent.mkdir(parents=True, exist_ok=True)
+    report = build_report(summary, results, keys)
+
+    if fmt == "json":
+        out.write_bytes(to_json(report, indent=2))
+    elif fmt == "jsonl":
+        with out.open("wb") as fh:
+            fh.write(to_json({"summary": summary}) + b"\n")
+            if keys is None:
+                for r in results:
+                    fh.write(to_json(r) + b"\n")
+            else:
+                for r, key in zip(results, keys):
+                    fh.write(to_json({**r.model_dump(), "invoice_key": key}) + b"\n")
+    elif fmt == "msgpack":
+        _require_msgpack()
+        out.write_bytes(msgpack.packb(to_jsonable_python(report)))
+    elif fmt in ("parquet", "arrow"):
+        _require_pyarrow()
+        rows = to_jsonable_python(list(results))
+        if keys is not None:
+            for row, key in zip(rows, keys):
+                row["invoice_key"] = list(key)
+        table = pa.Table.from_pylist(
+            rows, schema=_results_schema(keys is not None)
+        ).replace_schema_metadata({SUMMARY_METADATA_KEY: to_json(summary)})
+        _write_table(table, out, fmt)
+    else:
+        raise ValueError(f"Unknown report format {fmt!r}")
+
+
+# ---------------------------------------------------------
+# EXTRACTED INVOICES
+# ---------------------------------------------------------
+def write_invoices(
+    path: str, records: Sequence[InvoiceRecord], fmt: Optional[str] = None
+) -> None:
+    fmt = resolve_format(path, fmt)
+    out = Path(path)
+    out.parent.mkdir(parents=True, exist_ok=True)
+
+    if fmt == "json":
+        out.write_bytes(records_to_json(records, indent=2))
+    elif fmt == "jsonl":
+        with out.open("wb") as fh:
+            for r in records:
+                fh.write(to_json(r) + b"\n")
+    elif fmt == "msgpack":
+        _require_msgpack()
+        out.write_bytes(msgpack.packb(records_to_python(records)))
+    elif fmt in ("parquet", "arrow"):
+        _require_pyarrow()
+        table = pa.Table.from_pylist(records_to_python(records), schema=_invoice_schema())
+        _write_table(table, out, fmt)
+    else:
+        raise ValueError(f"Unknown invoice format {fmt!r}")
+
+
+def read_invoices(path: str, fmt: Optional[str] = None) -> List[InvoiceRecord]:
+    """Load invoices written by ``write_invoices`` (any format)."""
+    fmt = resolve_format(path, fmt)
+    src = Path(path)
+
+    if fmt == "json":
+        return records_from_json(src.read_bytes())
+    if fmt == "jsonl":
+        with src.open("rb") as fh:
+            return records_from_json(
+                b"[" + b",".join(line for line in fh if line.strip()) + b"]"
+            )
+    if fmt == "msgpack":
+        _require_msgpack()
+        return records_from_python(msgpack.unpackb(src.read_bytes()))
+    if fmt in ("parquet", "arrow"):
+        _require_pyarrow()
+        return records_from_python(_read_table(src, fmt).to_pylist())
+    raise ValueError(f"Unknown invoice format {fmt!r}")
+
+
+def read_report(path: str, fmt: Optional[str] = None) -> Dict:
+    """Load a report written by ``write_report`` as plain Python data."""
+    fmt = resolve_format(path, fmt)
+    src = Path(path)
+
+    if fmt == "json":
+        return json.loads(src.read_bytes())
+    if fmt == "jsonl":
+        report: Dict = {"summary": None, "results": []}
+        with src.open("rb") as fh:
+            for line in fh:
+                if not line.strip():
+                    continue
+                obj = json.loads(line)
+                if report["summary"] is None and "summary" in obj:
+                    report["summary"] = obj["summary"]
+                    continue
+                if "invoice_key" in obj:
+                    report.setdefault("invoice_keys", []).append(obj.pop("invoice_key"))
+                report["results"].append(obj)
+        return report
+    if fmt == "msgpack":
+        _require_msgpack()
+        return msgpack.unpackb(src.read_bytes())
+    if fmt in ("parquet", "arrow"):
+        _require_pyarrow()
+        table = _read_table(src, fmt)
+        summary = json.loads(table.schema.metadata[SUMMARY_METADATA_KEY])
+        report = {"summary": summary, "results": table.to_pylist()}
+        if "invoice_key" in table.column_names:
+            report["invoice_keys"] = [r.pop("invoice_key") for r in report["results"]]
+        return report
+    raise ValueError(f"Unknown report format {fmt!r}")
@@ -0,0 +1,102 @@
+"""Sharded batch runs and mergeable reports.
+
+``--shard i/N`` splits a PDF directory across N machines. A file is assigned
+by a stable hash of its name, so every machine computes the same split
+without coordination and a file keeps its shard between runs.
+
+Each shard report also carries the duplicate key
+``(invoice_number, seller_name, invoice_date)`` of every result
+(``invoice_keys``). ``merge_reports`` combines shard reports: it sums the
+summary counts and ``error_counts``, then runs the duplicate check across
+shards on those keys. Duplicates found only across shards are flagged the
+same way ``validate_invoices`` flags them within a batch. Placeholders of
+failed extractions are skipped, as ``validate_invoices`` skips them.
+"""
+from __future__ import annotations
+
+import hashlib
+from collections import Counter
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from pydantic import TypeAdapter
+
+from .models import BatchValidationSummary, InvoiceValidationResult
+from .validator import DUPLICATE_KEY_ERROR, EXTRACTION_ERROR_PREFIX
+
+Shard = Tuple[int, int]  # (index, count), 0 <= index < count
+
+_RESULTS = TypeAdapter(List[InvoiceValidationResult])
+
+
+def parse_shard(value: str) -> Shard:
+    """Parse ``"i/N"``; raises ValueError for anything else."""
+    try:
+        index_s, count_s = value.split("/")
+        index, count = int(index_s), int(count_s)
+    except ValueError:
+        raise ValueError(f"Invalid shard {value!r}; expected i/N, e.g. 0/4")
+    if count < 1 or not 0 <= index < count:
+        raise ValueError(f"Invalid shard {value!r}; need 0 <= i < N")
+    return index, count
+
+
+def shard_of(name: str, count: int) -> int:
+    digest = hashlib.sha1(name.encode("utf-8")).digest()
+    return int.from_bytes(digest[:8], "big") % count
+
+
+def in_shard(name: str, shard: Optional[Shard]) -> bool:
+    if shard is None:
+        return True
+    index, count = shard
+    return shard_of(name, count) == index
+
+
+def merge_reports(
+    reports: Sequence[Dict],
+) -> Tuple[BatchValidationSummary, List[InvoiceValidationResult], List[Tuple[str, str, str]]]:
+    """Combine shard reports (as returned by ``reports.read_report``)."""
+    total = valid = invalid = 0
+    error_counts: Counter[str] = Counter()
+    results: List[InvoiceValidationResult] = []
+    keys: List[Tuple[str, str, str]] = []
+
+    for i, report in enumerate(reports):
+        summary = report["summary"]
+        total += summary["total_invoices"]
+        valid += summary["valid_invoices"]
+        invalid += summary["invalid_invoices"]
+        error_counts.update(summary["error_counts"])
+
+        shard_results = _RESULTS.validate_python(report["results"])
+        shard_keys = report.get("invoice_keys")
+        if shard_keys is None or len(shard_keys) != len(shard_results):
+            raise ValueError(
+                f"Report #{i + 1} has no invoice_keys; re-run the shard with this version"
+            )
+        results.extend(shard_results)
+        keys.extend(tuple(k) for k in shard_keys)
+
+    # Keys seen more than once overall; results not flagged yet are the
+    # cross-shard duplicates. Failed extractions have no real key.
+    extracted = [
+        not any(e.startswith(EXTRACTION_ERROR_PREFIX) for e in result.errors)
+        for result in results
+    ]
+    key_counts = Counter(key for key, ok in zip(keys, extracted) if ok)
+    for result, key, ok in zip(results, keys, extracted):
+        if ok and key_counts[key] > 1 and DUPLICATE_KEY_ERROR not in result.errors:
+            result.errors.append(DUPLICATE_KEY_ERROR)
+            error_counts[DUPLICATE_KEY_ERROR] += 1
+            if result.is_valid:
+                result.is_valid = False
+                valid -= 1
+                invalid += 1
+
+    summary = BatchValidationSummary(
+        total_invoices=total,
+        valid_invoices=valid,
+        invalid_invoices=invalid,
+        error_counts=dict(error_counts),
+    )
+    return summary, results, keys
@@ -0,0 +1,339 @@
+"""Persistent SQLite store of validated batches.
+
+API responses carry the whole batch and nothing outlives them, so a client
+had to keep every invoice and result in memory and re-extract a batch to
+look at it again. The validation endpoints now also save each batch here,
+and ``GET /invoices`` / ``GET /results`` return one filtered page at a time.
+
+Layout:
+
+- ``batches``: one row per request (id, source, creation time, summary)
+- ``invoices``: one row per invoice with its ``InvoiceRecord`` and
+  ``InvoiceValidationResult`` as JSON, plus the filter columns (seller,
+  date, currency, validity), each indexed
+- ``invoice_errors``: one row per error code of an invoice, indexed by code
+
+Pages are keyset-paginated on the invoice row id: a page returns
+``next_after`` and the client passes it back as ``after``, so a deep page
+costs the same as the first one.
+
+The store is opt-in: set ``INVOICE_QC_RESULT_STORE`` to the database path
+(default ``off``). The database is created on first use, not on import.
+Old batches are deleted as new ones are created: beyond the newest
+``INVOICE_QC_RESULT_STORE_MAX_BATCHES`` (default 1000) or older than
+``INVOICE_QC_RESULT_STORE_MAX_AGE_DAYS`` (default 30); 0 turns either
+limit off.
+
+Every thread gets its own connection. The database runs in WAL mode, so
+reads do not wait for writes.
+"""
+from __future__ import annotations
+
+import json
+import os
+import secrets
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+
+from pydantic_core import to_json
+
+from .models import BatchValidationSummary, InvoiceValidationResult
+from .records import INVOICE_RECORD, InvoiceRecord
+
+RESULT_STORE = os.getenv("INVOICE_QC_RESULT_STORE", "off")
+MAX_BATCHES = int(os.getenv("INVOICE_QC_RESULT_STORE_MAX_BATCHES", "1000"))
+MAX_AGE_DAYS = float(os.getenv("INVOICE_QC_RESULT_STORE_MAX_AGE_DAYS", "30"))
+
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 1000
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS batches (
+    batch_id TEXT PRIMARY KEY,
+    source TEXT NOT NULL,
+    created_at REAL NOT NULL,
+    summary TEXT
+);
+CREATE INDEX IF NOT EXISTS batches_created ON batches (created_at);
+CREATE TABLE IF NOT EXISTS invoices (
+    id INTEGER PRIMARY KEY,
+    batch_id TEXT NOT NULL,
+    position INTEGER NOT NULL,
+    invoice_number TEXT,
+    seller_name TEXT,
+    invoice_date TEXT,
+    currency TEXT,
+    is_valid INTEGER NOT NULL,
+    invoice TEXT NOT NULL,
+    result TEXT NOT NULL
+);
+CREATE UNIQUE INDEX IF NOT EXISTS invoices_batch ON invoices (batch_id, position);
+CREATE INDEX IF NOT EXISTS invoices_seller ON invoices (seller_name);
+CREATE INDEX IF NOT EXISTS invoices_date ON invoices (invoice_date);
+CREATE INDEX IF NOT EXISTS invoices_currency ON invoices (currency);
+CREATE INDEX IF NOT EXISTS invoices_valid ON invoices (is_valid);
+CREATE TABLE IF NOT EXISTS invoice_errors (
+    invoice_id INTEGER NOT NULL,
+    code TEXT NOT NULL,
+    PRIMARY KEY (invoice_id, code)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS invoice_errors_code ON invoice_errors (code, invoice_id);
+"""
+
+
+class ResultStore:
+    def __init__(
+        self, path: str, max_batches: int = MAX_BATCHES, max_age_days: float = MAX_AGE_DAYS
+    ) -> None:
+        self.path = path
+        self.max_batches = max_batches
+        self.max_age_days = max_age_days
+        self._local = threading.local()
+        # SQLite allows one writer at a time; queue writers here, not on SQLITE_BUSY
+        self._write_lock = threading.Lock()
+        self._connect().executescript(_SCHEMA)
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    # -- writing -------------------------------------------------------
+
+    def create_batch(self, source: str) -> str:
+        batch_id = secrets.token_hex(8)
+        with self._write_lock:
+            self._connect().execute(
+                "INSERT INTO batches (batch_id, source, created_at) VALUES (?, ?, ?)",
+                (batch_id, source, time.time()),
+            )
+        self.prune()
+        return batch_id
+
+    def add_invoices(
+        self,
+        batch_id: str,
+        invoices: Sequence[InvoiceRecord],
+        results: Sequence[InvoiceValidationResult],
+        positions: Optional[Sequence[int]] = None,
+    ) -> None:
+        """Store ``invoices`` with their results (``positions`` default to 0..n-1)."""
+        if positions is None:
+            positions = range(len(invoices))
+        rows = [
+            (
+                batch_id,
+                position,
+                inv.invoice_number,
+                inv.seller_name,
+                inv.invoice_date,
+                inv.currency.upper() if inv.currency else None,
+                int(res.is_valid),
+                INVOICE_RECORD.dump_json(inv).decode(),
+                to_json(res).decode(),
+            )
+            for inv, res, position in zip(invoices, results, positions)
+        ]
+        conn = self._connect()
+        with self._write_lock:
+            conn.execute("BEGIN")
+            try:
+                for row, res in zip(rows, results):
+                    invoice_id = conn.execute(
+                        "INSERT INTO invoices (batch_id, position, invoice_number, seller_name,"
+                        " invoice_date, currency, is_valid, invoice, result)"
+                        " VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                        row,
+                    ).lastrowid
+                    if res.errors:
+                        conn.executemany(
+                            "INSERT OR IGNORE INTO invoice_errors (invoice_id, code) VALUES (?, ?)",
+                            [(invoice_id, code) for code in res.errors],
+                        )
+                conn.execute("COMMIT")
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+
+    def add_errors(self, batch_id: str, updates: Iterable[Tuple[int, str]]) -> None:
+        """Append an error code to already stored invoices, by ``(position, code)``."""
+        conn = self._connect()
+        with self._write_lock:
+            conn.execute("BEGIN")
+            try:
+                for position, code in updates:
+                    row = conn.execute(
+                        "SELECT id, result FROM invoices WHERE batch_id = ? AND position = ?",
+                        (batch_id, position),
+                    ).fetchone()
+                    if row is None:
+                        continue
+                    result = json.loads(row[1])
+                    if code in result["errors"]:
+                        continue
+                    result["errors"].append(code)
+                    result["is_valid"] = False
+                    conn.execute(
+                        "UPDATE invoices SET is_valid = 0, result = ? WHERE id = ?",
+                        (to_json(result).decode(), row[0]),
+                    )
+                    conn.execute(
+                        "INSERT OR IGNORE INTO invoice_errors (invoice_id, code) VALUES (?, ?)",
+                        (row[0], code),
+                    )
+                conn.execute("COMMIT")
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+
+    def finish_batch(self, batch_id: str, summary: BatchValidationSummary) -> None:
+        with self._write_lock:
+            self._connect().execute(
+                "UPDATE batches SET summary = ? WHERE batch_id = ?",
+                (to_json(summary).decode(), batch_id),
+            )
+
+    def save_batch(
+        self,
+        source: str,
+        invoices: Sequence[InvoiceRecord],
+        results: Sequence[InvoiceValidationResult],
+        summary: BatchValidationSummary,
+    ) -> str:
+        batch_id = self.create_batch(source)
+        self.add_invoices(batch_id, invoices, results)
+        self.finish_batch(batch_id, summary)
+        return batch_id
+
+    def delete_batch(self, batch_id: str) -> bool:
+        conn = self._connect()
+        with self._write_lock:
+            conn.execute("BEGIN")
+            try:
+                conn.execute(
+                    "DELETE FROM invoice_errors WHERE invoice_id IN"
+                    " (SELECT id FROM invoices WHERE batch_id = ?)",
+                    (batch_id,),
+                )
+                conn.execute("DELETE FROM invoices WHERE batch_id = ?", (batch_id,))
+                deleted = conn.execute(
+                    "DELETE FROM batches WHERE batch_id = ?", (batch_id,)
+                ).rowcount
+                conn.execute("COMMIT")
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+        return deleted > 0
+
+    def prune(self) -> int:
+        """Delete batches past the retention limits; returns how many."""
+        queries = []
+        if self.max_age_days > 0:
+            queries.append(
+                (
+                    "SELECT batch_id FROM batches WHERE created_at < ?",
+                    (time.time() - self.max_age_days * 86400,),
+                )
+            )
+        if self.max_batches > 0:
+            queries.append(
+                (
+                    "SELECT batch_id FROM batches ORDER BY created_at DESC LIMIT -1 OFFSET ?",
+                    (self.max_batches,),
+                )
+            )
+        conn = self._connect()
+        expired = {row[0] for sql, params in queries for row in conn.execute(sql, params)}
+        for batch_id in expired:
+            self.delete_batch(batch_id)
+        return len(expired)
+
+    # -- reading -------------------------------------------------------
+
+    def batches(self, limit: int = DEFAULT_PAGE_SIZE) -> List[Dict[str, Any]]:
+        rows = self._connect().execute(
+            "SELECT batch_id, source, created_at, summary FROM batches"
+            " ORDER BY created_at DESC LIMIT ?",
+            (max(1, min(limit, MAX_PAGE_SIZE)),),
+        )
+        return [
+            {
+                "batch_id": batch_id,
+                "source": source,
+                "created_at": created_at,
+                "summary": json.loads(summary) if summary else None,
+            }
+            for batch_id, source, created_at, summary in rows
+        ]
+
+    def page(
+        self,
+        column: str,
+        *,
+        batch_id: Optional[str] = None,
+        seller: Optional[str] = None,
+        currency: Optional[str] = None,
+        date_from: Optional[str] = None,
+        date_to: Optional[str] = None,
+        is_valid: Optional[bool] = None,
+        error: Optional[str] = None,
+        after: int = 0,
+        limit: int = DEFAULT_PAGE_SIZE,
+    ) -> bytes:
+        """
+        One page of stored invoices (``column="invoice"``) or results
+        (``column="result"``) as a JSON object ``{"items": [...], "next_after": id}``.
+        The stored JSON is spliced in as is, without parsing it again.
+        """
+        if column not in ("invoice", "result"):
+            raise ValueError(f"Unknown column: {column}")
+        clauses = ["id > ?"]
+        params: List[Any] = [after]
+        for sql, value in (
+            ("batch_id = ?", batch_id),
+            ("seller_name = ?", seller),
+            ("currency = ?", currency.upper() if currency else None),
+            ("invoice_date >= ?", date_from),
+            ("invoice_date <= ?", date_to),
+            ("is_valid = ?", None if is_valid is None else int(is_valid)),
+            ("id IN (SELECT invoice_id FROM invoice_errors WHERE code = ?)", error),
+        ):
+            if value is not None:
+                clauses.append(sql)
+                params.append(value)
+        limit = max(1, min(limit, MAX_PAGE_SIZE))
+        rows = self._connect().execute(
+            f"SELECT id, batch_id, position, {column} FROM invoices"
+            f" WHERE {' AND '.join(clauses)} ORDER BY id LIMIT ?",
+            (*params, limit),
+        ).fetchall()
+
+        items = [
+            b'{"id":%d,"batch_id":%s,"position":%d,"%s":%s}'
+            % (row_id, json.dumps(row_batch).encode(), position, column.encode(), data.encode())
+            for row_id, row_batch, position, data in rows
+        ]
+        next_after = rows[-1][0] if len(rows) == limit else None
+        return b'{"items":[' + b",".join(items) + b'],"next_after":' + to_json(next_after) + b"}"
+
+
+_STORE: Optional[ResultStore] = None
+_STORE_LOCK = threading.Lock()
+
+
+def get_store(path: Optional[str] = RESULT_STORE) -> Optional[ResultStore]:
+    """The process-wide store (opened on first call), or None when it is off."""
+    global _STORE
+    if not path or path.lower() == "off":
+        return None
+    with _STORE_LOCK:
+        if _STORE is None or _STORE.path != path:
+            _STORE = ResultStore(path)
+        return _STORE
@@ -1,15 +1,26 @@
 # invoice_qc/validator.py
 from __future__ import annotations
 
-from collections import Counter
+import os
+from collections import Counter, OrderedDict
 from datetime import date, datetime
-from typing import Iterable, List, Optional, Tuple
+from typing import List, Optional, Sequence, Tuple
 
 from .config import ALLOWED_CURRENCIES, MIN_VALID_DATE, MAX_VALID_DATE, EPSILON
-from .models import BatchValidationSummary, Invoice, InvoiceValidationResult
+from .models import BatchValidationSummary, InvoiceValidationResult
+from .near_duplicates import NEAR_DUPLICATES, POSSIBLE_DUPLICATE_ERROR, find_near_duplicates
+from .profiling import stage
+from .records import InvoiceLike
 
+DUPLICATE_KEY_ERROR = "anomaly: duplicate_invoice_key"
+# Error of a document that could not be extracted: "extraction: <reason>"
+EXTRACTION_ERROR_PREFIX = "extraction: "
 
-def _check_completeness_and_format(inv: Invoice) -> List[str]:
+# Distinct duplicate keys a StreamingValidator remembers (~160 bytes each)
+DUPLICATE_WINDOW = int(os.getenv("INVOICE_QC_DUPLICATE_WINDOW", "1000000"))
+
+
+def _check_completeness_and_format(inv: InvoiceLike) -> List[str]:
     errors: List[str] = []
 
     def _safe_str(s: Optional[str]) -> str:
@@ -59,7 +70,7 @@ def _check_completeness_and_format(inv: Invoice) -> List[str]:
     return errors
 
 
-def _check_business_rules(inv: Invoice) -> List[str]:
+def _check_business_rules(inv: InvoiceLike) -> List[str]:
     errors: List[str] = []
 
     net = inv.net_total
@@ -89,74 +100,81 @@ def _check_business_rules(inv: Invoice) -> List[str]:
     return errors
 
 
-def _find_duplicates(invoices: Iterable[Invoice]) -> List[Tuple[str, str, str]]:
-    # Build a normalized key (invoice_number, seller_name, invoice_date_iso)
-    def _norm_date_for_key(val) -> str:
-        if val is None:
-            return ""
-        if isinstance(val, date):
-            return val.isoformat()
-        if isinstance(val, datetime):
-            return val.date().isoformat()
-        return str(val)
-
-    key_counts = Counter(
-        (
-            (inv.invoice_number or "").strip(),
-            (inv.seller_name or "").strip(),
-            _norm_date_for_key(inv.invoice_date),
-        )
-        for inv in invoices
+def _norm_date_for_key(val) -> str:
+    if val is None:
+        return ""
+    if isinstance(val, date):
+        return val.isoformat()
+    if isinstance(val, datetime):
+        return val.date().isoformat()
+    return str(val)
+
+
+def invoice_key(inv: InvoiceLike) -> Tuple[str, str, str]:
+    """Normalized duplicate key (invoice_number, seller_name, invoice_date_iso)."""
+    return (
+        (inv.invoice_number or "").strip(),
+        (inv.seller_name or "").strip(),
+        _norm_date_for_key(inv.invoice_date),
     )
-    duplicates = [k for k, c in key_counts.items() if c > 1]
-    return duplicates
 
 
 def validate_invoices(
-    invoices: List[Invoice],
+    invoices: Sequence[InvoiceLike],
+) -> tuple[List[InvoiceValidationResult], BatchValidationSummary]:
+    """Validate a batch of ``InvoiceRecord``s (or ``Invoice`` models).
+
+    Both expose the same attributes, so API callers can pass models while the
+    bulk pipeline passes compact records.
+    """
+    with stage("validate_invoices"):
+        return _validate_batch(invoices)
+
+
+def _validate_batch(
+    invoices: Sequence[InvoiceLike],
 ) -> tuple[List[InvoiceValidationResult], BatchValidationSummary]:
     results: List[InvoiceValidationResult] = []
 
-    duplicates = set(_find_duplicates(invoices))
+    keys = [invoice_key(inv) for inv in invoices]
+    key_counts = Counter(keys)
+    with stage("near_duplicates"):
+        near = find_near_duplicates(invoices, keys) if NEAR_DUPLICATES else {}
     error_counter: Counter[str] = Counter()
+    invalid = 0
 
-    for inv in invoices:
+    for index, (inv, key) in enumerate(zip(invoices, keys)):
         errors: List[str] = []
 
-        errors.extend(_check_completeness_and_format(inv))
-        errors.extend(_check_business_rules(inv))
-        # Normalize key for duplicate detection
-        def _norm_date_for_key(val) -> str:
-            if val is None:
-                return ""
-            if isinstance(val, date):
-                return val.isoformat()
-            if isinstance(val, datetime):
-                return val.date().isoformat()
-            return str(val)
-
-        key = (
-            (inv.invoice_number or "").strip(),
-            (inv.seller_name or "").strip(),
-            _norm_date_for_key(inv.invoice_date),
-        )
-        if key in duplicates:
-            errors.append("anomaly: duplicate_invoice_key")
+        if inv.extraction_error:
+            # Nothing was read: the field and duplicate checks would only repeat that
+            errors.append(f"{EXTRACTION_ERROR_PREFIX}{inv.extraction_error}")
+            matches = []
+        else:
+            errors.extend(_check_completeness_and_format(inv))
+            errors.extend(_check_business_rules(inv))
+            if key_counts[key] > 1:
+                errors.append(DUPLICATE_KEY_ERROR)
+            matches = near.get(index, [])
+            if matches:
+                errors.append(POSSIBLE_DUPLICATE_ERROR)
 
         is_valid = len(errors) == 0
-        for e in errors:
-            error_counter[e] += 1
+        if not is_valid:
+            invalid += 1
+        error_counter.update(errors)
 
+        # Fields are built here, so skip per-result pydantic validation
         results.append(
-            InvoiceValidationResult(
-                invoice_id=inv.invoice_number,
+            InvoiceValidationResult.model_construct(
+                invoice_id=inv.invoice_number or "",
                 is_valid=is_valid,
                 errors=errors,
+                possible_duplicates=matches,
             )
         )
 
     total = len(invoices)
-    invalid = sum(1 for r in results if not r.is_valid)
     valid = total - invalid
 
     summary = BatchValidationSummary(
@@ -167,3 +185,116 @@ def validate_invoices(
     )
 
     return results, summary
+
+
+class StreamingValidator:
+    """
+    Validate an unbounded stream of invoices chunk by chunk.
+
+    Per-invoice checks are the same as in ``validate_invoices``; only the
+    cross-invoice checks differ:
+
+    - exact duplicate keys are tracked as one hash per distinct key, about
+      160 bytes each. The first occurrence has already been reported when
+      a later one arrives, so ``validate_chunk`` also returns an update for
+      it (once), and the summary counts both like the batch check does.
+    - memory is bounded by ``window`` keys (``INVOICE_QC_DUPLICATE_WINDOW``,
+      default 1M, ~160 MB): the duplicate detection window. Past it the
+      least recently seen keys are forgotten, so a duplicate of an invoice
+      more than ``window`` distinct keys back is not detected.
+    - near duplicates are only searched within a chunk.
+    """
+
+    def __init__(self, window: int = DUPLICATE_WINDOW) -> None:
+        self.total = 0
+        self.invalid = 0
+        self.error_counts: Counter[str] = Counter()
+        self.window = max(1, window)
+        # hash(key) -> line of the first occurrence, negated if that invoice
+        # was invalid; 0 once it has been flagged as a duplicate. Least
+        # recently seen first.
+        self._first_seen: "OrderedDict[int, int]" = OrderedDict()
+
+    def validate_chunk(
+        self, invoices: Sequence[InvoiceLike], lines: Sequence[int]
+    ) -> tuple[List[Tuple[int, InvoiceValidationResult]], List[Tuple[int, str]]]:
+        """
+        Results for ``invoices`` (keyed by their input line) and the
+        ``(line, invoice_id)`` of earlier invoices that just became duplicates.
+        """
+        keys = [invoice_key(inv) for inv in invoices]
+        key_counts = Counter(keys)
+        near = find_near_duplicates(invoices, keys) if NEAR_DUPLICATES else {}
+        results: List[Tuple[int, InvoiceValidationResult]] = []
+        flagged: List[Tuple[int, str]] = []
+
+        for index, (inv, key, line) in enumerate(zip(invoices, keys, lines)):
+            if inv.extraction_error:
+                self.total += 1
+                self.invalid += 1
+                errors = [f"{EXTRACTION_ERROR_PREFIX}{inv.extraction_error}"]
+                self.error_counts.update(errors)
+                results.append(
+                    (
+                        line,
+                        InvoiceValidationResult.model_construct(
+                            invoice_id=inv.invoice_number or "",
+                            is_valid=False,
+                            errors=errors,
+                            possible_duplicates=[],
+                        ),
+                    )
+                )
+                continue
+            errors = _check_completeness_and_format(inv)
+            errors.extend(_check_business_rules(inv))
+            digest = hash(key)
+            first = self._first_seen.get(digest)
+            if first is not None or key_counts[key] > 1:
+                errors.append(DUPLICATE_KEY_ERROR)
+            matches = near.get(index, [])
+            if matches:
+                errors.append(POSSIBLE_DUPLICATE_ERROR)
+
+            is_valid = not errors
+            if first is None:
+                # Copies within this chunk are flagged with it right away
+                self._first_seen[digest] = (
+                    0 if key_counts[key] > 1 else line if is_valid else -line
+                )
+                if len(self._first_seen) > self.window:
+                    self._first_seen.popitem(last=False)
+            else:
+                self._first_seen.move_to_end(digest)
+                if first != 0:
+                    # Earlier chunk: its result is already out, so send an update
+                    flagged.append((abs(first), inv.invoice_number or ""))
+                    self.error_counts[DUPLICATE_KEY_ERROR] += 1
+                    if first > 0:
+                        self.invalid += 1
+                    self._first_seen[digest] = 0
+
+            self.total += 1
+            if not is_valid:
+                self.invalid += 1
+            self.error_counts.update(errors)
+            results.append(
+                (
+                    line,
+                    InvoiceValidationResult.model_construct(
+                        invoice_id=inv.invoice_number or "",
+                        is_valid=is_valid,
+                        errors=errors,
+                        possible_duplicates=matches,
+                    ),
+                )
+            )
+        return results, flagged
+
+    def summary(self) -> BatchValidationSummary:
+        return BatchValidationSummary(
+            total_invoices=self.total,
+            valid_invoices=self.total - self.invalid,
+            invalid_invoices=self.invalid,
+            error_counts=dict(self.error_counts),
+        )
@@ -0,0 +1,411 @@
+"""Watch-folder ingestion daemon (``invoice-qc watch``).
+
+Replaces cron-driven ``full-run`` over a drop folder with one long-running
+process:
+
+- new PDFs are detected with inotify (through ``watchdog``, if installed)
+  or by polling the directory
+- a file is only picked up once its size and mtime have been stable for
+  ``settle`` seconds, so half-copied uploads are not read
+- extraction runs in a process pool: the isolated pool (see ``isolation``)
+  unless ``INVOICE_QC_ISOLATED_EXTRACTION=0``. A document that times out,
+  hits the memory limit or crashes its worker still ends up in the batch,
+  reported as ``extraction: <reason>``.
+- finished invoices are grouped into micro-batches (``batch_size`` invoices
+  or ``batch_window`` seconds, whichever comes first) for
+  ``validate_invoices``; duplicate detection therefore covers one batch
+- every batch is appended to a rolling JSONL report: one line per result
+  (with ``batch`` and ``file_name``) and one ``{"batch", "summary"}`` line
+- with an LLM fallback, the low-confidence invoices of a batch are
+  re-extracted together, just before the batch is validated
+- a document whose extraction fails is retried ``retries`` times (after
+  ``settle`` seconds each) before it is reported as failed
+
+Processed files are recorded in a manifest (the ``manifest`` module's
+format, ``.invoice_qc_watch_manifest.json`` in the watched folder by
+default) once their batch is written. On start, files that are new or
+changed since their manifest entry are processed, so PDFs dropped while
+the watcher was down are not lost; failed extractions are never recorded
+and are tried again on the next start. The very first start (no manifest
+yet) records what is already in the folder without processing it, unless
+``process_existing`` is set. Deleted files are dropped from the manifest.
+
+``stop()`` (SIGINT/SIGTERM from the CLI) stops accepting new files, waits
+for in-flight extractions and flushes the last batch before returning.
+"""
+from __future__ import annotations
+
+import queue
+import signal
+import sys
+import threading
+import time
+from concurrent.futures import Future, ProcessPoolExecutor
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+from pydantic_core import to_json
+
+from .extractor import apply_llm_fallback, extract_text_from_pdf, parse_raw_invoice_scored
+from .isolation import ISOLATED, ExtractionFailed, IsolatedPool, failed_record
+from .llm_extract import get_fallback
+from .manifest import MANIFEST_VERSION, Manifest, ManifestEntry, _sha256, load_manifest, save_manifest
+from .records import InvoiceRecord
+from .validator import validate_invoices
+
+try:
+    from watchdog.events import FileSystemEventHandler
+    from watchdog.observers import Observer
+except Exception:
+    FileSystemEventHandler = object
+    Observer = None
+
+# (size, mtime_ns) of a file; a change means it must be (re)processed
+FileState = Tuple[int, int]
+
+DEFAULT_WATCH_MANIFEST_NAME = ".invoice_qc_watch_manifest.json"
+# Seconds between sweeps for deleted files (inotify reports them directly)
+PRUNE_INTERVAL = 60.0
+
+
+def _extract_one(
+    path: str, backend: Optional[str], line_items_mode: Optional[str]
+) -> Tuple[InvoiceRecord, Dict[str, float], str]:
+    pdf_path = Path(path)
+    raw = extract_text_from_pdf(pdf_path, backend, line_items_mode)
+    record, confidence = parse_raw_invoice_scored(raw)
+    record.file_name = pdf_path.name
+    return record, confidence, raw.full_text
+
+
+def _ignore_shutdown_signals() -> None:
+    # Ctrl+C / service stop reach the whole process group; workers must keep
+    # running so the parent can drain them.
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGTERM, signal.SIG_IGN)
+
+
+class _EventHandler(FileSystemEventHandler):
+    def __init__(self, events: "queue.Queue[Path]") -> None:
+        super().__init__()
+        self._events = events
+
+    def on_created(self, event) -> None:
+        if not event.is_directory:
+            self._events.put(Path(event.src_path))
+
+    def on_modified(self, event) -> None:
+        if not event.is_directory:
+            self._events.put(Path(event.src_path))
+
+    def on_moved(self, event) -> None:
+        if not event.is_directory:
+            self._events.put(Path(event.src_path))
+            self._events.put(Path(event.dest_path))
+
+    def on_deleted(self, event) -> None:
+        if not event.is_directory:
+            self._events.put(Path(event.src_path))
+
+
+class FolderWatcher:
+    def __init__(
+        self,
+        watch_dir: str,
+        report_path: str,
+        *,
+        workers: int = 2,
+        batch_size: int = 50,
+        batch_window: float = 30.0,
+        poll_interval: float = 2.0,
+        settle: float = 1.0,
+        use_inotify: bool = True,
+        process_existing: bool = False,
+        manifest_path: Optional[str] = None,
+        retries: int = 2,
+        backend: Optional[str] = None,
+        line_items_mode: Optional[str] = None,
+        llm_fallback: Optional[str] = None,
+        max_report_bytes: int = 100 * 2**20,
+    ) -> None:
+        self.watch_dir = Path(watch_dir).resolve()
+        self.report_path = Path(report_path)
+        self.workers = workers
+        self.batch_size = batch_size
+        self.batch_window = batch_window
+        self.poll_interval = poll_interval
+        self.settle = settle
+        self.use_inotify = use_inotify and Observer is not None
+        self.process_existing = process_existing
+        if manifest_path:
+            self.manifest_path = Path(manifest_path)
+        else:
+            self.manifest_path = self.watch_dir / DEFAULT_WATCH_MANIFEST_NAME
+        self.retries = retries
+        self.backend = backend
+        self.line_items_mode = line_items_mode
+        self.fallback = get_fallback(llm_fallback)
+        self.max_report_bytes = max_report_bytes
+
+        self._stop = threading.Event()
+        self._events: "queue.Queue[Path]" = queue.Queue()
+        # path -> (last seen state, monotonic time of the last change)
+        self._pending: Dict[Path, Tuple[FileState, float]] = {}
+        self._done: Dict[Path, FileState] = {}
+        # failed extractions so far, for files waiting for a retry
+        self._attempts: Dict[Path, int] = {}
+        self._in_flight: Dict[Future, Tuple[Path, FileState]] = {}
+        self._files: Dict[str, ManifestEntry] = {}
+        self._batch: List[InvoiceRecord] = []
+        # (path, state) of each invoice in _batch, recorded once it is written
+        self._batch_files: List[Tuple[Path, FileState]] = []
+        # (index in _batch, text, record, confidence) for the LLM fallback
+        self._batch_low: List[Tuple[int, str, InvoiceRecord, Dict[str, float]]] = []
+        self._batch_started = 0.0
+        self._batch_no = 0
+        self._last_scan = 0.0
+        self._last_prune = 0.0
+
+    # -----------------------------------------------------
+    # detection
+    # -----------------------------------------------------
+    @staticmethod
+    def _state(path: Path) -> Optional[FileState]:
+        try:
+            st = path.stat()
+        except OSError:
+            return None
+        return (st.st_size, st.st_mtime_ns)
+
+    def _note(self, path: Path, now: float) -> None:
+        if path.suffix.lower() != ".pdf" or path.parent != self.watch_dir:
+            return
+        state = self._state(path)
+        if state is None:
+            self._forget(path)
+            return
+        if self._done.get(path) == state:
+            return
+        previous = self._pending.get(path)
+        if previous is None or previous[0] != state:
+            self._pending[path] = (state, now)
+
+    def _forget(self, path: Path) -> None:
+        self._pending.pop(path, None)
+        self._attempts.pop(path, None)
+        self._done.pop(path, None)
+        if self._files.pop(path.name, None) is not None:
+            self._save_manifest()
+
+    def _prune(self, now: float) -> None:
+        if now - self._last_prune < PRUNE_INTERVAL:
+            return
+        self._last_prune = now
+        for path in [p for p in self._done if not p.exists()]:
+            self._forget(path)
+
+    def _scan(self, now: float) -> None:
+        for path in self.watch_dir.glob("*.pdf"):
+            self._note(path, now)
+
+    def _collect_events(self, now: float) -> None:
+        if self.use_inotify:
+            while True:
+                try:
+                    path = self._events.get_nowait()
+                except queue.Empty:
+                    break
+                self._note(path, now)
+        elif now - self._last_scan >= self.poll_interval:
+            self._last_scan = now
+            self._scan(now)
+
+        # Re-check files still settling; inotify may not report the last write
+        for path in list(self._pending):
+            self._note(path, now)
+        self._prune(now)
+
+    # -----------------------------------------------------
+    # manifest
+    # -----------------------------------------------------
+    def _load_manifest(self) -> None:
+        manifest = load_manifest(self.manifest_path)
+        present = {path.name: path for path in self.watch_dir.glob("*.pdf")}
+        if manifest is None:
+            if not self.process_existing:
+                # First start: files already there predate the watcher
+                for name, path in present.items():
+                    state = self._state(path)
+                    if state is not None:
+                        self._done[path] = state
+                        self._files[name] = ManifestEntry(*state, sha256="")
+            self._save_manifest()
+            return
+
+        for name, entry in manifest.files.items():
+            path = present.get(name)
+            if path is None:
+                continue
+            state = self._state(path)
+            if state == (entry.size, entry.mtime_ns):
+                self._done[path] = state
+                self._files[name] = entry
+        if len(self._files) != len(manifest.files):
+            self._save_manifest()
+
+    def _save_manifest(self) -> None:
+        settings = {"pdf_backend": self.backend, "line_items": self.line_items_mode}
+        save_manifest(
+            self.manifest_path,
+            Manifest(version=MANIFEST_VERSION, settings=settings, files=self._files),
+        )
+
+    def _record(self, path: Path, state: FileState, record: InvoiceRecord) -> None:
+        if self._state(path) != state:
+            return  # changed or deleted since it was read; noted again
+        try:
+            digest = _sha256(path)
+        except OSError:
+            return
+        self._files[path.name] = ManifestEntry(*state, sha256=digest, invoice=record)
+
+    # -----------------------------------------------------
+    # extraction + batching
+    # -----------------------------------------------------
+    def _submit_ready(self, pool, now: float) -> None:
+        for path, (state, changed_at) in list(self._pending.items()):
+            if now - changed_at < self.settle:
+                continue
+            del self._pending[path]
+            self._done[path] = state
+            future = pool.submit(_extract_one, str(path), self.backend, self.line_items_mode)
+            self._in_flight[future] = (path, state)
+
+    def _collect_done(self, now: float) -> None:
+        for future in [f for f in self._in_flight if f.done()]:
+            path, state = self._in_flight.pop(future)
+            try:
+                record, confidence, text = future.result()
+            except Exception as e:
+                if self._stop.is_set():
+                    # Not in the manifest, so the next start tries it again
+                    print(
+                        f"[WATCH] extraction failed for {path.name}: {e} (retried on next start)",
+                        file=sys.stderr,
+                    )
+                    self._attempts.pop(path, None)
+                    continue
+                attempts = self._attempts.get(path, 0) + 1
+                if attempts <= self.retries:
+                    print(
+                        f"[WATCH] extraction failed for {path.name}: {e} (retry {attempts}/{self.retries})",
+                        file=sys.stderr,
+                    )
+                    self._attempts[path] = attempts
+                    self._pending[path] = (state, now)
+                    continue
+                print(f"[WATCH] extraction failed for {path.name}: {e}", file=sys.stderr)
+                reason = e.reason if isinstance(e, ExtractionFailed) else str(e)
+                record, confidence, text = failed_record(path.name, reason), {}, ""
+            self._attempts.pop(path, None)
+            if not self._batch:
+                self._batch_started = now
+            if self.fallback is not None and self.fallback.needs_llm(confidence):
+                self._batch_low.append((len(self._batch), text, record, confidence))
+            self._batch.append(record)
+            self._batch_files.append((path, state))
+
+    def _maybe_flush(self, now: float, force: bool = False) -> None:
+        if not self._batch:
+            return
+        if (
+            force
+            or len(self._batch) >= self.batch_size
+            or now - self._batch_started >= self.batch_window
+        ):
+            self._flush()
+
+    def _flush(self) -> None:
+        batch, self._batch = self._batch, []
+        low, self._batch_low = self._batch_low, []
+        files, self._batch_files = self._batch_files, []
+        self._batch_no += 1
+        unanswered = set(apply_llm_fallback(batch, low, self.fallback))
+        results, summary = validate_invoices(batch)
+
+        self._rotate_report()
+        self.report_path.parent.mkdir(parents=True, exist_ok=True)
+        with self.report_path.open("ab") as fh:
+            for inv, r in zip(batch, results):
+                line = {"batch": self._batch_no, "file_name": inv.file_name, **r.model_dump()}
+                fh.write(to_json(line) + b"\n")
+            fh.write(to_json({"batch": self._batch_no, "summary": summary}) + b"\n")
+
+        # LLM failures are reported unrefined but not recorded: the next
+        # start asks the LLM again
+        for index, (inv, (path, state)) in enumerate(zip(batch, files)):
+            if inv.extraction_error is None and index not in unanswered:
+                self._record(path, state, inv)
+        self._save_manifest()
+
+        print(
+            f"[WATCH] batch {self._batch_no}: {summary.total_invoices} invoices, "
+            f"Valid: {summary.valid_invoices}, Invalid: {summary.invalid_invoices}"
+        )
+
+    def _rotate_report(self) -> None:
+        try:
+            size = self.report_path.stat().st_size
+        except OSError:
+            return
+        if size < self.max_report_bytes:
+            return
+        stamp = time.strftime("%Y%m%d-%H%M%S")
+        rotated = self.report_path.with_name(
+            f"{self.report_path.stem}.{stamp}{self.report_path.suffix}"
+        )
+        self.report_path.rename(rotated)
+
+    # -----------------------------------------------------
+    # lifecycle
+    # -----------------------------------------------------
+    def stop(self) -> None:
+        self._stop.set()
+
+    def run(self, tick: float = 0.2) -> None:
+        observer = None
+        if self.use_inotify:
+            observer = Observer()
+            observer.schedule(_EventHandler(self._events), str(self.watch_dir), recursive=False)
+            observer.start()
+
+        self._load_manifest()
+        # New or changed since the last run (or everything, with
+        # process_existing on the first start)
+        self._scan(time.monotonic())
+        self._last_prune = time.monotonic()
+
+        mode = "inotify" if observer else f"polling every {self.poll_interval}s"
+        print(f"[WATCH] watching {self.watch_dir} ({mode}), report: {self.report_path}")
+
+        if ISOLATED:
+            pool = IsolatedPool(self.workers, initializer=_ignore_shutdown_signals)
+        else:
+            pool = ProcessPoolExecutor(max_workers=self.workers, initializer=_ignore_shutdown_signals)
+        try:
+            while not self._stop.is_set():
+                now = time.monotonic()
+                self._collect_events(now)
+                self._submit_ready(pool, now)
+                self._collect_done(now)
+                self._maybe_flush(now)
+                self._stop.wait(tick)
+        finally:
+            if observer is not None:
+                observer.stop()
+                observer.join()
+            # Drain: no new files, but finish everything already submitted
+            pool.shutdown(wait=True)
+            self._collect_done(time.monotonic())
+            self._maybe_flush(time.monotonic(), force=True)
+            print(f"[WATCH] stopped ({len(self._pending)} unprocessed files are picked up on the next start)")
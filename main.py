@@ -1,25 +1,146 @@
 # main.py
-from typing import List
-from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+from pathlib import Path, PurePosixPath
 import tempfile
 import os
-import json
 
-from fastapi import FastAPI, UploadFile, File
-from pydantic import BaseModel
+from fastapi import FastAPI, HTTPException, UploadFile, File, Query, Request, Response
+from fastapi.responses import FileResponse, StreamingResponse
+from fastapi.exceptions import RequestValidationError
+from pydantic import BaseModel, ValidationError
+from pydantic_core import to_json
+from starlette.concurrency import run_in_threadpool
 
-from invoice_qc.models import Invoice
-from invoice_qc.extractor import (
-    extract_text_from_pdf,
-    extract_text_from_image,
-    parse_raw_invoice,
+from invoice_qc.extractor import apply_llm_fallback
+from invoice_qc.llm_extract import get_fallback
+from invoice_qc.admission import AdmissionController, AdmissionRejected
+from invoice_qc.archives import (
+    archive_suffix,
+    count_members,
+    extract_member,
+    is_archive,
+    iter_members,
 )
+from invoice_qc.isolation import extract_documents
+from invoice_qc.bulk import validate_ndjson_stream
+from invoice_qc.pdf_backends import count_pdf_pages
+from invoice_qc import profiling
+from invoice_qc.profiling import ProfileSession, profile_requested, profiled, stage
+from invoice_qc.records import InvoiceRecord, records_from_json
 from invoice_qc.validator import validate_invoices
 from invoice_qc.gemini_fallback import _call_gemini
+from invoice_qc.query import InvoiceQueryEngine
+from invoice_qc.store import DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE, get_store
+from invoice_qc.chat import ChatSessionStore, ChatSessionTooLarge, build_prompt, build_prompt_prefix
 
 app = FastAPI(title="Invoice QC Service (Multilingual + AI Chat)")
 
 
+def _json_response(
+    payload, status_code: int = 200, headers: Optional[Dict[str, str]] = None
+) -> Response:
+    """
+    Serialize models/records straight to JSON bytes with pydantic-core,
+    skipping the model_dump() + jsonable_encoder round trip.
+    """
+    return Response(
+        content=to_json(payload),
+        status_code=status_code,
+        headers=headers,
+        media_type="application/json",
+    )
+
+
+# Caps concurrent extraction work; see invoice_qc/admission.py for the knobs
+admission = AdmissionController.from_env()
+
+
+def _admission_client(request: Request) -> str:
+    """
+    Admission queues are per remote address (behind a reverse proxy, run
+    uvicorn with --proxy-headers). A client-supplied header would let one
+    client open as many queues as it likes.
+    """
+    return request.client.host if request.client else "anonymous"
+
+
+def _admission_rejected(e: AdmissionRejected) -> Response:
+    return _json_response(
+        {"detail": e.reason, "queue": admission.snapshot()},
+        e.status_code,
+        {"Retry-After": str(e.retry_after)},
+    )
+
+
+class _AdmissionPrecheck:
+    """
+    Rejects extraction uploads that admission control would turn away
+    anyway before their body is read; FastAPI parses the multipart form
+    before the endpoint runs. Plain ASGI, so other routes (the streamed
+    NDJSON validation in particular) pass through untouched.
+    """
+
+    PATHS = frozenset({"/extract-and-validate-pdfs"})
+
+    def __init__(self, app) -> None:
+        self.app = app
+
+    async def __call__(self, scope, receive, send) -> None:
+        if scope["type"] == "http" and scope["method"] == "POST" and scope["path"] in self.PATHS:
+            try:
+                admission.check(_admission_client(Request(scope)))
+            except AdmissionRejected as e:
+                await _admission_rejected(e)(scope, receive, send)
+                return
+        await self.app(scope, receive, send)
+
+
+app.add_middleware(_AdmissionPrecheck)
+
+IMAGE_SUFFIXES = [".jpg", ".jpeg", ".png"]
+
+GEMINI_FAILED = "❌ Gemini API failed. Check your API key or backend logs."
+
+# Low-confidence extractions are re-read by the LLM ($INVOICE_QC_LLM_FALLBACK)
+llm_fallback = get_fallback()
+
+
+# ---------------------------------------------------------
+# OPT-IN REQUEST PROFILING (see invoice_qc/profiling.py)
+# ---------------------------------------------------------
+def _profile_value(request: Request) -> Optional[str]:
+    return request.headers.get("x-invoice-qc-profile") or request.query_params.get("profile")
+
+
+def _wants_profile(request: Request) -> bool:
+    """
+    True when the request asked for a profile via the X-Invoice-QC-Profile
+    header or ?profile=; 403 if profiling is not allowed for it.
+    """
+    try:
+        return profile_requested(_profile_value(request))
+    except PermissionError as e:
+        raise HTTPException(status_code=403, detail=str(e))
+
+
+def _profile_payload(session: ProfileSession, label: str) -> Dict:
+    path = profiling.save_request_profile(session, label)
+    return {**session.summary(), "file": path.name if path else None}
+
+
+@app.get("/profiles/{name}")
+def download_profile(name: str, request: Request):
+    """
+    Download a saved request profile (pstats format, for snakeviz/pstats).
+    """
+    if not _wants_profile(request):
+        raise HTTPException(status_code=403, detail="Send the profiling header or ?profile=")
+    path = Path(profiling.PROFILE_DIR) / name
+    if Path(name).name != name or path.suffix != ".prof" or not path.is_file():
+        raise HTTPException(status_code=404, detail="Profile not found")
+    return FileResponse(path, media_type="application/octet-stream", filename=name)
+
+
 # ---------------------------------------------------------
 # HEALTH / OCR STATUS
 # ---------------------------------------------------------
@@ -28,6 +149,14 @@ def health():
     return {"status": "ok", "gemini_key_loaded": bool(os.getenv("GEMINI_API_KEY"))}
 
 
+@app.get("/admission-status")
+def admission_status():
+    """
+    Current extraction queue depth and wait estimate (for autoscaling).
+    """
+    return admission.snapshot()
+
+
 @app.get("/ocr-status")
 def ocr_status():
     """
@@ -45,47 +174,280 @@ def ocr_status():
 # ---------------------------------------------------------
 # VALIDATE JSON DIRECTLY (for API / tests)
 # ---------------------------------------------------------
-@app.post("/validate-json")
-def validate_json(invoices: List[Invoice]):
-    results, summary = validate_invoices(invoices)
+@app.post(
+    "/validate-json",
+    openapi_extra={
+        "requestBody": {
+            "required": True,
+            "content": {
+                "application/json": {
+                    "schema": {"type": "array", "items": {"type": "object"}},
+                    "description": "List of Invoice objects",
+                }
+            },
+        }
+    },
+)
+async def validate_json(request: Request):
+    want_profile = _wants_profile(request)
+    body = await request.body()
 
-    return {
-        "summary": summary.model_dump(),
-        "results": [r.model_dump() for r in results],
-    }
+    with profiled(want_profile) as session:
+        # Validate the whole array in one TypeAdapter pass straight from the
+        # body bytes instead of building one Invoice model per element.
+        try:
+            with stage("parse_json"):
+                invoices = records_from_json(body)
+        except ValidationError as e:
+            raise RequestValidationError(
+                [{**err, "loc": ("body", *err["loc"])} for err in e.errors(include_url=False)]
+            )
+
+        results, summary = validate_invoices(invoices)
+
+    payload = {"summary": summary, "results": results}
+    store = get_store()
+    if store is not None:
+        payload["batch_id"] = await run_in_threadpool(
+            store.save_batch, "validate-json", invoices, results, summary
+        )
+    if session is not None:
+        payload["profile"] = _profile_payload(session, "validate-json")
+    return _json_response(payload)
+
+
+class _BodyStreamingResponse(StreamingResponse):
+    """
+    StreamingResponse whose content reads the request body while it is sent.
+    Starlette's version also calls ``receive()`` to watch for disconnects,
+    which would take body chunks away from the content; here the body
+    stream notices the disconnect itself.
+    """
+
+    async def __call__(self, scope, receive, send) -> None:
+        await self.stream_response(send)
+
+
+@app.post(
+    "/validate-ndjson",
+    openapi_extra={
+        "requestBody": {
+            "required": True,
+            "content": {
+                "application/x-ndjson": {
+                    "schema": {"type": "string"},
+                    "description": "One Invoice object per line",
+                }
+            },
+        }
+    },
+)
+async def validate_ndjson(request: Request):
+    """
+    Bulk validation for uploads too large for /validate-json: invoices are
+    parsed and validated chunk by chunk as the body arrives, and one result
+    line per invoice is streamed back, followed by a summary line.
+    See invoice_qc/bulk.py for the line formats.
+    """
+    return _BodyStreamingResponse(
+        validate_ndjson_stream(request.stream(), store=get_store()),
+        media_type="application/x-ndjson",
+    )
 
 
 # ---------------------------------------------------------
 # EXTRACT + VALIDATE PDFs/IMAGES
 # ---------------------------------------------------------
-@app.post("/extract-and-validate-pdfs")
-async def extract_and_validate_pdfs(files: List[UploadFile] = File(...)):
-    invoices: List[Invoice] = []
-
-    for f in files:
-        suffix = Path(f.filename).suffix.lower()
-        with tempfile.NamedTemporaryFile(delete=False, suffix=suffix) as tmp:
-            tmp.write(await f.read())
-            tmp_path = Path(tmp.name)
-
-        # Decide PDF vs image
-        if suffix in [".jpg", ".jpeg", ".png"]:
-            raw = extract_text_from_image(tmp_path)
+def _upload_cost(suffix: str, path: Path) -> Tuple[int, int]:
+    """(documents, pages) of one upload, for admission control."""
+    if suffix in IMAGE_SUFFIXES:
+        return 1, 1
+    if is_archive(suffix):
+        # Counting member pages would mean reading every member: one page each
+        try:
+            members = count_members(path)
+        except Exception:
+            members = 1
+        return members, members
+    try:
+        return 1, count_pdf_pages(path)
+    except Exception:
+        return 1, 1  # unreadable PDFs still cost one extraction attempt
+
+
+def _upload_documents(uploads: List[Tuple[str, str, Path]]):
+    """
+    ``extract_member`` arguments per document, recorded under the uploaded
+    file name; archives yield one per member, under the member path.
+    """
+    for name, suffix, tmp_path in uploads:
+        if is_archive(suffix):
+            for member, data in iter_members(tmp_path):
+                yield member, (member, data, None, None)
         else:
-            raw = extract_text_from_pdf(tmp_path)
+            yield name, (name, tmp_path, None, None)
 
-        invoice = parse_raw_invoice(raw)
-        invoices.append(invoice)
 
-        tmp_path.unlink(missing_ok=True)
+def _extract_and_validate(uploads: List[Tuple[str, str, Path]], profile: bool = False) -> Dict:
+    # Profiled in the worker thread itself: cProfile only follows its own thread,
+    # so a profiled request also extracts in-process instead of in the isolated pool
+    with profiled(profile) as session:
+        invoices: List[InvoiceRecord] = []
+        pending = []
+        extracted = extract_documents(
+            extract_member, _upload_documents(uploads), isolated=False if profile else None
+        )
+        for record, confidence, text in extracted:
+            if llm_fallback is not None and llm_fallback.needs_llm(confidence):
+                pending.append((len(invoices), text, record, confidence))
+            invoices.append(record)
+        apply_llm_fallback(invoices, pending, llm_fallback)
 
-    results, summary = validate_invoices(invoices)
+        results, summary = validate_invoices(invoices)
 
-    return {
-        "summary": summary.model_dump(),
-        "invoices": [inv.model_dump() for inv in invoices],
-        "results": [r.model_dump() for r in results],
-    }
+    payload = {"summary": summary, "invoices": invoices, "results": results}
+    store = get_store()
+    if store is not None:
+        payload["batch_id"] = store.save_batch(
+            "extract-and-validate-pdfs", invoices, results, summary
+        )
+    if session is not None:
+        payload["profile"] = _profile_payload(session, "extract-and-validate-pdfs")
+    return payload
+
+
+@app.post("/extract-and-validate-pdfs")
+async def extract_and_validate_pdfs(request: Request, files: List[UploadFile] = File(...)):
+    """
+    PDFs and images, or ZIP/TAR archives of them; archive members are
+    extracted one by one from memory (see invoice_qc/archives.py).
+    """
+    want_profile = _wants_profile(request)
+    # (display name, suffix, temporary file) per upload
+    uploads: List[Tuple[str, str, Path]] = []
+    try:
+        for f in files:
+            suffix = archive_suffix(f.filename or "") or Path(f.filename).suffix.lower()
+            with tempfile.NamedTemporaryFile(delete=False, suffix=suffix) as tmp:
+                # Copied in pieces: archives can be much larger than one PDF
+                while chunk := await f.read(1 << 20):
+                    tmp.write(chunk)
+                name = PurePosixPath(f.filename or "").name or Path(tmp.name).name
+                uploads.append((name, suffix, Path(tmp.name)))
+
+        costs = await run_in_threadpool(
+            lambda: [_upload_cost(suffix, path) for _, suffix, path in uploads]
+        )
+        docs = sum(d for d, _ in costs)
+        pages = sum(p for _, p in costs)
+        try:
+            ticket = await admission.acquire(_admission_client(request), docs, pages)
+        except AdmissionRejected as e:
+            return _admission_rejected(e)
+
+        try:
+            # Off the event loop so queued requests and health checks keep flowing
+            payload = await run_in_threadpool(_extract_and_validate, uploads, want_profile)
+        finally:
+            admission.release(ticket)
+    finally:
+        for _, _, path in uploads:
+            path.unlink(missing_ok=True)
+
+    return _json_response(payload)
+
+
+# ---------------------------------------------------------
+# STORED BATCHES (opt-in, see invoice_qc/store.py)
+# ---------------------------------------------------------
+def _store():
+    store = get_store()
+    if store is None:
+        raise HTTPException(status_code=404, detail="Result store is disabled")
+    return store
+
+
+@app.get("/batches")
+def list_batches(limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE)):
+    """
+    Most recent stored batches with their summaries.
+    """
+    return _json_response(_store().batches(limit))
+
+
+@app.delete("/batches/{batch_id}")
+def delete_batch(batch_id: str):
+    if not _store().delete_batch(batch_id):
+        raise HTTPException(status_code=404, detail="Batch not found")
+    return {"deleted": batch_id}
+
+
+def _stored_page(
+    column: str,
+    batch_id: Optional[str],
+    seller: Optional[str],
+    currency: Optional[str],
+    date_from: Optional[str],
+    date_to: Optional[str],
+    is_valid: Optional[bool],
+    error: Optional[str],
+    after: int,
+    limit: int,
+) -> Response:
+    content = _store().page(
+        column,
+        batch_id=batch_id,
+        seller=seller,
+        currency=currency,
+        date_from=date_from,
+        date_to=date_to,
+        is_valid=is_valid,
+        error=error,
+        after=after,
+        limit=limit,
+    )
+    return Response(content=content, media_type="application/json")
+
+
+@app.get("/invoices")
+def stored_invoices(
+    batch_id: Optional[str] = None,
+    seller: Optional[str] = None,
+    currency: Optional[str] = None,
+    date_from: Optional[str] = None,
+    date_to: Optional[str] = None,
+    is_valid: Optional[bool] = None,
+    error: Optional[str] = None,
+    after: int = Query(0, ge=0, description="next_after of the previous page"),
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+):
+    """
+    One page of stored invoices. Filters combine with AND; ``error`` is a
+    full error code such as ``format: invalid_currency``.
+    """
+    return _stored_page(
+        "invoice", batch_id, seller, currency, date_from, date_to, is_valid, error, after, limit
+    )
+
+
+@app.get("/results")
+def stored_results(
+    batch_id: Optional[str] = None,
+    seller: Optional[str] = None,
+    currency: Optional[str] = None,
+    date_from: Optional[str] = None,
+    date_to: Optional[str] = None,
+    is_valid: Optional[bool] = None,
+    error: Optional[str] = None,
+    after: int = Query(0, ge=0, description="next_after of the previous page"),
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+):
+    """
+    One page of stored validation results, with the same filters as /invoices.
+    """
+    return _stored_page(
+        "result", batch_id, seller, currency, date_from, date_to, is_valid, error, after, limit
+    )
 
 
 # ---------------------------------------------------------
@@ -102,31 +464,98 @@ def chat_direct(req: ChatDirectRequest):
     """
     Multilingual invoice chatbot:
     - Uses ONLY the provided invoice JSON + summary (no external DB)
+    - Aggregate questions (counts / sums by seller, currency, ...) are
+      answered exactly by the local query engine, without calling Gemini
     - Responds in the SAME LANGUAGE as the user's question
     """
+    local_answer = InvoiceQueryEngine(req.invoices, req.summary).answer(req.question)
+    if local_answer is not None:
+        return {"answer": local_answer, "source": "local"}
 
-    prompt = f"""
-You are a multilingual invoice assistant.
+    prompt = build_prompt(build_prompt_prefix(req.invoices, req.summary), req.question)
 
-You must answer ONLY using the invoice data provided.
-If the answer is not present in the invoices, reply:
-"Information not found in the invoices."
+    answer = _call_gemini(prompt)
 
-Always respond in the SAME LANGUAGE as the user's question.
+    if not answer:
+        return {"answer": GEMINI_FAILED}
 
---- INVOICES (JSON) ---
-{json.dumps(req.invoices, indent=2, ensure_ascii=False)}
+    return {"answer": answer, "source": "llm"}
 
---- SUMMARY (JSON) ---
-{json.dumps(req.summary, indent=2, ensure_ascii=False)}
 
---- USER QUESTION ---
-{req.question}
-"""
+# ---------------------------------------------------------
+# CHAT SESSIONS (invoice context uploaded once, kept server-side)
+# ---------------------------------------------------------
+chat_sessions = ChatSessionStore()
 
-    answer = _call_gemini(prompt)
 
-    if not answer:
-        return {"answer": "❌ Gemini API failed. Check your API key or backend logs."}
+class ChatSessionCreate(BaseModel):
+    invoices: list
+    summary: dict
 
-    return {"answer": answer}
+
+class ChatMessageRequest(BaseModel):
+    question: str
+
+
+@app.post("/chat/sessions")
+def create_chat_session(req: ChatSessionCreate):
+    """
+    Store an invoice set for follow-up questions; the prompt prefix and the
+    query engine are built once here. Sessions expire after
+    INVOICE_QC_CHAT_SESSION_TTL seconds without use; the least recently used
+    ones are evicted when INVOICE_QC_CHAT_SESSIONS_MAX_MB is reached.
+    """
+    try:
+        session = chat_sessions.create(req.invoices, req.summary)
+    except ChatSessionTooLarge as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    return {
+        "session_id": session.session_id,
+        "invoice_count": session.invoice_count,
+        "ttl_seconds": chat_sessions.ttl,
+    }
+
+
+@app.post("/chat/sessions/{session_id}/messages")
+def chat_session_message(session_id: str, req: ChatMessageRequest):
+    session = chat_sessions.get(session_id)
+    if session is None:
+        raise HTTPException(status_code=404, detail="Chat session not found or expired")
+
+    answer = session.engine.answer(req.question)
+    source = "local"
+    if answer is None:
+        answer = _call_gemini(session.prompt(req.question))
+        source = "llm"
+        if not answer:
+            return {"answer": GEMINI_FAILED, "session_id": session_id}
+
+    session.record(req.question, answer)
+    return {"answer": answer, "source": source, "session_id": session_id}
+
+
+@app.delete("/chat/sessions/{session_id}")
+def delete_chat_session(session_id: str):
+    if not chat_sessions.delete(session_id):
+        raise HTTPException(status_code=404, detail="Chat session not found or expired")
+    return {"deleted": session_id}
+
+
+# ---------------------------------------------------------
+# STRUCTURED AGGREGATE QUERIES (no LLM)
+# ---------------------------------------------------------
+class QueryRequest(BaseModel):
+    invoices: list
+    summary: dict = {}
+    metric: str = "count"  # count | net_total | tax_amount | gross_total
+    group_by: Optional[str] = None  # seller | buyer | currency | month | year | error_code
+    filters: Dict[str, str] = {}
+
+
+@app.post("/query")
+def query_invoices(req: QueryRequest):
+    engine = InvoiceQueryEngine(req.invoices, req.summary)
+    try:
+        return engine.query(req.metric, req.group_by, req.filters)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
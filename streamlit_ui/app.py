@@ -1,12 +1,25 @@
 # app.py
+import hashlib
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import pandas as pd
 import streamlit as st
 import requests
 import json
+from requests.adapters import HTTPAdapter
+from streamlit.runtime.scriptrunner import add_script_run_ctx, get_script_run_ctx
+from urllib3.util.retry import Retry
 
 # CHANGE THIS if running backend locally:
 # BACKEND_URL = "http://127.0.0.1:8000"
 BACKEND_URL = "https://invoice-qc-service-lakshmi.onrender.com"
 
+# Parallel upload: files per request and concurrent requests
+UPLOAD_CHUNK_SIZE = 8
+UPLOAD_WORKERS = 4
+PAGE_SIZES = [25, 50, 100, 250]
+
 st.set_page_config(
     page_title="Invoice QC System",
     layout="wide",
@@ -16,36 +29,220 @@ st.set_page_config(
 st.title("🧾 Invoice QC System (Multilingual + AI Chat)")
 
 
+# ============================================================
+# BACKEND CLIENT
+# ============================================================
+@st.cache_resource
+def _http_session() -> requests.Session:
+    """
+    One pooled keep-alive session for every request of this app. Busy-server
+    responses (429/503 from admission control) are retried after their
+    Retry-After delay.
+    """
+    session = requests.Session()
+    retry = Retry(
+        total=3,
+        backoff_factor=1.0,
+        status_forcelist=[429, 503],
+        allowed_methods=None,  # uploads are safe to resend
+        raise_on_status=False,
+    )
+    adapter = HTTPAdapter(
+        pool_connections=UPLOAD_WORKERS, pool_maxsize=UPLOAD_WORKERS, max_retries=retry
+    )
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+
+@st.cache_data(ttl=300, show_spinner=False)
+def _ocr_available(backend_url: str) -> bool:
+    try:
+        ocr_res = _http_session().get(f"{backend_url}/ocr-status", timeout=3)
+        return ocr_res.json().get("ocr_available", False)
+    except Exception:
+        return False
+
+
+@st.cache_data(max_entries=2000, show_spinner=False)
+def _extract_chunk(digests: tuple, backend_url: str, _files: list) -> list:
+    """
+    Extract one chunk of files; cached on the files' SHA-256 so re-running
+    the same selection does not upload anything again. Validation is not
+    cached here, it runs once over the whole batch.
+    """
+    files = [("files", (name, content, mime)) for name, content, mime in _files]
+    res = _http_session().post(
+        f"{backend_url}/extract-and-validate-pdfs", files=files, timeout=300
+    )
+    res.raise_for_status()
+    return res.json()["invoices"]
+
+
+def _upload_in_chunks(uploaded, progress) -> list:
+    """
+    Extract every uploaded file with parallel chunked requests and return
+    the invoices in upload order. Identical files are uploaded once.
+    """
+    unique = {}
+    order = []
+    for f in uploaded:
+        content = f.getvalue()
+        digest = hashlib.sha256(content).hexdigest()
+        order.append(digest)
+        if digest not in unique:
+            mime = getattr(f, "type", None) or "application/octet-stream"
+            unique[digest] = (f.name, content, mime)
+
+    digests = list(unique)
+    chunks = [
+        digests[i : i + UPLOAD_CHUNK_SIZE] for i in range(0, len(digests), UPLOAD_CHUNK_SIZE)
+    ]
+
+    # Worker threads need the script context to use the Streamlit caches
+    ctx = get_script_run_ctx()
+    by_digest = {}
+    done_files = 0
+    with ThreadPoolExecutor(
+        max_workers=UPLOAD_WORKERS,
+        initializer=lambda: add_script_run_ctx(threading.current_thread(), ctx),
+    ) as pool:
+        futures = {
+            pool.submit(
+                _extract_chunk, tuple(chunk), BACKEND_URL, [unique[d] for d in chunk]
+            ): chunk
+            for chunk in chunks
+        }
+        for future in as_completed(futures):
+            chunk = futures[future]
+            by_digest.update(zip(chunk, future.result()))
+            done_files += len(chunk)
+            progress.progress(
+                done_files / len(digests),
+                text=f"Extracted {done_files} / {len(digests)} files",
+            )
+
+    return [by_digest[d] for d in order]
+
+
+def _validate_batch(invoices: list) -> dict:
+    # One validation over the whole batch so duplicates across chunks count
+    res = _http_session().post(
+        f"{BACKEND_URL}/validate-json", data=json.dumps(invoices), timeout=120,
+        headers={"Content-Type": "application/json"},
+    )
+    res.raise_for_status()
+    return res.json()
+
+
+def _chat_session_id(refresh: bool = False) -> str:
+    """Server-side chat session for the current batch (created on first use)."""
+    if refresh or "chat_session_id" not in st.session_state:
+        res = _http_session().post(
+            f"{BACKEND_URL}/chat/sessions",
+            json={
+                "invoices": st.session_state["invoices"],
+                "summary": st.session_state["summary"],
+            },
+            timeout=60,
+        )
+        res.raise_for_status()
+        st.session_state["chat_session_id"] = res.json()["session_id"]
+    return st.session_state["chat_session_id"]
+
+
+def _ask(question: str) -> requests.Response:
+    # Only the question is sent; the invoices live in the server-side session
+    def post(session_id: str) -> requests.Response:
+        return _http_session().post(
+            f"{BACKEND_URL}/chat/sessions/{session_id}/messages",
+            json={"question": question},
+            timeout=120,
+        )
+
+    res = post(_chat_session_id())
+    if res.status_code == 404:
+        # Session expired on the server: upload the batch once more
+        res = post(_chat_session_id(refresh=True))
+    return res
+
+
+def _results_table(invoices: list, results: list) -> pd.DataFrame:
+    rows = []
+    for inv, res in zip(invoices, results):
+        rows.append(
+            {
+                "invoice_number": inv.get("invoice_number"),
+                "invoice_date": inv.get("invoice_date"),
+                "seller_name": inv.get("seller_name"),
+                "buyer_name": inv.get("buyer_name"),
+                "currency": inv.get("currency"),
+                "net_total": inv.get("net_total"),
+                "tax_amount": inv.get("tax_amount"),
+                "gross_total": inv.get("gross_total"),
+                "is_valid": res.get("is_valid"),
+                "errors": "; ".join(res.get("errors") or []),
+            }
+        )
+    return pd.DataFrame(rows)
+
+
 # ============================================================
 # SIDEBAR → UPLOAD
 # ============================================================
 st.sidebar.header("📤 Upload Invoices")
 
 uploaded_files = st.sidebar.file_uploader(
-    "Select one or more invoice files (PDF, PNG, JPG)",
-    type=["pdf", "png", "jpg", "jpeg"],
+    "Select one or more invoice files (PDF, PNG, JPG, or ZIP/TAR archives)",
+    type=["pdf", "png", "jpg", "jpeg", "zip", "tar", "tgz"],
     accept_multiple_files=True,
 )
 
-# OCR status info
-try:
-    ocr_res = requests.get(f"{BACKEND_URL}/ocr-status", timeout=3)
-    ocr_ok = ocr_res.json().get("ocr_available", False)
-except Exception:
-    ocr_ok = False
+# OCR status info (cached, not re-checked on every rerun)
+ocr_ok = _ocr_available(BACKEND_URL)
 
 if not ocr_ok:
     st.sidebar.warning("OCR not available on server — image invoices may not parse well.")
 else:
     st.sidebar.info("OCR available: image invoices will be OCR’ed server-side.")
 
+parallel_upload = st.sidebar.checkbox(
+    "Parallel chunked upload",
+    value=True,
+    help=f"Send {UPLOAD_CHUNK_SIZE} files per request, {UPLOAD_WORKERS} requests at a time, "
+    "and reuse results for files already processed.",
+)
+
 process_btn = st.sidebar.button("Process Invoices")
 
 
 # ============================================================
 # PROCESS PDFs/IMAGES
 # ============================================================
-if process_btn and uploaded_files:
+if process_btn and uploaded_files and parallel_upload:
+    progress = st.progress(0.0, text=f"Extracting {len(uploaded_files)} files...")
+    try:
+        invoices = _upload_in_chunks(uploaded_files, progress)
+        with st.spinner("Validating batch..."):
+            data = _validate_batch(invoices)
+    except requests.HTTPError as e:
+        st.error("❌ Backend returned an error.")
+        st.text(e.response.text if e.response is not None else str(e))
+        st.stop()
+    except Exception as e:
+        st.error(f"❌ Could not reach backend: {e}")
+        st.stop()
+    progress.empty()
+
+    st.session_state["invoices"] = invoices
+    st.session_state["summary"] = data["summary"]
+    st.session_state["results"] = data["results"]
+    st.session_state.setdefault("messages", [])
+    st.session_state.pop("chat_session_id", None)  # new batch, new chat context
+
+    st.success("Invoices processed successfully!")
+
+elif process_btn and uploaded_files:
     with st.spinner("Extracting + validating invoices..."):
         files = []
         for f in uploaded_files:
@@ -53,7 +250,7 @@ if process_btn and uploaded_files:
             files.append(("files", (f.name, f, mime)))
 
         try:
-            res = requests.post(f"{BACKEND_URL}/extract-and-validate-pdfs", files=files)
+            res = _http_session().post(f"{BACKEND_URL}/extract-and-validate-pdfs", files=files)
         except Exception as e:
             st.error(f"❌ Could not reach backend: {e}")
             st.stop()
@@ -68,6 +265,7 @@ if process_btn and uploaded_files:
         st.session_state["summary"] = data["summary"]
         st.session_state["results"] = data["results"]
         st.session_state.setdefault("messages", [])
+        st.session_state.pop("chat_session_id", None)  # new batch, new chat context
 
         st.success("Invoices processed successfully!")
 
@@ -77,7 +275,42 @@ if process_btn and uploaded_files:
 # ============================================================
 if "invoices" in st.session_state:
     st.subheader("📄 Extracted Invoice Data")
-    st.json(st.session_state["invoices"])
+    table = _results_table(st.session_state["invoices"], st.session_state["results"])
+
+    col_search, col_status, col_error = st.columns([2, 1, 2])
+    search = col_search.text_input("Search (invoice number, seller, buyer)")
+    status = col_status.selectbox("Status", ["All", "Valid", "Invalid"])
+    error_codes = sorted(st.session_state["summary"].get("error_counts", {}))
+    wanted_errors = col_error.multiselect("Has error", error_codes)
+
+    view = table
+    if search:
+        needle = search.lower()
+        view = view[
+            view[["invoice_number", "seller_name", "buyer_name"]]
+            .fillna("")
+            .apply(lambda col: col.str.lower().str.contains(needle, regex=False))
+            .any(axis=1)
+        ]
+    if status != "All":
+        view = view[view["is_valid"] == (status == "Valid")]
+    for code in wanted_errors:
+        view = view[view["errors"].str.contains(code, regex=False)]
+
+    col_size, col_page = st.columns([1, 1])
+    page_size = col_size.selectbox("Rows per page", PAGE_SIZES)
+    pages = max(1, -(-len(view) // page_size))
+    page = col_page.number_input(f"Page (of {pages})", min_value=1, max_value=pages, value=1)
+    start = (page - 1) * page_size
+    st.dataframe(view.iloc[start : start + page_size], width="stretch", hide_index=True)
+    st.caption(f"{len(view)} of {len(table)} invoices match")
+
+    st.download_button(
+        "Download invoices (JSON)",
+        json.dumps(st.session_state["invoices"], ensure_ascii=False),
+        file_name="invoices.json",
+        mime="application/json",
+    )
 
 # ============================================================
 # SHOW VALIDATION SUMMARY
@@ -104,14 +337,8 @@ if "invoices" in st.session_state:
         if not user_input.strip():
             st.warning("Please type a question.")
         else:
-            payload = {
-                "invoices": st.session_state["invoices"],
-                "summary": st.session_state["summary"],
-                "question": user_input,
-            }
-
             try:
-                res = requests.post(f"{BACKEND_URL}/chat-direct", json=payload)
+                res = _ask(user_input)
             except Exception as e:
                 st.error(f"❌ Could not reach backend: {e}")
                 st.stop()
@@ -0,0 +1,44 @@
+import asyncio
+
+import pytest
+
+from invoice_qc.admission import AdmissionController, AdmissionRejected
+
+
+def _controller(**kwargs):
+    options = dict(max_docs=1, max_pages=100, latency_target=60, max_queued_per_client=1)
+    options.update(kwargs)
+    return AdmissionController(**options)
+
+
+def test_check_rejects_a_client_with_a_full_queue():
+    async def scenario():
+        controller = _controller()
+        running = await controller.acquire("10.0.0.1", 1, 1)
+        waiting = asyncio.ensure_future(controller.acquire("10.0.0.1", 1, 1))
+        await asyncio.sleep(0)
+
+        with pytest.raises(AdmissionRejected) as e:
+            controller.check("10.0.0.1")
+        assert e.value.status_code == 429
+        controller.check("10.0.0.2")
+
+        controller.release(running)
+        controller.release(await waiting)
+        controller.check("10.0.0.1")
+
+    asyncio.run(scenario())
+
+
+def test_check_rejects_over_the_latency_target():
+    async def scenario():
+        controller = _controller(latency_target=0)
+        controller.check("10.0.0.1")
+        ticket = await controller.acquire("10.0.0.1", 1, 1)
+        with pytest.raises(AdmissionRejected) as e:
+            controller.check("10.0.0.2")
+        assert e.value.status_code == 503
+        assert controller.rejected[503] == 1
+        controller.release(ticket)
+
+    asyncio.run(scenario())
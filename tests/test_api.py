@@ -0,0 +1,101 @@
+import asyncio
+import io
+import zipfile
+from collections import deque
+from pathlib import Path
+
+import pytest
+from fastapi.testclient import TestClient
+
+import main
+from invoice_qc.admission import AdmissionController, AdmissionTicket
+
+SAMPLE_PDF = Path(__file__).resolve().parent.parent / "pdfs" / "sample_pdf_1.pdf"
+
+
+@pytest.fixture
+def client():
+    return TestClient(main.app)
+
+
+def test_pdf_upload_is_recorded_under_its_file_name(client):
+    response = client.post(
+        "/extract-and-validate-pdfs",
+        files=[("files", ("mine.pdf", SAMPLE_PDF.read_bytes(), "application/pdf"))],
+    )
+    assert response.status_code == 200
+    (invoice,) = response.json()["invoices"]
+    assert invoice["file_name"] == "mine.pdf"
+
+
+def test_archive_members_are_recorded_under_their_path(client):
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w") as zf:
+        zf.writestr("march/mine.pdf", SAMPLE_PDF.read_bytes())
+    response = client.post(
+        "/extract-and-validate-pdfs",
+        files=[("files", ("batch.zip", buffer.getvalue(), "application/zip"))],
+    )
+    assert response.status_code == 200
+    (invoice,) = response.json()["invoices"]
+    assert invoice["file_name"] == "march/mine.pdf"
+
+
+def _post_without_reading_body(headers):
+    """Send an upload straight to the ASGI app; returns (status, body_was_read)."""
+    body_read = False
+    messages = []
+
+    async def receive():
+        nonlocal body_read
+        body_read = True
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    async def send(message):
+        messages.append(message)
+
+    scope = {
+        "type": "http",
+        "asgi": {"version": "3.0"},
+        "http_version": "1.1",
+        "method": "POST",
+        "scheme": "http",
+        "path": "/extract-and-validate-pdfs",
+        "raw_path": b"/extract-and-validate-pdfs",
+        "root_path": "",
+        "query_string": b"",
+        "headers": [(k.encode(), v.encode()) for k, v in headers.items()],
+        "client": ("10.0.0.1", 50000),
+        "server": ("testserver", 80),
+    }
+    asyncio.run(main.app(scope, receive, send))
+    return messages[0]["status"], body_read
+
+
+def test_rejected_upload_is_not_read(monkeypatch):
+    controller = AdmissionController(
+        max_docs=1, max_pages=100, latency_target=0, max_queued_per_client=4
+    )
+    controller.inflight_docs = 1  # saturated: any wait is over the target
+    monkeypatch.setattr(main, "admission", controller)
+
+    status, body_read = _post_without_reading_body(
+        {"content-type": "multipart/form-data; boundary=x", "content-length": "1000000"}
+    )
+    assert status == 503
+    assert not body_read
+
+
+def test_client_id_header_does_not_open_another_queue(monkeypatch):
+    controller = AdmissionController(
+        max_docs=1, max_pages=100, latency_target=60, max_queued_per_client=1
+    )
+    # One request of 10.0.0.1 already waiting
+    controller._queues["10.0.0.1"] = deque([AdmissionTicket("10.0.0.1", 1, 1)])
+    monkeypatch.setattr(main, "admission", controller)
+
+    status, body_read = _post_without_reading_body(
+        {"content-type": "multipart/form-data; boundary=x", "x-client-id": "someone-else"}
+    )
+    assert status == 429
+    assert not body_read
@@ -0,0 +1,84 @@
+import io
+import tarfile
+import zipfile
+from pathlib import Path
+
+import pytest
+
+from invoice_qc import archives
+from invoice_qc.archives import count_members, iter_archive_records, iter_members
+from invoice_qc.sharding import in_shard
+
+SAMPLE_PDF = (Path(__file__).resolve().parent.parent / "pdfs" / "sample_pdf_1.pdf").read_bytes()
+
+MEMBERS = {
+    "top.pdf": SAMPLE_PDF,
+    "2024/march/nested.PDF": SAMPLE_PDF,
+    "2024/march/scan.png": b"png",
+    "2024/notes.txt": b"not an invoice",
+    "2024/.hidden.pdf": SAMPLE_PDF,
+    "__MACOSX/2024/._nested.pdf": b"resource fork",
+}
+EXPECTED = ["top.pdf", "2024/march/nested.PDF", "2024/march/scan.png"]
+
+
+def _zip(path):
+    with zipfile.ZipFile(path, "w") as zf:
+        zf.writestr("2024/march/", b"")
+        for name, data in MEMBERS.items():
+            zf.writestr(name, data)
+    return path
+
+
+def _tar(path, prefix=""):
+    with tarfile.open(path, "w:gz") as tf:
+        for name, data in MEMBERS.items():
+            info = tarfile.TarInfo(prefix + name)
+            info.size = len(data)
+            tf.addfile(info, io.BytesIO(data))
+    return path
+
+
+@pytest.mark.parametrize("build, filename", [(_zip, "batch.zip"), (_tar, "batch.tar.gz")])
+def test_members_keep_their_path_and_skip_non_documents(tmp_path, build, filename):
+    archive = build(tmp_path / filename)
+    members = list(iter_members(archive))
+    assert [name for name, _ in members] == EXPECTED
+    assert members[0][1] == SAMPLE_PDF
+    assert count_members(archive) == len(EXPECTED)
+
+
+def test_tar_made_inside_the_folder_drops_dot_prefix(tmp_path):
+    archive = _tar(tmp_path / "batch.tgz", prefix="./")
+    assert [name for name, _ in iter_members(archive)] == EXPECTED
+
+
+def test_file_object_needs_the_archive_name(tmp_path):
+    archive = _zip(tmp_path / "batch.zip")
+    with archive.open("rb") as fh:
+        assert [name for name, _ in iter_members(fh, name="upload.zip")] == EXPECTED
+
+
+def test_oversized_members_are_skipped(tmp_path, monkeypatch):
+    monkeypatch.setattr(archives, "MAX_MEMBER_BYTES", 1000)
+    archive = _zip(tmp_path / "batch.zip")
+    assert [name for name, _ in iter_members(archive)] == ["2024/march/scan.png"]
+
+
+def test_shard_selects_by_file_name(tmp_path):
+    archive = _zip(tmp_path / "batch.zip")
+    for index in range(2):
+        shard = (index, 2)
+        expected = [n for n in EXPECTED if in_shard(Path(n).name, shard)]
+        assert [name for name, _ in iter_members(archive, shard=shard)] == expected
+
+
+def test_records_are_named_by_member_path(tmp_path):
+    archive = tmp_path / "batch.zip"
+    with zipfile.ZipFile(archive, "w") as zf:
+        zf.writestr("march/a.pdf", SAMPLE_PDF)
+        zf.writestr("april/b.pdf", SAMPLE_PDF)
+        zf.writestr("readme.txt", b"skip me")
+    records = [r for r, _, _ in iter_archive_records(archive)]
+    assert [r.file_name for r in records] == ["march/a.pdf", "april/b.pdf"]
+    assert all(r.extraction_error is None for r in records)
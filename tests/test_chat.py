@@ -0,0 +1,52 @@
+import pytest
+
+from invoice_qc.chat import ChatSessionStore, ChatSessionTooLarge, build_prompt_prefix
+
+
+def _invoices(count):
+    return [{"invoice_number": f"INV-{i:04d}", "net_total": 100.0} for i in range(count)]
+
+
+def _size(invoices):
+    return len(build_prompt_prefix(invoices, {}).encode("utf-8"))
+
+
+def test_sessions_are_evicted_by_size():
+    small = _invoices(10)
+    store = ChatSessionStore(max_bytes=_size(small) * 2 + 1)
+    first = store.create(small, {})
+    second = store.create(small, {})
+    # Touch the first so the second is the least recently used
+    assert store.get(first.session_id) is not None
+
+    third = store.create(small, {})
+    assert store.get(second.session_id) is None
+    assert store.get(first.session_id) is not None
+    assert store.get(third.session_id) is not None
+    assert store.total_bytes == first.size + third.size <= store.max_bytes
+
+
+def test_large_session_evicts_several():
+    store = ChatSessionStore(max_bytes=_size(_invoices(40)) + 10)
+    small = [store.create(_invoices(10), {}) for _ in range(3)]
+    big = store.create(_invoices(40), {})
+    assert all(store.get(s.session_id) is None for s in small)
+    assert len(store) == 1
+    assert store.total_bytes == big.size
+
+
+def test_oversized_invoice_set_is_refused():
+    store = ChatSessionStore(max_bytes=_size(_invoices(5)))
+    kept = store.create(_invoices(5), {})
+    with pytest.raises(ChatSessionTooLarge):
+        store.create(_invoices(6), {})
+    assert store.get(kept.session_id) is not None
+
+
+def test_delete_releases_bytes():
+    store = ChatSessionStore()
+    session = store.create(_invoices(3), {})
+    assert store.total_bytes == session.size
+    assert store.delete(session.session_id)
+    assert store.total_bytes == 0
+    assert not store.delete(session.session_id)
@@ -0,0 +1,63 @@
+import os
+import time
+
+import pytest
+
+from invoice_qc.isolation import ExtractionFailed, IsolatedPool, extract_documents, get_pool
+from invoice_qc.profiling import profiled
+
+
+def _exit(code: int) -> None:
+    os._exit(code)
+
+
+def _pid() -> int:
+    return os.getpid()
+
+
+def _sleep(seconds: float) -> str:
+    time.sleep(seconds)
+    return "done"
+
+
+@pytest.fixture
+def pool():
+    pool = IsolatedPool(1, timeout=1.0)
+    yield pool
+    pool.shutdown()
+
+
+def test_crash_reports_the_exit_code(pool):
+    with pytest.raises(ExtractionFailed, match="crashed: exit code 3"):
+        pool.submit(_exit, 3).result()
+    # The worker is replaced
+    assert pool.submit(_sleep, 0).result() == "done"
+
+
+def test_timeout(pool):
+    with pytest.raises(ExtractionFailed) as e:
+        pool.submit(_sleep, 5).result()
+    assert e.value.reason == "timeout"
+
+
+def test_profiled_extraction_runs_in_process():
+    with profiled() as session:
+        assert list(extract_documents(_pid, [("a", ()), ("b", ())])) == [os.getpid()] * 2
+    assert session is not None
+
+
+def test_worker_over_the_recycle_mark_is_replaced():
+    with IsolatedPool(1, recycle_rss_bytes=1) as pool:
+        first = pool.submit(_pid).result()
+        second = pool.submit(_pid).result()
+        assert first != second
+    assert pool.stats["recycled"] == 2
+
+
+def test_pools_per_worker_count_are_kept():
+    one = get_pool(1)
+    two = get_pool(2)
+    assert get_pool(1) is one
+    # Asking for another count must not shut down the first pool
+    assert one.submit(_sleep, 0).result() == "done"
+    assert two.submit(_sleep, 0).result() == "done"
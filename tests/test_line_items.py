@@ -0,0 +1,93 @@
+import io
+
+import pdfplumber
+
+from invoice_qc.extractor import (
+    _find_table_bbox,
+    extract_line_items_from_table,
+    extract_text_from_pdf,
+)
+from invoice_qc.pdf_backends import extract_pdf_pages
+
+
+def _pdf(lines):
+    """A one-page PDF with each (x, y, text) drawn in Helvetica."""
+    ops = ["BT /F1 10 Tf"]
+    ops += [f"1 0 0 1 {x} {y} Tm ({text}) Tj" for x, y, text in lines]
+    ops.append("ET")
+    stream = "\n".join(ops).encode("latin-1")
+    objects = [
+        b"<< /Type /Catalog /Pages 2 0 R >>",
+        b"<< /Type /Pages /Kids [3 0 R] /Count 1 >>",
+        b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 595 842] /Contents 4 0 R"
+        b" /Resources << /Font << /F1 5 0 R >> >> >>",
+        b"<< /Length %d >>\nstream\n%s\nendstream" % (len(stream), stream),
+        b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>",
+    ]
+    out = io.BytesIO()
+    out.write(b"%PDF-1.4\n")
+    offsets = []
+    for number, obj in enumerate(objects, 1):
+        offsets.append(out.tell())
+        out.write(b"%d 0 obj\n%s\nendobj\n" % (number, obj))
+    xref = out.tell()
+    out.write(b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1))
+    for offset in offsets:
+        out.write(b"%010d 00000 n \n" % offset)
+    out.write(b"trailer\n<< /Size %d /Root 1 0 R >>\n" % (len(objects) + 1))
+    out.write(b"startxref\n%d\n%%%%EOF\n" % xref)
+    return out.getvalue()
+
+
+def _row(y, *cells):
+    return [(x, y, cell) for x, cell in zip((50, 250, 350, 450), cells)]
+
+
+HEADER = _row(700, "Description", "Qty", "Unit Price", "Amount")
+ITEMS = _row(680, "Widget", "2", "10.00", "20.00") + _row(665, "Gadget", "1", "5.50", "5.50")
+# Amount-like rows above the header and below the totals block
+NOISE_ABOVE = [(50, 800, "INVOICE INV-2024-001")] + _row(760, "Ref 4711", "12", "3.00", "36.00")
+NOISE_BELOW = _row(600, "Bank fee", "1", "9.00", "9.00")
+
+
+def _line_items(pdf):
+    _, pages = extract_pdf_pages(pdf)
+    return extract_line_items_from_table(pdf, pages)
+
+
+def test_region_runs_from_header_to_totals():
+    pdf = _pdf(NOISE_ABOVE + HEADER + ITEMS + [(50, 630, "Subtotal 25.50")] + NOISE_BELOW)
+    with pdfplumber.open(io.BytesIO(pdf)) as doc:
+        page = doc.pages[0]
+        x0, top, x1, bottom = _find_table_bbox(page)
+        # PDF y runs upwards, pdfplumber's top/bottom downwards
+        assert page.height - 760 < top < page.height - 700
+        assert page.height - 665 < bottom < page.height - 630
+        assert x1 == page.width
+
+    items = _line_items(pdf)
+    assert [(i.description, i.quantity, i.unit_price, i.line_total) for i in items] == [
+        ("Widget", 2.0, 10.0, 20.0),
+        ("Gadget", 1.0, 5.5, 5.5),
+    ]
+
+
+def test_region_without_totals_runs_to_page_end():
+    pdf = _pdf(NOISE_ABOVE + HEADER + ITEMS)
+    with pdfplumber.open(io.BytesIO(pdf)) as doc:
+        page = doc.pages[0]
+        assert _find_table_bbox(page)[3] == page.height
+    assert [i.description for i in _line_items(pdf)] == ["Widget", "Gadget"]
+
+
+def test_no_header_row_falls_back_to_text_parser():
+    pdf = _pdf(NOISE_ABOVE + ITEMS)
+    assert _line_items(pdf) is None
+    assert extract_text_from_pdf(pdf, line_items_mode="table", name="x.pdf").line_items is None
+
+
+def test_table_mode_attaches_line_items():
+    pdf = _pdf(NOISE_ABOVE + HEADER + ITEMS + [(50, 630, "Subtotal 25.50")])
+    raw = extract_text_from_pdf(pdf, line_items_mode="table", name="x.pdf")
+    assert [i.description for i in raw.line_items] == ["Widget", "Gadget"]
+    assert extract_text_from_pdf(pdf, line_items_mode="text", name="x.pdf").line_items is None
@@ -0,0 +1,175 @@
+import shutil
+import threading
+from pathlib import Path
+
+import pytest
+
+from invoice_qc import manifest
+from invoice_qc.llm_extract import CORE_FIELDS, LLMCache, LLMFallback, StubModel
+from invoice_qc.records import InvoiceRecord
+
+SAMPLE_PDFS = Path(__file__).resolve().parent.parent / "pdfs"
+
+HIGH = {f: 0.9 for f in CORE_FIELDS}
+LOW = {**HIGH, "seller_name": 0.2}
+
+
+def _record(n: int) -> InvoiceRecord:
+    return InvoiceRecord(
+        invoice_number=f"INV-{n}",
+        invoice_date="2024-03-01",
+        seller_name=None,
+        buyer_name="Regex Buyer",
+        currency="INR",
+        gross_total=118.0,
+    )
+
+
+def _items(n: int, confidence=LOW):
+    return [(f"invoice text {i}", _record(i), confidence) for i in range(n)]
+
+
+class _ConcurrencyModel(StubModel):
+    """StubModel that records how many prompts overlap."""
+
+    def __init__(self, latency: float) -> None:
+        super().__init__(latency=latency)
+        self.active = 0
+        self.max_active = 0
+        self._active_lock = threading.Lock()
+
+    def __call__(self, prompt):
+        with self._active_lock:
+            self.active += 1
+            self.max_active = max(self.max_active, self.active)
+        try:
+            return super().__call__(prompt)
+        finally:
+            with self._active_lock:
+                self.active -= 1
+
+
+def test_confident_documents_skip_the_llm():
+    model = StubModel()
+    fallback = LLMFallback(model, threshold=0.6)
+    items = _items(3, confidence=HIGH)
+
+    records = fallback.refine(items)
+
+    assert model.calls == 0
+    assert records == [record for _, record, _ in items]
+
+
+def test_only_low_confidence_fields_are_replaced():
+    fallback = LLMFallback(StubModel(), threshold=0.6)
+
+    (record,) = fallback.refine(_items(1))
+
+    assert record.seller_name == "Stub Seller"
+    # Confident regex values are kept
+    assert record.invoice_number == "INV-0"
+    assert record.buyer_name == "Regex Buyer"
+    assert record.currency == "INR"
+
+
+def test_documents_are_batched():
+    model = StubModel()
+    fallback = LLMFallback(model, batch_size=2)
+
+    records = fallback.refine(_items(5))
+
+    assert model.calls == 3
+    assert model.documents == 5
+    assert all(r.seller_name == "Stub Seller" for r in records)
+
+
+def test_rerun_is_served_from_the_cache():
+    model = StubModel()
+    fallback = LLMFallback(model, batch_size=2)
+    fallback.refine(_items(4))
+    calls = model.calls
+
+    records = fallback.refine(_items(4))
+
+    assert model.calls == calls
+    assert fallback.stats["cache_hits"] == 4
+    assert all(r.seller_name == "Stub Seller" for r in records)
+
+
+def test_disk_cache_survives_a_new_instance(tmp_path):
+    LLMFallback(StubModel(), cache=LLMCache(directory=str(tmp_path))).refine(_items(2))
+    model = StubModel()
+
+    LLMFallback(model, cache=LLMCache(directory=str(tmp_path))).refine(_items(2))
+
+    assert model.calls == 0
+
+
+def test_concurrency_is_capped_across_callers():
+    model = _ConcurrencyModel(latency=0.05)
+    fallback = LLMFallback(model, batch_size=1, max_concurrency=2)
+
+    def refine(offset):
+        fallback.refine(
+            [(f"caller {offset} text {i}", _record(i), LOW) for i in range(4)]
+        )
+
+    threads = [threading.Thread(target=refine, args=(n,)) for n in range(3)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    assert model.calls == 12
+    assert model.max_active == 2
+
+
+@pytest.mark.parametrize("answer", [None, "", "not json", '{"oops": ', "[]", '[{"id": "other"}]'])
+def test_unusable_answer_keeps_the_regex_record(answer):
+    fallback = LLMFallback(lambda prompt: answer)
+    items = _items(2)
+
+    records, unanswered = fallback.refine_checked(items)
+
+    assert records == [record for _, record, _ in items]
+    assert unanswered == [0, 1]
+    assert fallback.stats["failed"] == 2
+
+
+def test_failed_answers_are_not_cached():
+    fallback = LLMFallback(lambda prompt: "not json")
+    fallback.refine(_items(1))
+    fallback.model = StubModel()
+
+    (record,) = fallback.refine(_items(1))
+
+    assert record.seller_name == "Stub Seller"
+
+
+def test_fenced_json_answer_is_accepted():
+    stub = StubModel()
+    fallback = LLMFallback(lambda prompt: f"```json\n{stub(prompt)}\n```")
+
+    (record,) = fallback.refine(_items(1))
+
+    assert record.seller_name == "Stub Seller"
+
+
+def test_incremental_run_retries_llm_failures(tmp_path, monkeypatch):
+    pdf_dir = tmp_path / "pdfs"
+    pdf_dir.mkdir()
+    shutil.copy(SAMPLE_PDFS / "sample_pdf_1.pdf", pdf_dir)
+    # Threshold above any confidence: every document goes to the LLM
+    fallback = LLMFallback(lambda prompt: None, threshold=1.01)
+    monkeypatch.setattr(manifest, "get_fallback", lambda mode=None: fallback)
+
+    _, stats = manifest.extract_records_incremental(str(pdf_dir), llm_fallback="gemini", workers=1)
+    assert stats.failed == 1
+
+    model = fallback.model = StubModel()
+    _, stats = manifest.extract_records_incremental(str(pdf_dir), llm_fallback="gemini", workers=1)
+    assert (stats.added, stats.unchanged, stats.failed) == (1, 0, 0)
+    assert model.calls == 1
+
+    _, stats = manifest.extract_records_incremental(str(pdf_dir), llm_fallback="gemini", workers=1)
+    assert (stats.added, stats.unchanged) == (0, 1)
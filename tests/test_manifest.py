@@ -0,0 +1,98 @@
+import os
+import shutil
+from pathlib import Path
+
+import pytest
+
+from invoice_qc import manifest
+from invoice_qc.isolation import failed_record
+from invoice_qc.manifest import DEFAULT_MANIFEST_NAME, extract_records_incremental, load_manifest
+
+SAMPLES = Path(__file__).resolve().parent.parent / "pdfs"
+
+
+@pytest.fixture
+def pdf_dir(tmp_path):
+    for i in (1, 2, 3):
+        shutil.copy(SAMPLES / f"sample_pdf_{i}.pdf", tmp_path / f"invoice_{i}.pdf")
+    return tmp_path
+
+
+@pytest.fixture
+def extracted(monkeypatch):
+    """Names passed to the extractor on each run (in-process, so they can be seen)."""
+    calls = []
+
+    def extract_documents(fn, documents, workers=None):
+        documents = list(documents)
+        calls.append(sorted(name for name, _ in documents))
+        return [fn(*args) for _, args in documents]
+
+    monkeypatch.setattr(manifest, "extract_documents", extract_documents)
+    return calls
+
+
+def _run(pdf_dir):
+    return extract_records_incremental(str(pdf_dir))
+
+
+def test_unchanged_files_are_not_extracted_again(pdf_dir, extracted):
+    first, stats = _run(pdf_dir)
+    assert stats.added == 3
+    assert extracted == [["invoice_1.pdf", "invoice_2.pdf", "invoice_3.pdf"]]
+
+    second, stats = _run(pdf_dir)
+    assert (stats.added, stats.changed, stats.unchanged) == (0, 0, 3)
+    assert extracted[1] == []
+    assert second == first
+
+
+def test_touched_file_is_hashed_not_extracted(pdf_dir, extracted):
+    _run(pdf_dir)
+    path = pdf_dir / "invoice_2.pdf"
+    st = path.stat()
+    os.utime(path, ns=(st.st_atime_ns, st.st_mtime_ns + 10**9))
+
+    _, stats = _run(pdf_dir)
+    assert stats.unchanged == 3
+    assert extracted[1] == []
+    assert load_manifest(pdf_dir / DEFAULT_MANIFEST_NAME).files["invoice_2.pdf"].mtime_ns == (
+        st.st_mtime_ns + 10**9
+    )
+
+
+def test_changed_added_and_removed_files(pdf_dir, extracted):
+    _run(pdf_dir)
+    shutil.copy(SAMPLES / "sample_pdf_4.pdf", pdf_dir / "invoice_1.pdf")
+    shutil.copy(SAMPLES / "sample_pdf_5.pdf", pdf_dir / "invoice_5.pdf")
+    (pdf_dir / "invoice_3.pdf").unlink()
+
+    _, stats = _run(pdf_dir)
+    assert (stats.added, stats.changed, stats.unchanged, stats.removed) == (1, 1, 1, 1)
+    assert extracted[1] == ["invoice_1.pdf", "invoice_5.pdf"]
+    files = load_manifest(pdf_dir / DEFAULT_MANIFEST_NAME).files
+    assert sorted(files) == ["invoice_1.pdf", "invoice_2.pdf", "invoice_5.pdf"]
+
+
+def test_changed_settings_extract_everything(pdf_dir, extracted):
+    _run(pdf_dir)
+    _, stats = extract_records_incremental(str(pdf_dir), line_items_mode="table")
+    assert stats.added == 3
+    assert len(extracted[1]) == 3
+
+
+def test_failed_extraction_is_retried(pdf_dir, monkeypatch):
+    def extract_documents(fn, documents, workers=None):
+        for name, args in documents:
+            if name == "invoice_2.pdf":
+                yield failed_record(name, "timeout"), {}, ""
+            else:
+                yield fn(*args)
+
+    monkeypatch.setattr(manifest, "extract_documents", extract_documents)
+    _, stats = _run(pdf_dir)
+    assert stats.failed == 1
+    assert "invoice_2.pdf" not in load_manifest(pdf_dir / DEFAULT_MANIFEST_NAME).files
+
+    _, stats = _run(pdf_dir)
+    assert (stats.added, stats.unchanged) == (1, 2)
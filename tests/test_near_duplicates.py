@@ -0,0 +1,68 @@
+import pytest
+
+from invoice_qc.near_duplicates import (
+    find_near_duplicates,
+    fold_invoice_number,
+    numbers_near_equal,
+)
+from invoice_qc.records import InvoiceRecord, LineItemRecord
+
+pytest.importorskip("numpy")
+
+
+def _invoice(number: str, seller: str = "Acme Ltd", date: str = "2024-03-01") -> InvoiceRecord:
+    return InvoiceRecord(
+        invoice_number=number,
+        invoice_date=date,
+        seller_name=seller,
+        buyer_name="Beta Trading Pvt Ltd",
+        currency="INR",
+        net_total=1000.0,
+        tax_amount=180.0,
+        gross_total=1180.0,
+        line_items=[LineItemRecord("Consulting services March", 1, 1000.0, 1000.0)],
+    )
+
+
+@pytest.mark.parametrize(
+    "a, b, expected",
+    [
+        ("INV-1001", "INV-1001", True),
+        ("INV-1O01", "INV-1001", True),
+        ("INV-1001", "IN-1001", True),
+        ("INV-1001", "INX-1001", True),
+        ("INV-2024-001", "INV-2024-002", False),
+        ("INV-1001", "INV-10001", False),
+        ("INV-1001", "INV-2002", False),
+        ("INV-1001", "", False),
+    ],
+)
+def test_numbers_near_equal(a, b, expected):
+    assert numbers_near_equal(fold_invoice_number(a), fold_invoice_number(b)) is expected
+
+
+def test_sequential_numbers_are_not_duplicates():
+    invoices = [_invoice("INV-2024-001"), _invoice("INV-2024-002")]
+    assert find_near_duplicates(invoices) == {}
+
+
+def test_ocr_noise_in_number_is_a_duplicate():
+    invoices = [_invoice("INV-1001"), _invoice("INV-1O01", seller="ACME Limited")]
+    assert find_near_duplicates(invoices) == {0: ["INV-1O01"], 1: ["INV-1001"]}
+
+
+def test_garbled_letter_with_same_seller_and_date_is_a_duplicate():
+    invoices = [_invoice("INV-1001"), _invoice("IN-1001")]
+    assert find_near_duplicates(invoices) == {0: ["IN-1001"], 1: ["INV-1001"]}
+
+
+def test_recurring_invoice_is_not_a_duplicate():
+    invoices = [_invoice("INV-1001"), _invoice("INV-1002", date="2024-04-01")]
+    assert find_near_duplicates(invoices) == {}
+
+
+def test_failed_extractions_are_not_matched():
+    failed = _invoice("INV-1001")
+    failed.extraction_error = "timeout"
+    invoices = [_invoice("INV-1001", seller="ACME Limited"), failed]
+    assert find_near_duplicates(invoices) == {}
@@ -0,0 +1,141 @@
+import pytest
+
+from invoice_qc.query import InvoiceQueryEngine
+
+INVOICES = [
+    {
+        "invoice_number": "INV-2024-001",
+        "seller_name": "Acme Corp",
+        "buyer_name": "Beta Ltd",
+        "currency": "INR",
+        "invoice_date": "2024-03-01",
+        "net_total": 100.0,
+        "tax_amount": 18.0,
+        "gross_total": 118.0,
+    },
+    {
+        "invoice_number": "INV-2024-002",
+        "seller_name": "Zeta Inc",
+        "buyer_name": "Beta Ltd",
+        "currency": "INR",
+        "invoice_date": "2023-05-02",
+        "net_total": 30.0,
+        "tax_amount": 2.0,
+        "gross_total": 32.0,
+    },
+]
+SUMMARY = {
+    "total_invoices": 2,
+    "valid_invoices": 1,
+    "invalid_invoices": 1,
+    "error_counts": {"business: totals_mismatch": 1},
+}
+
+
+@pytest.fixture
+def engine():
+    return InvoiceQueryEngine(INVOICES, SUMMARY)
+
+
+@pytest.mark.parametrize(
+    "question, expected",
+    [
+        ("How many invoices are there?", "Number of invoices: 2"),
+        ("How many invoices from Acme Corp?", "Number of invoices (seller = Acme Corp): 1"),
+        ("total gross for 'Zeta Inc'", "Total gross_total (seller = Zeta Inc): INR 32.00"),
+        ("how many invoices in 2024", "Number of invoices (year = 2024): 1"),
+        ("how many invoices in March 2024", "Number of invoices (month = 2024-03): 1"),
+        ("total tax in ₹", "Total tax_amount (currency = INR): INR 20.00"),
+    ],
+)
+def test_filtered_answers(engine, question, expected):
+    assert engine.answer(question) == expected
+
+
+@pytest.mark.parametrize(
+    "question, expected",
+    [
+        ("How many invoices are in EUR?", "Number of invoices (currency = EUR): 0"),
+        ("total gross in usd", "Total gross_total (currency = USD): 0.00"),
+        ("how many invoices in 2022", "Number of invoices (year = 2022): 0"),
+        ("how many invoices in 2022-01", "Number of invoices (month = 2022-01): 0"),
+    ],
+)
+def test_filter_missing_from_batch_is_zero(engine, question, expected):
+    assert engine.answer(question) == expected
+
+
+@pytest.mark.parametrize(
+    "question",
+    [
+        "How many invoices from Gamma Ltd?",
+        'total gross for "Gamma Ltd"',
+        "how many invoices from Acme?",
+        "how many invoices in March",
+        "how many invoices in May?",
+        "how many invoices dated 2024-03-01",
+    ],
+)
+def test_unresolved_filter_goes_to_llm(engine, question):
+    assert engine.answer(question) is None
+
+
+@pytest.mark.parametrize(
+    "question, expected",
+    [
+        ("How many invoices are valid?", "1 of 2 invoices are valid."),
+        ("how many invoices are invalid?", "1 of 2 invoices are invalid."),
+        ("how many invoices are not valid?", "1 of 2 invoices are invalid."),
+        ("how many invoices aren't valid?", "1 of 2 invoices are invalid."),
+        ("how many invoices have errors?", "1 of 2 invoices are invalid."),
+        ("how many invoices have no errors?", "1 of 2 invoices are valid."),
+        ("how many invoices without errors?", "1 of 2 invoices are valid."),
+    ],
+)
+def test_validity_counts(engine, question, expected):
+    assert engine.answer(question) == expected
+
+
+@pytest.mark.parametrize(
+    "question",
+    [
+        "How many invoices are overdue?",
+        "How many invoices are above 10,000?",
+        "What is the total amount of the largest invoice?",
+        "total tax of paid invoices",
+        "how many invoices may be duplicates?",
+    ],
+)
+def test_unknown_condition_goes_to_llm(engine, question):
+    assert engine.answer(question) is None
+
+
+def test_filler_words_do_not_block_an_answer(engine):
+    assert engine.answer("What's the total gross amount per seller?") == (
+        "Total gross_total by seller:\n- Acme Corp: INR 118.00\n- Zeta Inc: INR 32.00"
+    )
+    assert engine.answer("How many invoices do we have in EUR?") == (
+        "Number of invoices (currency = EUR): 0"
+    )
+
+
+def test_validity_with_filter_goes_to_llm(engine):
+    # The summary covers the whole batch, not one seller
+    assert engine.answer("how many invoices from Acme Corp are invalid?") is None
+
+
+def test_error_breakdown(engine):
+    expected = "Number of invoices by error_code:\n- business: totals_mismatch: 1"
+    assert engine.answer("how many errors are there?") == expected
+    assert engine.answer("count invoices by error code") == expected
+
+
+def test_group_by_keeps_title_case(engine):
+    assert engine.answer("Total Tax By Seller") == (
+        "Total tax_amount by seller:\n- Acme Corp: INR 18.00\n- Zeta Inc: INR 2.00"
+    )
+
+
+def test_open_ended_and_single_invoice_go_to_llm(engine):
+    assert engine.answer("why is the total so high?") is None
+    assert engine.answer("what is the total of inv-2024-001?") is None
@@ -0,0 +1,116 @@
+import sys
+
+import pytest
+
+from invoice_qc import cli
+from invoice_qc.isolation import failed_record
+from invoice_qc.records import InvoiceRecord
+from invoice_qc.reports import read_report, write_report
+from invoice_qc.sharding import in_shard, merge_reports, parse_shard
+from invoice_qc.validator import DUPLICATE_KEY_ERROR, invoice_key, validate_invoices
+
+
+def _invoice(number: str, seller: str = "Acme Ltd", gross: float = 118.0) -> InvoiceRecord:
+    return InvoiceRecord(
+        invoice_number=number,
+        invoice_date="2024-03-01",
+        seller_name=seller,
+        buyer_name="Beta Trading",
+        currency="INR",
+        net_total=round(gross / 1.18, 2),
+        tax_amount=round(gross - gross / 1.18, 2),
+        gross_total=gross,
+    )
+
+
+def _shard_report(tmp_path, name, invoices, fmt="json"):
+    results, summary = validate_invoices(invoices)
+    path = tmp_path / f"{name}.{fmt}"
+    write_report(str(path), summary, results, fmt, [invoice_key(inv) for inv in invoices])
+    return read_report(str(path))
+
+
+def _merge_matches_single_run(tmp_path, shards, fmt="json"):
+    reports = [_shard_report(tmp_path, f"shard{i}", s, fmt) for i, s in enumerate(shards)]
+    summary, results, _ = merge_reports(reports)
+    single_results, single_summary = validate_invoices([inv for s in shards for inv in s])
+    assert summary == single_summary
+    assert [r.errors for r in results] == [r.errors for r in single_results]
+    return summary, results
+
+
+def test_parse_shard():
+    assert parse_shard("1/4") == (1, 4)
+    for bad in ("4/4", "1", "a/b", "0/0"):
+        with pytest.raises(ValueError):
+            parse_shard(bad)
+
+
+def test_shards_partition_the_files():
+    names = [f"invoice_{i}.pdf" for i in range(200)]
+    owners = [[s for s in range(3) if in_shard(n, (s, 3))] for n in names]
+    assert all(len(o) == 1 for o in owners)
+    assert {o[0] for o in owners} == {0, 1, 2}
+
+
+@pytest.mark.parametrize("fmt", ["json", "jsonl"])
+def test_cross_shard_duplicates_are_flagged(tmp_path, fmt):
+    summary, results = _merge_matches_single_run(
+        tmp_path,
+        [[_invoice("INV-1"), _invoice("INV-2", "Other Co", 50.0)], [_invoice("INV-1")]],
+        fmt,
+    )
+    assert [r.is_valid for r in results] == [False, True, False]
+    assert summary.error_counts[DUPLICATE_KEY_ERROR] == 2
+
+
+def test_failed_extractions_are_not_cross_shard_duplicates(tmp_path):
+    # Same stem in two shards: placeholders share the key (stem, "", "")
+    _merge_matches_single_run(
+        tmp_path,
+        [[failed_record("a/scan.pdf", "timeout")], [failed_record("b/scan.pdf", "crashed")]],
+    )
+
+
+def test_report_without_keys_is_rejected(tmp_path):
+    results, summary = validate_invoices([_invoice("INV-1")])
+    path = tmp_path / "old.json"
+    write_report(str(path), summary, results, "json")
+    with pytest.raises(ValueError, match="invoice_keys"):
+        merge_reports([read_report(str(path))])
+
+
+def test_duplicates_within_a_shard_are_not_counted_twice(tmp_path):
+    summary, results = _merge_matches_single_run(
+        tmp_path,
+        [[_invoice("INV-1"), _invoice("INV-1")], [_invoice("INV-1"), _invoice("INV-3")]],
+    )
+    assert [r.errors.count(DUPLICATE_KEY_ERROR) for r in results] == [1, 1, 1, 0]
+    assert summary.error_counts[DUPLICATE_KEY_ERROR] == 3
+
+
+def test_merge_of_many_shards_keeps_shard_order(tmp_path):
+    shards = [[_invoice(f"INV-{s}-{i}", gross=100.0 + i) for i in range(3)] for s in range(4)]
+    shards[3].append(_invoice("INV-0-1", gross=101.0))
+    summary, results = _merge_matches_single_run(tmp_path, shards)
+    assert [r.invoice_id for r in results] == [inv.invoice_number for s in shards for inv in s]
+    assert (summary.total_invoices, summary.invalid_invoices) == (13, 2)
+
+
+def test_merge_reports_command(tmp_path, monkeypatch):
+    shards = [[_invoice("INV-1")], [_invoice("INV-1"), _invoice("INV-2", gross=50.0)]]
+    for i, invoices in enumerate(shards):
+        _shard_report(tmp_path, f"shard{i}", invoices)
+    inputs = [str(tmp_path / f"shard{i}.json") for i in range(2)]
+    out = tmp_path / "merged.jsonl"
+    monkeypatch.setattr(sys, "argv", ["invoice-qc", "merge-reports", *inputs, "--report", str(out)])
+    with pytest.raises(SystemExit) as exit_info:
+        cli.main()
+    assert exit_info.value.code == 1
+
+    merged = read_report(str(out))
+    assert merged["summary"]["invalid_invoices"] == 2
+    # Keys are kept, so merged reports can be merged again
+    assert len(merged["invoice_keys"]) == 3
+    summary, _, _ = merge_reports([merged])
+    assert summary.invalid_invoices == 2
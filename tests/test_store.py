@@ -0,0 +1,49 @@
+import time
+
+from invoice_qc.records import InvoiceRecord
+from invoice_qc.store import ResultStore, get_store
+from invoice_qc.validator import validate_invoices
+
+
+def _save(store: ResultStore, number: str) -> str:
+    invoices = [
+        InvoiceRecord(
+            invoice_number=number,
+            invoice_date="2024-03-01",
+            seller_name="Acme Ltd",
+            buyer_name="Beta Trading",
+            currency="INR",
+            net_total=100.0,
+            tax_amount=18.0,
+            gross_total=118.0,
+        )
+    ]
+    results, summary = validate_invoices(invoices)
+    return store.save_batch("test", invoices, results, summary)
+
+
+def test_store_is_off_by_default():
+    assert get_store("off") is None
+    assert get_store(None) is None
+
+
+def test_oldest_batches_beyond_max_batches_are_deleted(tmp_path):
+    store = ResultStore(str(tmp_path / "results.sqlite3"), max_batches=2, max_age_days=0)
+    ids = [_save(store, f"INV-{i}") for i in range(4)]
+
+    assert [b["batch_id"] for b in store.batches()] == ids[:1:-1]
+    assert b'"INV-0"' not in store.page("invoice")
+    assert store.page("invoice", batch_id=ids[3]).count(b'"id"') == 1
+
+
+def test_batches_older_than_max_age_are_deleted(tmp_path):
+    store = ResultStore(str(tmp_path / "results.sqlite3"), max_batches=0, max_age_days=1)
+    old = _save(store, "INV-OLD")
+    store._connect().execute(
+        "UPDATE batches SET created_at = ? WHERE batch_id = ?", (time.time() - 2 * 86400, old)
+    )
+
+    new = _save(store, "INV-NEW")
+
+    assert [b["batch_id"] for b in store.batches()] == [new]
+    assert store._connect().execute("SELECT COUNT(*) FROM invoices").fetchone() == (1,)
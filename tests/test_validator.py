@@ -0,0 +1,114 @@
+import asyncio
+import json
+
+from invoice_qc.bulk import validate_ndjson_stream
+from invoice_qc.records import InvoiceRecord
+from invoice_qc.validator import DUPLICATE_KEY_ERROR, StreamingValidator, validate_invoices
+
+
+def _invoice(number: str, seller: str = "Acme Ltd", gross: float = 118.0) -> InvoiceRecord:
+    return InvoiceRecord(
+        invoice_number=number,
+        invoice_date="2024-03-01",
+        due_date="2024-03-31",
+        seller_name=seller,
+        buyer_name="Beta Trading",
+        currency="INR",
+        net_total=round(gross / 1.18, 2),
+        tax_amount=round(gross - gross / 1.18, 2),
+        gross_total=gross,
+    )
+
+
+def test_valid_invoice():
+    results, summary = validate_invoices([_invoice("INV-1")])
+    assert results[0].errors == []
+    assert summary.valid_invoices == 1
+
+
+def test_cross_chunk_duplicate_back_patches_the_first_occurrence():
+    validator = StreamingValidator()
+    first, flagged = validator.validate_chunk(
+        [_invoice("INV-1"), _invoice("INV-2", "Other Co", 50.0)], [1, 2]
+    )
+    assert [r.is_valid for _, r in first] == [True, True]
+    assert flagged == []
+
+    second, flagged = validator.validate_chunk([_invoice("INV-1")], [3])
+    ((line, result),) = second
+    assert (line, result.is_valid, result.errors) == (3, False, [DUPLICATE_KEY_ERROR])
+    # The first occurrence was already reported valid: updated once
+    assert flagged == [(1, "INV-1")]
+
+    _, flagged = validator.validate_chunk([_invoice("INV-1")], [4])
+    assert flagged == []
+
+    summary = validator.summary()
+    assert (summary.total_invoices, summary.valid_invoices, summary.invalid_invoices) == (4, 1, 3)
+    assert summary.error_counts == {DUPLICATE_KEY_ERROR: 3}
+
+
+def test_summary_matches_the_batch_check():
+    invoices = [_invoice("INV-1"), _invoice("INV-2", "Other Co", 50.0), _invoice("INV-1")]
+    validator = StreamingValidator()
+    for i, inv in enumerate(invoices, start=1):
+        validator.validate_chunk([inv], [i])
+    _, batch_summary = validate_invoices(invoices)
+    assert validator.summary() == batch_summary
+
+
+def test_duplicates_beyond_the_window_are_not_detected():
+    validator = StreamingValidator(window=2)
+    validator.validate_chunk([_invoice("INV-1")], [1])
+    validator.validate_chunk([_invoice("INV-2", "Other Co", 50.0)], [2])
+    # Seeing INV-1 again keeps it in the window
+    _, flagged = validator.validate_chunk([_invoice("INV-1")], [3])
+    assert flagged == [(1, "INV-1")]
+    validator.validate_chunk([_invoice("INV-3", "Third Co", 70.0)], [4])
+
+    assert len(validator._first_seen) == 2
+    results, flagged = validator.validate_chunk([_invoice("INV-2", "Other Co", 50.0)], [5])
+    assert flagged == []
+    assert results[0][1].is_valid
+
+
+def _ndjson_body(numbers):
+    rows = [
+        {
+            "invoice_number": number,
+            "invoice_date": "2024-03-01",
+            "due_date": "2024-03-31",
+            "seller_name": "Acme Ltd",
+            "buyer_name": "Beta Trading",
+            "currency": "INR",
+            "net_total": 100.0,
+            "tax_amount": 18.0,
+            "gross_total": 118.0,
+        }
+        for number in numbers
+    ]
+    return "".join(json.dumps(row) + "\n" for row in rows).encode()
+
+
+def _run_ndjson(body, **kwargs):
+    async def stream():
+        yield body
+
+    async def collect():
+        return b"".join([part async for part in validate_ndjson_stream(stream(), **kwargs)])
+
+    return [json.loads(line) for line in asyncio.run(collect()).splitlines()]
+
+
+def test_ndjson_stream_stops_at_the_spool_limit():
+    lines = _run_ndjson(_ndjson_body(["INV-1", "INV-2", "INV-3"]), chunk_lines=1, max_spool_bytes=1)
+    assert [line.get("line") for line in lines[:-1]] == [1]
+    assert "spool limit" in lines[-1]["error"]
+
+
+def test_ndjson_stream_emits_errors_added():
+    lines = _run_ndjson(_ndjson_body(["INV-1", "INV-9", "INV-1"]), chunk_lines=2)
+
+    update = {"line": 1, "invoice_id": "INV-1", "is_valid": False, "errors_added": [DUPLICATE_KEY_ERROR]}
+    assert update in lines
+    assert lines[-1]["summary"]["invalid_invoices"] == 2